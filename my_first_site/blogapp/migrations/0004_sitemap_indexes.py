@@ -0,0 +1,17 @@
+# Generated by Django 4.2 on 2026-10-18 05:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blogapp', '0003_articlerss'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='articlerss',
+            index=models.Index(fields=['published_at', 'id'], name='blogapp_article_pub_id_idx'),
+        ),
+    ]
@@ -21,6 +21,11 @@ class Article(models.Model):
     tags = models.ManyToManyField(Tag)
 
 class ArticleRSS(models.Model):
+    class Meta:
+        indexes = [
+            models.Index(fields=["published_at", "id"], name="blogapp_article_pub_id_idx"),
+        ]
+
     title = models.CharField(max_length=100)
     body = models.TextField(null=True, blank=True)
     published_at = models.DateTimeField(null=True, blank=True)
@@ -1,18 +1,15 @@
-from django.contrib.sitemaps import Sitemap
-from django.urls import reverse
+from my_first_site.sitemap_tools import KeysetSitemap
 
 from .models import ArticleRSS
 
 
-class BlogSitemap(Sitemap):
-    chagefreq = "never"
+class BlogSitemap(KeysetSitemap):
+    changefreq = "never"
     priority = 0.5
+    date_field = "published_at"
 
-    def items(self):
-        return (ArticleRSS.objects
-        .filter(published_at__isnull=False)
-        .order_by("-published_at")
-        )
+    def get_queryset(self):
+        return ArticleRSS.objects.filter(published_at__isnull=False).only("pk", "published_at")
 
     def lastmod(self, obj: ArticleRSS):
         return obj.published_at
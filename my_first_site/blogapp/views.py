@@ -3,6 +3,8 @@ from django.shortcuts import render
 from django.views.generic import ListView, DetailView
 from django.urls import reverse, reverse_lazy
 
+from my_first_site.feed_tools import CachedFeedMixin
+
 from .models import Article, ArticleRSS
 
 
@@ -21,16 +23,17 @@ class ArticlesRSSListView(ListView):
 class ArticleRSSDetailView(DetailView):
     model = ArticleRSS
 
-class LatestArticlesFeed(Feed):
+class LatestArticlesFeed(CachedFeedMixin, Feed):
     title = "Blog articles (latest)"
     description = "Updates on changes and addition blog articles"
     link = reverse_lazy("blogapp:articles")
+    latest_field = "published_at"
 
     def items(self):
         return (
             ArticleRSS.objects
             .filter(published_at__isnull=False)
-            .order_by("-published_at")[:5]
+            .order_by("-published_at", "-pk")[:5]
         )
 
     def item_title(self, item: ArticleRSS):
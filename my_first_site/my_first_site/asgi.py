@@ -3,6 +3,20 @@ ASGI config for my_first_site project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Профиль для ASGI: горячие view на чтение (список и карточка товара,
+выгрузки товаров и заказов пользователя) асинхронные и не держат поток,
+пока ждут базу или кеш, так что один процесс обслуживает много таких
+запросов одновременно. Запуск:
+
+    uvicorn my_first_site.asgi:application --workers 2
+    gunicorn my_first_site.asgi:application -k uvicorn.workers.UvicornWorker -w 2
+
+Синхронные view и middleware Django выполняет в потоке через sync_to_async.
+Под ASGI выключается DebugToolbarMiddleware: она только синхронная и
+заставила бы переключаться в поток на каждом запросе (см. settings).
+CONN_MAX_AGE оставляем 0: соединения async ORM живут в потоках sync_to_async
+и между запросами не переиспользуются.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
 """
@@ -12,5 +26,6 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'my_first_site.settings')
+os.environ.setdefault('DJANGO_ASGI', '1')
 
 application = get_asgi_application()
@@ -0,0 +1,68 @@
+"""
+Кешируемые RSS-ленты с поддержкой условных GET.
+
+Версия ленты - pk записей, которые она показывает, и самая свежая дата
+среди них. Это один запрос по тому же индексу, что и сама лента, без
+просмотра всей таблицы: удаление или снятие записи с публикации дату не
+сдвигает, но меняет набор pk.
+В ETag входит и язык: XML в кеше для каждого языка свой.
+Если клиент уже видел эту версию, отвечаем 304 без построения ленты,
+иначе отдаем XML из кеша, а строим его только при смене версии.
+"""
+from calendar import timegm
+
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from django.utils.translation import get_language
+
+
+class CachedFeedMixin:
+    """
+    Примесь к django.contrib.syndication.views.Feed.
+
+    Наследник возвращает из items() queryset со срезом записей ленты и задает
+    latest_field - по ним считается версия ленты.
+    """
+    latest_field = "created_at"
+    cache_timeout = 60 * 60 * 24
+    cache_key = "feed:{name}:{version}:{language}:{scheme}://{host}"
+
+    def get_latest(self) -> dict:
+        rows = list(self.items().values_list("pk", self.latest_field))
+        return {
+            "latest": max((value for _, value in rows if value is not None), default=None),
+            "pks": [pk for pk, _ in rows],
+        }
+
+    def __call__(self, request, *args, **kwargs):
+        state = self.get_latest()
+        latest = state["latest"]
+        if latest is None:
+            return super().__call__(request, *args, **kwargs)
+
+        version = f"{latest.timestamp():.6f}-{'.'.join(map(str, state['pks']))}"
+        name = type(self).__name__
+        language = get_language()
+        etag = quote_etag(f"{name}-{language}-{version}")
+        last_modified = timegm(latest.utctimetuple())
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            cache_key = self.cache_key.format(
+                name=name,
+                version=version,
+                language=language,
+                scheme=request.scheme,
+                host=request.get_host(),
+            )
+            cached = cache.get(cache_key)
+            if cached is None:
+                feed = super().__call__(request, *args, **kwargs)
+                cached = feed.content, feed["Content-Type"]
+                cache.set(cache_key, cached, self.cache_timeout)
+            content, content_type = cached
+            response = HttpResponse(content, content_type=content_type)
+        response["ETag"] = etag
+        response["Last-Modified"] = http_date(last_modified)
+        return response
@@ -0,0 +1,108 @@
+"""
+Раскладка загруженных файлов по вложенным каталогам ограниченного размера.
+
+Путь строится от uuid владельца файла (media_key), который назначается
+при создании объекта, еще до сохранения и появления pk:
+
+    products/3f/a2/3fa2...c1/preview.jpg
+
+Два уровня по 256 каталогов: в каждом каталоге остается немного записей
+при любом числе объектов. relocate_files переносит старые файлы в эту схему.
+"""
+import os
+import posixpath
+import uuid
+
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils import timezone
+
+
+def sharded_path(prefix: str, key, filename: str) -> str:
+    key = key.hex if isinstance(key, uuid.UUID) else str(key).replace("-", "")
+    return posixpath.join(prefix, key[:2], key[2:4], key, filename)
+
+
+def _move(storage, name: str, target: str) -> str:
+    if hasattr(storage, "path"):
+        try:
+            target = storage.get_available_name(target)
+            new_path = storage.path(target)
+            os.makedirs(os.path.dirname(new_path), exist_ok=True)
+            os.replace(storage.path(name), new_path)
+            return target
+        except NotImplementedError:
+            pass
+    with storage.open(name, "rb") as file:
+        target = storage.save(target, file)
+    storage.delete(name)
+    return target
+
+
+def relocate_files(
+    queryset,
+    field_name: str,
+    batch_size: int = 500,
+    dry_run: bool = False,
+    storage=default_storage,
+    on_moved=None,
+):
+    """
+    Переносит файлы поля field_name в путь, который сейчас дает upload_to.
+
+    Объекты обходятся по pk порциями по batch_size, новые имена сохраняются
+    одним bulk_update на порцию вместе с полями auto_now (как при save()).
+    on_moved(objects) вызывается в той же транзакции: там сбрасываются
+    кеши и версии, которые зависят от путей файлов. Если запись в базу не
+    удалась, файлы порции возвращаются на место. Возвращает (перенесено, пропущено).
+    """
+    if getattr(storage, "deduplicates", False):
+        # хранилище с адресацией по содержимому само раскладывает файлы по хешу
+        return 0, 0
+    field = queryset.model._meta.get_field(field_name)
+    auto_now_fields = [
+        model_field.name for model_field in queryset.model._meta.concrete_fields
+        if getattr(model_field, "auto_now", False)
+    ]
+    moved = skipped = 0
+    last_pk = 0
+    while True:
+        batch = list(queryset.filter(pk__gt=last_pk).exclude(**{field_name: ""}).order_by("pk")[:batch_size])
+        if not batch:
+            return moved, skipped
+        last_pk = batch[-1].pk
+
+        changed = []
+        for obj in batch:
+            name = getattr(obj, field_name).name
+            if not name:
+                skipped += 1
+                continue
+            target = field.generate_filename(obj, posixpath.basename(name))
+            if posixpath.dirname(name) == posixpath.dirname(target) or not storage.exists(name):
+                skipped += 1
+                continue
+            if dry_run:
+                moved += 1
+                continue
+            new_name = _move(storage, name, target)
+            setattr(obj, field_name, new_name)
+            changed.append((obj, name, new_name))
+
+        if not changed:
+            continue
+        objects = [obj for obj, _, _ in changed]
+        now = timezone.now()
+        for obj in objects:
+            for name in auto_now_fields:
+                setattr(obj, name, now)
+        try:
+            with transaction.atomic():
+                queryset.model.objects.bulk_update(objects, [field_name, *auto_now_fields])
+                if on_moved is not None:
+                    on_moved(objects)
+        except Exception:
+            for _, name, new_name in changed:
+                _move(storage, new_name, name)
+            raise
+        moved += len(changed)
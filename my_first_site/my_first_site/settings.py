@@ -13,6 +13,7 @@ import logging
 from os import getenv
 from pathlib import Path
 import logging.config
+import tempfile
 
 from django.urls import reverse_lazy
 
@@ -84,6 +85,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'requestdataapp.middlewares.MetricsMiddleware',
     # 'django.middleware.cache.UpdateCacheMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -93,13 +95,17 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     # 'requestdataapp.middlewares.setup_useragent_on_request_middleware',
-    'requestdataapp.middlewares.CountRequestMiddleware',
     'django.middleware.locale.LocaleMiddleware',
     'django.contrib.admindocs.middleware.XViewMiddleware',
     'debug_toolbar.middleware.DebugToolbarMiddleware',
     # 'django.middleware.cache.FetchFromCacheMiddleware',
 ]
 
+# профиль ASGI (см. asgi.py): синхронная debug toolbar тормозила бы async view
+ASGI = getenv("DJANGO_ASGI", "0") == "1"
+if ASGI:
+    MIDDLEWARE.remove('debug_toolbar.middleware.DebugToolbarMiddleware')
+
 ROOT_URLCONF = 'my_first_site.urls'
 
 TEMPLATES = [
@@ -126,16 +132,40 @@ WSGI_APPLICATION = 'my_first_site.wsgi.application'
 
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        # sqlite3 с BEGIN IMMEDIATE в atomic() (requestdataapp.sqlite_backend)
+        'ENGINE': 'requestdataapp.sqlite_backend',
         'NAME': DATABASE_DIR / 'db.sqlite3',
+        # кеш страниц SQLite живет в соединении; под ASGI соединения не переиспользуются (см. asgi.py)
+        'CONN_MAX_AGE': int(getenv("DJANGO_CONN_MAX_AGE", "0" if ASGI else "600")),
+        'OPTIONS': {
+            'transaction_mode': getenv("DJANGO_SQLITE_TRANSACTION_MODE", "IMMEDIATE"),
+        },
     }
 }
 
+# PRAGMA на каждом новом соединении SQLite (requestdataapp.sqlite)
+SQLITE_TUNING = getenv("DJANGO_SQLITE_TUNING", "1") == "1"
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "busy_timeout": 5000,  # мс
+    "cache_size": -16000,  # отрицательное значение - в КиБ
+    "mmap_size": 256 * 1024 * 1024,
+    "temp_store": "MEMORY",
+}
+# manage.py sqlite_maintenance backup
+SQLITE_BACKUP_DIR = DATABASE_DIR / 'backups'
+
+# shopapp.cache полагается на атомарный cache.add для single-flight блокировок:
+# он атомарен в Redis, Memcached и DatabaseCache, а у FileBasedCache это проверка и
+# запись по отдельности - там два воркера изредка пересчитывают значение оба.
+# Для нескольких воркеров задайте, например, DJANGO_CACHE_BACKEND=
+# django.core.cache.backends.redis.RedisCache и DJANGO_CACHE_LOCATION=redis://...
 CACHES = {
     "default": {
         # "BACKEND": "django.core.cache.backends.dummy.DummyCache",
-        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
-        "LOCATION": "/var/tmp/django_cache",
+        "BACKEND": getenv("DJANGO_CACHE_BACKEND", "django.core.cache.backends.filebased.FileBasedCache"),
+        "LOCATION": getenv("DJANGO_CACHE_LOCATION", "/var/tmp/django_cache"),
     },
 }
 
@@ -194,6 +224,29 @@ STATIC_URL = 'static/'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'uploads'
 
+# загрузки с дедупликацией по содержимому, см. requestdataapp.storage
+CONTENT_ADDRESSED_STORAGE = getenv("DJANGO_CONTENT_ADDRESSED_STORAGE", "0") == "1"
+STORAGES = {
+    "default": {
+        "BACKEND": (
+            "requestdataapp.storage.ContentAddressedStorage"
+            if CONTENT_ADDRESSED_STORAGE
+            else "django.core.files.storage.FileSystemStorage"
+        ),
+    },
+    "staticfiles": {
+        "BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage",
+    },
+}
+
+# заранее сгенерированные карты сайта (manage.py generate_sitemaps)
+SITEMAP_DIR = BASE_DIR / 'sitemaps'
+SITEMAP_DOMAIN = getenv("DJANGO_SITEMAP_DOMAIN", "localhost:8000")
+
+# уменьшенные копии изображений товаров строятся в фоновом пуле потоков (shopapp.images)
+IMAGE_VARIANTS_ASYNC = getenv("DJANGO_IMAGE_VARIANTS_ASYNC", "1") == "1"
+IMAGE_VARIANTS_WORKERS = int(getenv("DJANGO_IMAGE_VARIANTS_WORKERS", "2"))
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
@@ -217,6 +270,20 @@ SPECTACULAR_SETTINGS = {
     'SERVE_INCLUDE_SCHEMA': False,
 }
 
+# метрики запросов (requestdataapp.metrics): снимки воркеров в общем локальном каталоге
+METRICS_DIR = Path(getenv("DJANGO_METRICS_DIR", Path(tempfile.gettempdir()) / "my_first_site-metrics"))
+METRICS_FLUSH_INTERVAL = 5
+# снимок, не обновлявшийся столько секунд, считается снимком умершего воркера
+METRICS_SNAPSHOT_TTL = 60
+# сборщик метрик передает заголовок "Authorization: Bearer <токен>"
+METRICS_TOKEN = getenv("DJANGO_METRICS_TOKEN", "")
+# доступ без токена по адресу - только для отдельного порта без reverse proxy:
+# за локальным прокси все запросы приходят с 127.0.0.1
+METRICS_ALLOWED_IPS = [ip for ip in getenv("DJANGO_METRICS_ALLOWED_IPS", "").split(",") if ip]
+
+# лимиты на SQL-запросы по view (requestdataapp.queries); тесты сверяются с тем же файлом
+QUERY_BUDGETS_FILE = BASE_DIR / "query_budgets.json"
+
 LOGFILE_NAME = BASE_DIR / 'log.txt'
 LOGFILE_SIZE = 1 * 1024 * 1024
 LOGFILE_COUNT = 3
@@ -0,0 +1,214 @@
+"""
+Разбитая на страницы карта сайта (sitemap index) с заранее сгенерированными файлами.
+
+KeysetSitemap обходит записи по индексу (date_field, pk) keyset-пагинацией,
+без OFFSET и без загрузки всей таблицы. Команда generate_sitemaps пишет
+страницы в SITEMAP_DIR по одной, перезаписывая только изменившиеся файлы;
+в продакшене эту папку отдает веб-сервер по тем же URL, что и views ниже.
+Если файлов нет, views строят карту на лету тем же keyset-обходом:
+границы страниц (ключ последней записи каждой страницы) считаются
+по одному короткому запросу на страницу и кешируются на
+SITEMAP_PAGES_TIMEOUT, так что страница N читается одним запросом
+по индексу, без COUNT и OFFSET.
+"""
+import os
+import tempfile
+from dataclasses import dataclass
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.sitemaps import Sitemap
+from django.contrib.sitemaps.views import x_robots_tag
+from django.contrib.sites.shortcuts import get_current_site
+from django.core.cache import cache
+from django.db.models import Q
+from django.http import Http404
+from django.template.loader import render_to_string
+from django.template.response import TemplateResponse
+from django.urls import reverse
+from django.utils import translation
+from django.views.static import serve
+
+SITEMAP_PAGE_SIZE = 5000
+INDEX_FILENAME = "sitemap.xml"
+SECTION_FILENAME = "sitemap-{section}-{page}.xml"
+SITEMAP_PAGES_TIMEOUT = 60 * 10
+PAGES_CACHE_KEY = "sitemap-pages:{section}"
+
+
+class KeysetSitemap(Sitemap):
+    """
+    Sitemap, секции которого идут по убыванию (date_field, pk).
+
+    Наследники определяют get_queryset() с фильтрами (без сортировки).
+    """
+    limit = SITEMAP_PAGE_SIZE
+    date_field = "created_at"
+
+    def get_queryset(self):
+        raise NotImplementedError
+
+    def ordered_queryset(self):
+        return self.get_queryset().order_by(f"-{self.date_field}", "-pk")
+
+    def items(self):
+        return self.ordered_queryset()
+
+    def lastmod(self, item):
+        return getattr(item, self.date_field)
+
+    def after(self, queryset, key):
+        """Записи queryset после ключа (дата, pk) в порядке убывания; key=None - с начала."""
+        if key is None:
+            return queryset
+        date, pk = key
+        return queryset.filter(Q(**{f"{self.date_field}__lt": date}) | Q(**{self.date_field: date, "pk__lt": pk}))
+
+    def iter_pages(self):
+        """Страницы по limit записей; каждая следующая продолжает предыдущую по ключу."""
+        queryset = self.ordered_queryset()
+        page = list(queryset[:self.limit])
+        while page:
+            yield page
+            if len(page) < self.limit:
+                return
+            last = page[-1]
+            page = list(self.after(queryset, (getattr(last, self.date_field), last.pk))[:self.limit])
+
+    def page_boundaries(self) -> list:
+        """
+        Ключи (дата, pk), после которых начинается каждая страница: None для
+        первой, дальше ключ последней записи предыдущей. Читаются только
+        ключи, по одной записи на страницу.
+        """
+        keys = self.ordered_queryset().values_list(self.date_field, "pk")
+        boundaries = []
+        key = None
+        while self.after(keys, key).exists():
+            boundaries.append(key)
+            last = list(self.after(keys, key)[self.limit - 1:self.limit])
+            if not last:
+                break
+            key = tuple(last[0])
+        return boundaries
+
+    def page_items(self, boundaries: list, page: int) -> list:
+        return list(self.after(self.ordered_queryset(), boundaries[page - 1])[:self.limit])
+
+    def page_urls(self, items, domain: str, protocol: str):
+        return [
+            {
+                "item": item,
+                "location": f"{protocol}://{domain}{self.location(item)}",
+                "lastmod": self.lastmod(item),
+                "changefreq": self.changefreq,
+                "priority": str(self.priority) if self.priority is not None else "",
+            }
+            for item in items
+        ]
+
+
+@dataclass
+class SitemapsWriteResult:
+    pages: int = 0
+    written: int = 0
+    unchanged: int = 0
+    removed: int = 0
+
+
+def _write_if_changed(path: Path, content: str) -> bool:
+    data = content.encode("utf-8")
+    if path.exists() and path.read_bytes() == data:
+        return False
+    # пишем во временный файл и подменяем атомарно: веб-сервер не отдаст половину файла
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=".sitemap-", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as file:
+            file.write(data)
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    return True
+
+
+def write_sitemaps(sitemaps: dict, directory, domain: str, protocol: str = "https") -> SitemapsWriteResult:
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    result = SitemapsWriteResult()
+    index = []
+    language = translation.get_supported_language_variant(settings.LANGUAGE_CODE)
+    with translation.override(language):
+        for section, site in sitemaps.items():
+            if callable(site):
+                site = site()
+            pages = 0
+            for pages, items in enumerate(site.iter_pages(), start=1):
+                urls = site.page_urls(items, domain, protocol)
+                content = render_to_string("sitemap.xml", {"urlset": urls})
+                if _write_if_changed(directory / SECTION_FILENAME.format(section=section, page=pages), content):
+                    result.written += 1
+                else:
+                    result.unchanged += 1
+                location = reverse("sitemap-section", kwargs={"section": section, "page": pages})
+                index.append({
+                    "location": f"{protocol}://{domain}{location}",
+                    "last_mod": max((url["lastmod"] for url in urls if url["lastmod"]), default=None),
+                })
+            result.pages += pages
+            for path in directory.glob(SECTION_FILENAME.format(section=section, page="*")):
+                page = path.stem.rsplit("-", 1)[-1]
+                if page.isdigit() and int(page) > pages:
+                    path.unlink()
+                    result.removed += 1
+
+        content = render_to_string("sitemap_index.xml", {"sitemaps": index})
+    if _write_if_changed(directory / INDEX_FILENAME, content):
+        result.written += 1
+    else:
+        result.unchanged += 1
+    return result
+
+
+def _pregenerated(request, filename: str):
+    if (Path(settings.SITEMAP_DIR) / filename).is_file():
+        return serve(request, filename, document_root=settings.SITEMAP_DIR)
+    return None
+
+
+def _boundaries(section: str, site: KeysetSitemap) -> list:
+    return cache.get_or_set(PAGES_CACHE_KEY.format(section=section), site.page_boundaries, SITEMAP_PAGES_TIMEOUT)
+
+
+@x_robots_tag
+def sitemap_index(request, sitemaps):
+    response = _pregenerated(request, INDEX_FILENAME)
+    if response is not None:
+        return response
+    index = []
+    for section, site in sitemaps.items():
+        if callable(site):
+            site = site()
+        for page in range(1, len(_boundaries(section, site)) + 1):
+            location = reverse("sitemap-section", kwargs={"section": section, "page": page})
+            index.append({"location": request.build_absolute_uri(location)})
+    return TemplateResponse(request, "sitemap_index.xml", {"sitemaps": index}, content_type="application/xml")
+
+
+@x_robots_tag
+def sitemap_section(request, sitemaps, section: str, page: int):
+    if section not in sitemaps:
+        raise Http404(f"No sitemap available for section: {section!r}")
+    response = _pregenerated(request, SECTION_FILENAME.format(section=section, page=page))
+    if response is not None:
+        return response
+    site = sitemaps[section]
+    if callable(site):
+        site = site()
+    boundaries = _boundaries(section, site)
+    items = site.page_items(boundaries, page) if 1 <= page <= len(boundaries) else []
+    if not items:
+        raise Http404(f"Page {page} empty")
+    urls = site.page_urls(items, get_current_site(request).domain, request.scheme)
+    return TemplateResponse(request, "sitemap.xml", {"urlset": urls}, content_type="application/xml")
@@ -19,22 +19,26 @@ from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import path, include
 from django.conf.urls.i18n import i18n_patterns
-from django.contrib.sitemaps.views import sitemap
 
 from drf_spectacular.views import SpectacularAPIView, SpectacularRedocView, SpectacularSwaggerView
 
+from requestdataapp.views import metrics_view
+
 from . sitemaps import sitemaps
+from .sitemap_tools import sitemap_index, sitemap_section
 
 urlpatterns = [
     path('admin/doc/', include('django.contrib.admindocs.urls')),
     path('admin/', admin.site.urls),
     path('req/', include('requestdataapp.urls')),
+    path('metrics', metrics_view, name="metrics"),
     path('api/schema/', SpectacularAPIView.as_view(), name="schema"),
     path('api/schema/swagger/', SpectacularSwaggerView.as_view(url_name='schema'), name="swagger"),
     path('api/schema/redoc/', SpectacularRedocView.as_view(url_name='schema'), name="redoc"),
     path('api/', include('myapiapp.urls')),
     path('blog/', include('blogapp.urls')),
-    path('sitemap.xml', sitemap, {"sitemaps": sitemaps}, name="django.contrib.sitemaps.views.sitemap"),
+    path('sitemap.xml', sitemap_index, {"sitemaps": sitemaps}, name="sitemap"),
+    path('sitemap-<slug:section>-<int:page>.xml', sitemap_section, {"sitemaps": sitemaps}, name="sitemap-section"),
 ]
 
 urlpatterns += i18n_patterns(
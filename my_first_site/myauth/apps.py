@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class MyauthConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'myauth'
+
+    def ready(self):
+        from requestdataapp.storage import track_file_references
+        from .models import Profile
+        track_file_references(Profile, "avatar")
@@ -0,0 +1,34 @@
+# Generated by Django 4.2 on 2026-10-18 05:46
+
+from django.db import migrations, models
+import uuid
+
+
+def fill_media_keys(apps, schema_editor):
+    # default=uuid4 в AddField дал бы всем существующим строкам один и тот же ключ
+    Profile = apps.get_model("myauth", "Profile")
+    profiles = list(Profile.objects.only("pk"))
+    for profile in profiles:
+        profile.media_key = uuid.uuid4()
+    Profile.objects.bulk_update(profiles, ["media_key"], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myauth', '0002_profile_avatar'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='media_key',
+            field=models.UUIDField(null=True, editable=False),
+        ),
+        migrations.RunPython(fill_media_keys, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='profile',
+            name='media_key',
+            field=models.UUIDField(default=uuid.uuid4, editable=False),
+        ),
+    ]
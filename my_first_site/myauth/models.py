@@ -1,14 +1,16 @@
+import uuid
+
 from django.contrib.auth.models import User
 from django.db import models
 
+from my_first_site.media_paths import sharded_path
+
 def user_avatar_directory_path(instance: "Profile", filename: str) -> str:
-    return 'users/user_{pk}/avatar/{filename}'.format(
-        pk=instance.user.pk,
-        filename=filename,
-    )
+    return sharded_path("users", instance.media_key, "avatar/" + filename)
 
 class Profile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     bio = models.TextField(max_length=500, blank=True)
     agreement_accepted = models.BooleanField(default=False)
+    media_key = models.UUIDField(default=uuid.uuid4, editable=False)
     avatar = models.ImageField(null=True, blank=True, upload_to=user_avatar_directory_path)
@@ -1,5 +1,10 @@
+from django.contrib.auth.models import User
 from django.test import TestCase
 from django.urls import reverse
+from django.utils import translation
+
+from myauth.models import Profile
+from requestdataapp.queries import QueryBudgetTestMixin
 
 class GetCookieViewTestCase(TestCase):
     def test_get_cookie_view(self):
@@ -14,3 +19,16 @@ class FooBarViewTest(TestCase):
         expected_data = {"spam": "eggs", "foo": "bar"}
         self.assertJSONEqual(response.content, expected_data)
 
+
+
+class UsersListViewTestCase(QueryBudgetTestMixin, TestCase):
+    def setUp(self):
+        self.enterContext(translation.override("en"))
+
+    def test_profiles_loaded_with_users(self):
+        for index in range(5):
+            user = User.objects.create_user(username=f"listed_{index}", password="qwerty")
+            Profile.objects.create(user=user, bio=f"Bio {index}")
+        with self.assertMaxQueries(view="myauth:users-list"):
+            response = self.client.get(reverse("myauth:users-list"))
+        self.assertContains(response, "Bio 4")
@@ -52,7 +52,7 @@ class UserUpdateView(UserPassesTestMixin, UpdateView):
 
 class UsersListView(ListView):
     template_name = 'myauth/users-list.html'
-    model = User
+    queryset = User.objects.select_related("profile")
     context_object_name = "users"
 
 class RegisterView(CreateView):
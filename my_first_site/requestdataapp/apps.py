@@ -1,6 +1,13 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
 
 
 class RequestdataappConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'requestdataapp'
+
+    def ready(self):
+        from .queries import install_recorder_forwarding
+        from .sqlite import configure_connection
+        connection_created.connect(configure_connection, dispatch_uid="requestdataapp.sqlite")
+        connection_created.connect(install_recorder_forwarding, dispatch_uid="requestdataapp.queries")
@@ -0,0 +1,40 @@
+from django.conf import settings
+from django.core.management import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from requestdataapp.sqlite import CHECKPOINT_MODES, backup, checkpoint, pragma_status, wal_size
+
+
+class Command(BaseCommand):
+    help = "Show SQLite settings, checkpoint the WAL or take an online backup"
+
+    def add_arguments(self, parser):
+        parser.add_argument("action", choices=["status", "checkpoint", "backup"])
+        parser.add_argument("--database", default=DEFAULT_DB_ALIAS)
+        parser.add_argument(
+            "--mode", default="TRUNCATE", type=str.upper, choices=CHECKPOINT_MODES,
+            help="wal_checkpoint mode",
+        )
+        parser.add_argument("--output", default=settings.SQLITE_BACKUP_DIR, help="Directory for backups")
+        parser.add_argument("--keep", type=int, default=7, help="Number of latest backups to keep, 0 keeps all")
+
+    def handle(self, *args, **options):
+        connection = connections[options["database"]]
+        if connection.vendor != "sqlite":
+            raise CommandError(f"Database {options['database']!r} is not SQLite")
+
+        if options["action"] == "status":
+            for name, value in pragma_status(connection).items():
+                self.stdout.write(f"{name}: {value}")
+            self.stdout.write(f"wal size: {wal_size(connection)} bytes")
+        elif options["action"] == "checkpoint":
+            busy, log_pages, moved = checkpoint(connection, options["mode"])
+            if log_pages < 0:
+                self.stdout.write("Database is not in WAL mode, nothing to checkpoint")
+            elif busy:
+                self.stdout.write(self.style.WARNING(f"Checkpoint blocked by readers: {moved}/{log_pages} pages"))
+            else:
+                self.stdout.write(self.style.SUCCESS(f"Checkpointed {moved}/{log_pages} pages"))
+        else:
+            path = backup(connection, options["output"], keep=options["keep"])
+            self.stdout.write(self.style.SUCCESS(f"Backup written to {path}"))
@@ -0,0 +1,257 @@
+"""
+Метрики запросов: задержка по view, коды ответов, число и время SQL-запросов.
+
+Каждый поток пишет только в свой буфер (threading.local), без блокировок
+на пути запроса. Фоновый поток процесса раз в METRICS_FLUSH_INTERVAL секунд
+собирает буферы всех потоков и атомарно пишет снимок в
+METRICS_DIR/metrics-<pid>-<отметка запуска>.json: у процесса, получившего pid
+умершего воркера, свой файл, и чужие счетчики он не перезаписывает.
+Эндпоинт /metrics складывает снимки всех воркеров и отдает их в текстовом
+формате Prometheus. Счетчики накопительные с момента запуска процесса.
+
+Снимки, не обновлявшиеся дольше METRICS_SNAPSHOT_TTL, принадлежат умершим
+воркерам: при сборе они переносятся в общий файл retired.json и удаляются.
+Так каталог не растет, а суммарные счетчики не уменьшаются. Перенос и
+чтение идут под блокировкой каталога (flock), чтобы снимок не был учтен
+дважды или пропущен.
+"""
+import atexit
+import fcntl
+import json
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SNAPSHOT_FILENAME = "metrics-{pid}-{start}.json"
+RETIRED_FILENAME = "retired.json"
+LOCK_FILENAME = ".lock"
+SEPARATOR = "\t"
+
+
+class _Buffer:
+    __slots__ = ("requests", "latency", "db")
+
+    def __init__(self):
+        # "view\tmethod\tstatus" -> число ответов
+        self.requests = {}
+        # "view\tmethod" -> [счетчики по LATENCY_BUCKETS..., +Inf, сумма секунд]
+        self.latency = {}
+        # "view\tmethod" -> [число запросов, сумма секунд]
+        self.db = {}
+
+
+_local = threading.local()
+_buffers = []
+_buffers_lock = threading.Lock()
+_flusher_pid = None
+# (pid, отметка запуска): после fork у дочернего процесса своя отметка
+_process_start = None
+
+
+def _buffer() -> _Buffer:
+    buffer = getattr(_local, "buffer", None)
+    if buffer is None:
+        buffer = _local.buffer = _Buffer()
+        # блокировка только при первом запросе потока
+        with _buffers_lock:
+            _buffers.append(buffer)
+        _ensure_flusher()
+    return buffer
+
+
+def record(view: str, method: str, status: int, duration: float, queries: int, query_time: float):
+    buffer = _buffer()
+    key = view + SEPARATOR + method
+    status_key = key + SEPARATOR + str(status)
+    buffer.requests[status_key] = buffer.requests.get(status_key, 0) + 1
+
+    histogram = buffer.latency.get(key)
+    if histogram is None:
+        histogram = buffer.latency[key] = [0] * (len(LATENCY_BUCKETS) + 1) + [0.0]
+    for index, bound in enumerate(LATENCY_BUCKETS):
+        if duration <= bound:
+            break
+    else:
+        index = len(LATENCY_BUCKETS)
+    histogram[index] += 1
+    histogram[-1] += duration
+
+    db = buffer.db.get(key)
+    if db is None:
+        db = buffer.db[key] = [0, 0.0]
+    db[0] += queries
+    db[1] += query_time
+
+
+def _copy(mapping: dict) -> dict:
+    # словарь может пополняться другим потоком прямо во время копирования
+    while True:
+        try:
+            return {key: list(value) if isinstance(value, list) else value for key, value in mapping.items()}
+        except RuntimeError:
+            continue
+
+
+def merge(target: dict, snapshot: dict) -> dict:
+    for section in ("requests", "latency", "db"):
+        merged = target.setdefault(section, {})
+        for key, value in snapshot.get(section, {}).items():
+            if key not in merged:
+                merged[key] = list(value) if isinstance(value, list) else value
+            elif isinstance(value, list):
+                merged[key] = [left + right for left, right in zip(merged[key], value)]
+            else:
+                merged[key] += value
+    return target
+
+
+def process_snapshot() -> dict:
+    with _buffers_lock:
+        buffers = list(_buffers)
+    snapshot = {}
+    for buffer in buffers:
+        merge(snapshot, {
+            "requests": _copy(buffer.requests),
+            "latency": _copy(buffer.latency),
+            "db": _copy(buffer.db),
+        })
+    return snapshot
+
+
+def metrics_dir() -> Path:
+    return Path(settings.METRICS_DIR)
+
+
+def snapshot_path() -> Path:
+    global _process_start
+    pid = os.getpid()
+    if _process_start is None or _process_start[0] != pid:
+        _process_start = (pid, time.time_ns())
+    return metrics_dir() / SNAPSHOT_FILENAME.format(pid=pid, start=_process_start[1])
+
+
+def _write_json(path: Path, data: dict):
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=".metrics-", suffix=".tmp")
+    with os.fdopen(fd, "w") as file:
+        json.dump(data, file)
+    os.replace(tmp_path, path)
+
+
+def flush():
+    path = snapshot_path()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    _write_json(path, process_snapshot())
+
+
+def _flush_loop():
+    while True:
+        time.sleep(settings.METRICS_FLUSH_INTERVAL)
+        try:
+            flush()
+        except OSError:
+            pass
+
+
+def _ensure_flusher():
+    # после fork воркера поток-писатель нужно запустить заново
+    global _flusher_pid
+    pid = os.getpid()
+    if _flusher_pid == pid:
+        return
+    with _buffers_lock:
+        if _flusher_pid == pid:
+            return
+        _flusher_pid = pid
+    threading.Thread(target=_flush_loop, name="metrics-flush", daemon=True).start()
+    atexit.register(flush)
+
+
+def _read_json(path: Path) -> dict:
+    try:
+        return json.loads(path.read_text())
+    except (OSError, ValueError):
+        return {}
+
+
+def collect() -> dict:
+    """
+    Снимки всех воркеров и умерших воркеров (retired.json); для текущего
+    процесса - актуальные буферы, а не файл.
+    """
+    directory = metrics_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    own = snapshot_path()
+    stale_before = time.time() - settings.METRICS_SNAPSHOT_TTL
+    snapshot = process_snapshot()
+    with open(directory / LOCK_FILENAME, "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        retired_path = directory / RETIRED_FILENAME
+        retired = _read_json(retired_path)
+        stale = []
+        for path in directory.glob(SNAPSHOT_FILENAME.format(pid="*", start="*")):
+            if path == own:
+                continue
+            try:
+                is_stale = path.stat().st_mtime < stale_before
+            except OSError:
+                continue
+            data = _read_json(path)
+            if is_stale:
+                merge(retired, data)
+                stale.append(path)
+            else:
+                merge(snapshot, data)
+        if stale:
+            _write_json(retired_path, retired)
+            for path in stale:
+                path.unlink(missing_ok=True)
+    return merge(snapshot, retired)
+
+
+def _labels(**labels) -> str:
+    def escape(value):
+        return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return ",".join(f'{name}="{escape(value)}"' for name, value in labels.items())
+
+
+def render_prometheus(snapshot: dict) -> str:
+    lines = [
+        "# HELP django_http_requests_total Responses by view, method and status.",
+        "# TYPE django_http_requests_total counter",
+    ]
+    for key, count in sorted(snapshot.get("requests", {}).items()):
+        view, method, status = key.split(SEPARATOR)
+        lines.append(f"django_http_requests_total{{{_labels(view=view, method=method, status=status)}}} {count}")
+
+    lines += [
+        "# HELP django_http_request_duration_seconds Request latency by view and method.",
+        "# TYPE django_http_request_duration_seconds histogram",
+    ]
+    for key, histogram in sorted(snapshot.get("latency", {}).items()):
+        view, method = key.split(SEPARATOR)
+        cumulative = 0
+        for bound, count in zip((*LATENCY_BUCKETS, "+Inf"), histogram[:-1]):
+            cumulative += count
+            labels = _labels(view=view, method=method, le=bound)
+            lines.append(f"django_http_request_duration_seconds_bucket{{{labels}}} {cumulative}")
+        labels = _labels(view=view, method=method)
+        lines.append(f"django_http_request_duration_seconds_sum{{{labels}}} {histogram[-1]:.6f}")
+        lines.append(f"django_http_request_duration_seconds_count{{{labels}}} {cumulative}")
+
+    lines += [
+        "# HELP django_db_queries_total SQL queries executed by view and method.",
+        "# TYPE django_db_queries_total counter",
+        "# HELP django_db_query_duration_seconds_total Time spent in SQL by view and method.",
+        "# TYPE django_db_query_duration_seconds_total counter",
+    ]
+    for key, (queries, seconds) in sorted(snapshot.get("db", {}).items()):
+        view, method = key.split(SEPARATOR)
+        labels = _labels(view=view, method=method)
+        lines.append(f"django_db_queries_total{{{labels}}} {queries}")
+        lines.append(f"django_db_query_duration_seconds_total{{{labels}}} {seconds:.6f}")
+    return "\n".join(lines) + "\n"
@@ -1,7 +1,10 @@
 import time
 
-from django.http import HttpRequest
-from django.shortcuts import render
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.http import FileResponse, HttpRequest
+
+from . import metrics
+from .queries import QueryRecorder, check_budget
 
 
 def setup_useragent_on_request_middleware(get_response):
@@ -11,32 +14,98 @@ def setup_useragent_on_request_middleware(get_response):
         return response
     return middleware
 
-class CountRequestMiddleware():
+class _RecordedStream:
+    """
+    Тело потокового ответа, чьи чанки строятся под активным QueryRecorder.
+
+    finish вызывается один раз в close(): WSGI-сервер и ASGI-обработчик Django
+    закрывают ответ после отдачи тела (или при обрыве соединения).
+    """
+    def __init__(self, chunks, recorder, finish):
+        self._chunks = iter(chunks)
+        self._recorder = recorder
+        self._finish = finish
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        with self._recorder.activate():
+            return next(self._chunks)
+
+    def close(self):
+        finish, self._finish = self._finish, None
+        if finish is not None:
+            finish()
+
+
+class _ARecordedStream:
+    """_RecordedStream для асинхронного тела; без __iter__, иначе Django примет его за синхронное."""
+    close = _RecordedStream.close
+
+    def __init__(self, chunks, recorder, finish):
+        self._chunks = aiter(chunks)
+        self._recorder = recorder
+        self._finish = finish
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        with self._recorder.activate():
+            return await anext(self._chunks)
+
+
+class MetricsMiddleware:
+    """
+    Задержка, код ответа и SQL-запросы по каждому view, см. requestdataapp.metrics.
+
+    Превышения лимитов на запросы пишутся в лог, см. requestdataapp.queries.
+    У потоковых ответов (кроме FileResponse) в замер входит и построение тела:
+    запись идет при закрытии ответа. Работает и в синхронной, и в асинхронной
+    цепочке: под ASGI не заставляет Django переключаться в поток ради middleware.
+    """
+    sync_capable = True
+    async_capable = True
+
     def __init__(self, get_response):
         self.get_response = get_response
-        self.requests_count = 0
-        self.responses_count = 0
-        self.exceptions_count = 0
-        self.last_request = {}
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
 
     def __call__(self, request: HttpRequest):
-        # interval = 1
-        # if self.last_request:
-        #     if (time.time() - self.last_request['time']) < interval and self.last_request['ip-address'] == request.META.get('REMOTE_ADDR'):
-        #         return render(request, 'requestdataapp/error-interval.html')
-
-        self.last_request['ip-address'] = request.META.get('REMOTE_ADDR')
-        self.last_request['time'] = time.time()
-
-        self.requests_count += 1
-        print("requests count", self.requests_count)
-        response = self.get_response(request)
-        self.responses_count += 1
-        print("responses count", self.responses_count)
-        return response
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        recorder = QueryRecorder()
+        start = time.perf_counter()
+        with recorder.activate():
+            response = self.get_response(request)
+        return self.finish(request, response, start, recorder)
+
+    async def __acall__(self, request: HttpRequest):
+        recorder = QueryRecorder()
+        start = time.perf_counter()
+        # запросы async ORM идут в потоке sync_to_async через соединение того потока,
+        # recorder доходит до него через контекст, см. requestdataapp.queries
+        with recorder.activate():
+            response = await self.get_response(request)
+        return self.finish(request, response, start, recorder)
 
-    def process_exception(self, request: HttpRequest, exception: Exception):
-        self.exceptions_count += 1
-        print("got", self.exceptions_count, "exceptions so far")
+    def finish(self, request: HttpRequest, response, start: float, recorder: QueryRecorder):
+        def record():
+            self.record(request, response, time.perf_counter() - start, recorder)
+
+        # FileResponse сервер может отдать через wsgi.file_wrapper, мимо streaming_content
+        if not response.streaming or isinstance(response, FileResponse):
+            record()
+            return response
+        stream = _ARecordedStream if response.is_async else _RecordedStream
+        response.streaming_content = stream(response.streaming_content, recorder, record)
+        return response
 
+    def record(self, request: HttpRequest, response, duration: float, recorder: QueryRecorder):
+        match = request.resolver_match
+        view = (match.view_name or match.route) if match else "<unresolved>"
+        metrics.record(view, request.method, response.status_code, duration, recorder.count, recorder.time)
+        check_budget(view, recorder)
 
@@ -1,3 +1,17 @@
 from django.db import models
 
-# Create your models here.
+
+class StoredBlob(models.Model):
+    """
+    Файл в ContentAddressedStorage и число ссылок на него.
+
+    Файл удаляется с диска, когда refcount доходит до нуля.
+    """
+    name = models.CharField(max_length=255, unique=True)
+    sha256 = models.CharField(max_length=64, db_index=True)
+    size = models.PositiveBigIntegerField()
+    refcount = models.PositiveIntegerField(default=1)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self) -> str:
+        return f"StoredBlob(name={self.name!r}, refcount={self.refcount})"
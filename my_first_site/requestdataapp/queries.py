@@ -0,0 +1,153 @@
+"""
+Учет SQL-запросов: число, суммарное время и повторяющиеся запросы.
+
+QueryRecorder подключается через connection.execute_wrapper или, для всего
+запроса, через QueryRecorder.activate(). На пути запроса
+он только считает одинаковые строки SQL; нормализация в отпечатки (без
+литералов и с одним плейсхолдером вместо списка IN) делается один раз в конце,
+по уникальным строкам.
+
+Лимиты задаются в QUERY_BUDGETS_FILE: общие пороги и максимум запросов
+для отдельных view. Превышения пишутся в лог (MetricsMiddleware), а в тестах
+проверяются через QueryBudgetTestMixin.assertMaxQueries.
+"""
+import json
+import logging
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import connections
+
+log = logging.getLogger(__name__)
+
+_IN_LIST = re.compile(r"\bIN \((?:%s|\?)(?:, ?(?:%s|\?))*\)", re.IGNORECASE)
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_SPACES = re.compile(r"\s+")
+
+
+def fingerprint(sql: str) -> str:
+    sql = _LITERALS.sub("?", sql)
+    sql = _IN_LIST.sub("IN (...)", sql)
+    return _SPACES.sub(" ", sql).strip()
+
+
+class QueryRecorder:
+    __slots__ = ("count", "time", "statements")
+
+    def __init__(self):
+        self.count = 0
+        self.time = 0.0
+        self.statements = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.time += time.perf_counter() - start
+            self.statements[sql] += 1
+
+    @contextmanager
+    def record(self, using=None):
+        """Подключает запись ко всем (или перечисленным) соединениям."""
+        with ExitStack() as stack:
+            for alias in using or connections:
+                stack.enter_context(connections[alias].execute_wrapper(self))
+            yield self
+
+    @contextmanager
+    def activate(self):
+        """
+        Записывает запросы текущего контекста на всех соединениях, в том числе
+        из потоков sync_to_async.
+        """
+        token = _active_recorder.set(self)
+        try:
+            yield self
+        finally:
+            _active_recorder.reset(token)
+
+    def fingerprints(self) -> Counter:
+        result = Counter()
+        for sql, count in self.statements.items():
+            result[fingerprint(sql)] += count
+        return result
+
+    def duplicates(self, min_count: int = 2) -> list:
+        return [(sql, count) for sql, count in self.fingerprints().most_common() if count >= min_count]
+
+
+# Соединения в django.db.connections свои у каждого потока, а async ORM и
+# sync_to_async выполняют запросы в другом потоке, чем event loop. Поэтому
+# активный recorder хранится в контексте (sync_to_async копирует его в поток),
+# а на каждое соединение ставится обертка, передающая ему запросы.
+_active_recorder = ContextVar("active_query_recorder", default=None)
+
+
+def _forward_to_active_recorder(execute, sql, params, many, context):
+    recorder = _active_recorder.get()
+    if recorder is None:
+        return execute(sql, params, many, context)
+    return recorder(execute, sql, params, many, context)
+
+
+def install_recorder_forwarding(sender, connection, **kwargs):
+    """Обработчик connection_created: подключает соединение к QueryRecorder.activate()."""
+    if _forward_to_active_recorder not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, _forward_to_active_recorder)
+
+
+@lru_cache(maxsize=None)
+def _load_budgets(path) -> dict:
+    with open(path, encoding="utf-8") as file:
+        return json.load(file)
+
+
+def budgets() -> dict:
+    return _load_budgets(str(settings.QUERY_BUDGETS_FILE))
+
+
+def view_budget(view: str):
+    """Максимум запросов для view из файла лимитов, иначе общий max_queries."""
+    config = budgets()
+    return config.get("views", {}).get(view, config["default"]["max_queries"])
+
+
+def check_budget(view: str, recorder: QueryRecorder) -> list:
+    """Список нарушений лимитов (пустой, если все в норме); нарушения пишутся в лог."""
+    limits = budgets()["default"]
+    problems = []
+    max_queries = view_budget(view)
+    if recorder.count > max_queries:
+        problems.append(f"{recorder.count} queries (budget {max_queries})")
+    if recorder.time > limits["max_time"]:
+        problems.append(f"{recorder.time:.3f}s in SQL (budget {limits['max_time']}s)")
+    if recorder.count > limits["min_queries_for_duplicates"]:
+        duplicates = recorder.duplicates(limits["max_duplicates"] + 1)
+        if duplicates:
+            sql, count = duplicates[0]
+            problems.append(f"query repeated {count} times: {sql[:200]}")
+    if problems:
+        log.warning("Query budget exceeded in %s: %s", view, "; ".join(problems))
+    return problems
+
+
+class QueryBudgetTestMixin:
+    """Примесь к TestCase: assertMaxQueries с отчетом о повторяющихся запросах."""
+
+    @contextmanager
+    def assertMaxQueries(self, max_queries=None, view: str = None, using=None):
+        if max_queries is None:
+            max_queries = view_budget(view)
+        recorder = QueryRecorder()
+        with recorder.record(using):
+            yield recorder
+        if recorder.count > max_queries:
+            report = "\n".join(f"{count} x {sql}" for sql, count in recorder.fingerprints().most_common(10))
+            self.fail(f"{recorder.count} queries executed, {max_queries} allowed ({view or 'block'}):\n{report}")
@@ -0,0 +1,129 @@
+"""
+Режим SQLite для продакшена: WAL, PRAGMA соединений, чекпоинты и онлайн-копии.
+
+На каждом новом соединении (сигнал connection_created) выставляются
+PRAGMA из SQLITE_PRAGMAS:
+- journal_mode=WAL: читатели не блокируют писателя и наоборот, коммит
+  дописывает страницы в журнал вместо перезаписи базы;
+- synchronous=NORMAL: fsync только на чекпоинте; в WAL база при сбое
+  остается целой, при отключении питания теряются последние транзакции;
+- busy_timeout: занятая база ждет освобождения, а не сразу отвечает
+  "database is locked". Ожидание работает, только если транзакция берет
+  блокировку записи сразу: транзакция, которая сначала читает, а потом
+  пишет, получает SQLITE_BUSY без ожидания. Поэтому ENGINE -
+  requestdataapp.sqlite_backend с OPTIONS["transaction_mode"] = "IMMEDIATE":
+  atomic() начинается с BEGIN IMMEDIATE;
+- cache_size, mmap_size, temp_store: больше страниц в памяти соединения,
+  чтение через mmap, временные данные сортировок в памяти.
+PRAGMA выполняются на самом DB-API соединении, мимо execute_wrapper,
+и в учет запросов (requestdataapp.queries) не попадают.
+
+Кеш страниц у каждого соединения свой, поэтому соединения лучше держать
+открытыми (CONN_MAX_AGE). WAL сбрасывается в базу автоматически
+(wal_autocheckpoint), но при постоянных читателях журнал может расти:
+manage.py sqlite_maintenance checkpoint принудительно переносит его в базу
+и обрезает, а backup снимает копию, не останавливая запись.
+"""
+import os
+import re
+import sqlite3
+from pathlib import Path
+
+from django.conf import settings
+from django.utils import timezone
+
+CHECKPOINT_MODES = ("PASSIVE", "FULL", "RESTART", "TRUNCATE")
+STATUS_PRAGMAS = ("journal_mode", "synchronous", "busy_timeout", "cache_size", "mmap_size", "temp_store")
+BACKUP_TIME_FORMAT = "%Y%m%dT%H%M%S%f"
+# ровно то имя, которое дает backup(): чужие <имя>-*.sqlite3 рядом не трогаем
+BACKUP_NAME = r"^{name}-\d{{8}}T\d{{12}}\.sqlite3$"
+
+_PRAGMA_NAME = re.compile(r"^[a-z_]+$")
+
+
+def apply_pragmas(dbapi_connection: sqlite3.Connection, pragmas: dict):
+    for name, value in pragmas.items():
+        if not _PRAGMA_NAME.match(name):
+            raise ValueError(f"Invalid PRAGMA name {name!r}")
+        dbapi_connection.execute(f"PRAGMA {name} = {value}")
+
+
+def configure_connection(sender, connection, **kwargs):
+    """Обработчик connection_created: настраивает только соединения SQLite."""
+    if connection.vendor == "sqlite" and settings.SQLITE_TUNING:
+        apply_pragmas(connection.connection, settings.SQLITE_PRAGMAS)
+
+
+def pragma_status(connection) -> dict:
+    connection.ensure_connection()
+    status = {}
+    for name in STATUS_PRAGMAS:
+        # mmap_size, например, для базы в памяти не возвращает ничего
+        row = connection.connection.execute(f"PRAGMA {name}").fetchone()
+        status[name] = row[0] if row else None
+    return status
+
+
+def wal_size(connection) -> int:
+    path = Path(f"{connection.settings_dict['NAME']}-wal")
+    return path.stat().st_size if path.exists() else 0
+
+
+def checkpoint(connection, mode: str = "TRUNCATE") -> tuple:
+    """
+    Переносит страницы из WAL в базу. Возвращает (busy, страниц в журнале,
+    перенесено страниц); busy=1 значит, что читатели не дали закончить.
+    Для базы не в режиме WAL страницы равны -1.
+    """
+    mode = mode.upper()
+    if mode not in CHECKPOINT_MODES:
+        raise ValueError(f"Unknown checkpoint mode {mode!r}, expected one of {', '.join(CHECKPOINT_MODES)}")
+    connection.ensure_connection()
+    return tuple(connection.connection.execute(f"PRAGMA wal_checkpoint({mode})").fetchone())
+
+
+def backup(connection, directory: Path, keep: int = None) -> Path:
+    """
+    Онлайн-копия базы через sqlite3 backup API в directory/<имя>-<время>.sqlite3.
+
+    Копия снимается за один шаг под транзакцией чтения: в WAL это не мешает
+    писателям и дает согласованный снимок (при пошаговом копировании
+    SQLite начинал бы заново после каждой записи в базу). Копия
+    проверяется quick_check, переводится в обычный журнал и только потом
+    получает итоговое имя; при ошибке недописанный .partial удаляется.
+    keep - сколько последних копий оставить, считаются только файлы с
+    именем в формате backup().
+    """
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    name = Path(connection.settings_dict["NAME"]).stem or connection.alias
+    target = directory / f"{name}-{timezone.now():{BACKUP_TIME_FORMAT}}.sqlite3"
+    partial = target.with_suffix(".partial")
+
+    # свое соединение: у соединения Django может быть открыта транзакция текущего запроса
+    params = connection.get_connection_params()
+    source = sqlite3.connect(params["database"], uri=params.get("uri", False))
+    try:
+        copy = sqlite3.connect(partial)
+        try:
+            source.backup(copy)
+            # копия - самостоятельный файл, без -wal рядом
+            copy.execute("PRAGMA journal_mode = DELETE")
+            result = copy.execute("PRAGMA quick_check").fetchone()[0]
+        finally:
+            copy.close()
+        if result != "ok":
+            raise sqlite3.DatabaseError(f"Backup failed quick_check: {result}")
+        os.replace(partial, target)
+    except BaseException:
+        partial.unlink(missing_ok=True)
+        raise
+    finally:
+        source.close()
+
+    if keep:
+        backup_name = re.compile(BACKUP_NAME.format(name=re.escape(name)))
+        backups = sorted(path for path in directory.iterdir() if backup_name.match(path.name))
+        for old in backups[:-keep]:
+            old.unlink()
+    return target
@@ -0,0 +1,34 @@
+"""
+Бэкенд SQLite с режимом начала транзакций, как OPTIONS["transaction_mode"] в Django 5.1.
+
+Django 4.2 открывает транзакцию atomic() обычным BEGIN (DEFERRED): блокировку
+записи она берет только на первой записи. Если транзакция сначала читает, а
+потом пишет (get_or_create, select_for_update), а другой писатель успел
+закоммитить, SQLite сразу отвечает "database is locked" - busy_timeout
+здесь не помогает. С "IMMEDIATE" блокировка записи берется на BEGIN, и
+конкурирующие транзакции ждут друг друга в пределах busy_timeout.
+"""
+from django.core.exceptions import ImproperlyConfigured
+from django.db.backends.sqlite3 import base
+
+TRANSACTION_MODES = ("DEFERRED", "IMMEDIATE", "EXCLUSIVE")
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    @property
+    def transaction_mode(self) -> str:
+        mode = self.settings_dict["OPTIONS"].get("transaction_mode") or "DEFERRED"
+        if mode.upper() not in TRANSACTION_MODES:
+            raise ImproperlyConfigured(
+                f"transaction_mode must be one of {', '.join(TRANSACTION_MODES)}, got {mode!r}"
+            )
+        return mode.upper()
+
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        # не параметр sqlite3.connect()
+        params.pop("transaction_mode", None)
+        return params
+
+    def _start_transaction_under_autocommit(self):
+        self.cursor().execute(f"BEGIN {self.transaction_mode}")
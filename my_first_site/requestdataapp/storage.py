@@ -0,0 +1,176 @@
+"""
+Хранилище загрузок с адресацией по содержимому.
+
+Файл пишется на диск по чанкам, одновременно считается его sha256;
+итоговое имя - cas/ab/cd/<sha256><расширение>. Если такой файл уже есть,
+временная копия удаляется, а у StoredBlob увеличивается счетчик ссылок:
+повторная загрузка тех же байтов не занимает место на диске.
+delete() уменьшает счетчик; строка с нулем ссылок и сам файл удаляются
+после коммита одной транзакцией, если за это время ссылку никто не взял.
+track_file_references отпускает ссылки при удалении и замене файлов моделей.
+
+Включается настройкой DJANGO_CONTENT_ADDRESSED_STORAGE=1 (см. STORAGES).
+"""
+import hashlib
+import os
+import posixpath
+import tempfile
+
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save, pre_save
+
+CAS_PREFIX = "cas"
+CAS_TMP_DIR = ".cas-tmp"
+
+
+def content_name(digest: str, filename: str) -> str:
+    ext = posixpath.splitext(filename)[1].lower()
+    return posixpath.join(CAS_PREFIX, digest[:2], digest[2:4], digest + ext)
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    # одинаковые файлы хранятся один раз, каждое save() - отдельная ссылка
+    deduplicates = True
+
+    def get_available_name(self, name, max_length=None):
+        # имя определяется содержимым в _save, занятость имени не важна
+        return name
+
+    def _save(self, name, content):
+        tmp_dir = os.path.join(self.location, CAS_TMP_DIR)
+        os.makedirs(tmp_dir, exist_ok=True)
+        digest = hashlib.sha256()
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(dir=tmp_dir)
+        try:
+            with os.fdopen(fd, "wb") as file:
+                if hasattr(content, "seek"):
+                    content.seek(0)
+                for chunk in content.chunks():
+                    if isinstance(chunk, str):
+                        chunk = chunk.encode()
+                    digest.update(chunk)
+                    file.write(chunk)
+                    size += len(chunk)
+            name = content_name(digest.hexdigest(), name)
+            if self._add_reference(name, digest.hexdigest(), size):
+                os.unlink(tmp_path)
+            else:
+                path = self.path(name)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                if self.directory_permissions_mode is not None:
+                    os.chmod(os.path.dirname(path), self.directory_permissions_mode)
+                file_move_safe(tmp_path, path, allow_overwrite=True)
+                if self.file_permissions_mode is not None:
+                    os.chmod(path, self.file_permissions_mode)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        return name
+
+    def _add_reference(self, name: str, sha256: str, size: int) -> bool:
+        """Увеличивает счетчик ссылок. True - файл уже был на диске."""
+        from .models import StoredBlob
+
+        if StoredBlob.objects.filter(name=name).update(refcount=F("refcount") + 1):
+            return self.exists(name)
+        try:
+            with transaction.atomic():
+                StoredBlob.objects.create(name=name, sha256=sha256, size=size)
+        except IntegrityError:
+            # тот же файл параллельно сохранил другой запрос
+            StoredBlob.objects.filter(name=name).update(refcount=F("refcount") + 1)
+            return self.exists(name)
+        # строки не было, но файл мог остаться (например, после сбоя) - перезапишем
+        return False
+
+    def delete(self, name):
+        from .models import StoredBlob
+
+        if not name.startswith(CAS_PREFIX + "/"):
+            return super().delete(name)
+        if not StoredBlob.objects.filter(name=name, refcount__gt=0).update(refcount=F("refcount") - 1):
+            if not StoredBlob.objects.filter(name=name).exists():
+                # файл без строки учета (например, после сбоя)
+                super().delete(name)
+            return
+        transaction.on_commit(lambda: self._remove_unreferenced(name))
+
+    def _remove_unreferenced(self, name: str):
+        from .models import StoredBlob
+
+        # удаление строки держит блокировку до конца транзакции: параллельный
+        # _add_reference либо успел поднять счетчик и строка не удалится, либо
+        # дождется коммита, не найдет строку и запишет файл заново
+        with transaction.atomic():
+            if StoredBlob.objects.filter(name=name, refcount=0).delete()[0]:
+                super().delete(name)
+
+
+def _counts_references(field) -> bool:
+    return getattr(field.storage, "deduplicates", False)
+
+
+def release_on_commit(storage, names):
+    """Отпускает ссылки на файлы после коммита текущей транзакции."""
+    names = {name for name in names if name}
+
+    def release():
+        for name in names:
+            storage.delete(name)
+
+    if names:
+        transaction.on_commit(release)
+
+
+def track_file_references(model, *field_names: str, extra_names=None):
+    """
+    Отпускает ссылки на файлы полей field_names в хранилищах с подсчетом ссылок.
+
+    Ссылка отпускается после коммита, когда объект удален, а также когда файл
+    заменен или очищен. extra_names(instance) - дополнительные файлы того же
+    хранилища (например, копии изображения), они отпускаются при удалении.
+    """
+    fields = [model._meta.get_field(name) for name in field_names]
+    dispatch_uid = f"requestdataapp.storage:{model._meta.label}"
+
+    def remember_files(sender, instance, raw=False, update_fields=None, **kwargs):
+        tracked = [
+            field for field in fields
+            if _counts_references(field) and (update_fields is None or field.name in update_fields)
+        ]
+        if raw or instance.pk is None or not tracked:
+            return
+        row = model._default_manager.filter(pk=instance.pk).values(*(field.attname for field in tracked)).first()
+        if row is None:
+            return
+        instance._stored_files = {
+            # новый файл еще не записан: save() возьмет на него отдельную ссылку,
+            # даже если содержимое (и имя) то же, что у прежнего
+            field.attname: (row[field.attname], not getattr(instance, field.attname)._committed)
+            for field in tracked
+        }
+
+    def release_replaced_files(sender, instance, raw=False, **kwargs):
+        stored = instance.__dict__.pop("_stored_files", {})
+        for field in fields:
+            if field.attname not in stored:
+                continue
+            previous, uploaded = stored[field.attname]
+            if previous and (uploaded or previous != getattr(instance, field.attname).name):
+                release_on_commit(field.storage, [previous])
+
+    def release_deleted_files(sender, instance, **kwargs):
+        for field in fields:
+            if _counts_references(field):
+                release_on_commit(field.storage, [getattr(instance, field.attname).name])
+        if extra_names is not None and _counts_references(fields[0]):
+            release_on_commit(fields[0].storage, extra_names(instance))
+
+    pre_save.connect(remember_files, sender=model, weak=False, dispatch_uid=dispatch_uid)
+    post_save.connect(release_replaced_files, sender=model, weak=False, dispatch_uid=dispatch_uid)
+    post_delete.connect(release_deleted_files, sender=model, weak=False, dispatch_uid=dispatch_uid)
@@ -1,3 +1,306 @@
-from django.test import TestCase
+import asyncio
+import json
+import os
+import sqlite3
+import time
+from io import StringIO
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.db import connection, connections, transaction
+from django.http import StreamingHttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import translation
+
+from . import metrics
+from .middlewares import MetricsMiddleware
+from .models import StoredBlob
+from .queries import QueryRecorder, check_budget, fingerprint
+from .sqlite_backend.base import DatabaseWrapper
+from .sqlite import backup, checkpoint, pragma_status, wal_size
+from .storage import ContentAddressedStorage
+
+
+class ContentAddressedStorageTestCase(TestCase):
+    def setUp(self):
+        directory = TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.root = Path(directory.name)
+        self.storage = ContentAddressedStorage(location=directory.name, base_url="/media/")
+
+    def test_same_content_is_stored_once(self):
+        first = self.storage.save("products/a.JPG", ContentFile(b"same bytes"))
+        second = self.storage.save("users/b.jpg", ContentFile(b"same bytes"))
+        self.assertEqual(first, second)
+        self.assertRegex(first, r"^cas/[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}\.jpg$")
+        self.assertEqual(StoredBlob.objects.get(name=first).refcount, 2)
+        self.assertEqual(len([path for path in self.root.rglob("*") if path.is_file()]), 1)
+
+    def test_file_removed_with_last_reference(self):
+        name = self.storage.save("a.txt", ContentFile(b"shared"))
+        self.storage.save("b.txt", ContentFile(b"shared"))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.storage.delete(name)
+        self.assertTrue(self.storage.exists(name))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.storage.delete(name)
+        self.assertFalse(self.storage.exists(name))
+        self.assertFalse(StoredBlob.objects.filter(name=name).exists())
+
+    def test_reference_taken_before_commit_keeps_file(self):
+        name = self.storage.save("a.txt", ContentFile(b"shared"))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.storage.delete(name)
+            self.assertTrue(self.storage.exists(name))
+            # до коммита удаления тот же файл сохранил другой запрос
+            self.storage.save("b.txt", ContentFile(b"shared"))
+        self.assertTrue(self.storage.exists(name))
+        self.assertEqual(StoredBlob.objects.get(name=name).refcount, 1)
+
+    def test_different_content_gets_different_names(self):
+        first = self.storage.save("a.txt", ContentFile(b"one"))
+        second = self.storage.save("a.txt", ContentFile(b"two"))
+        self.assertNotEqual(first, second)
+        self.assertEqual(self.storage.open(second).read(), b"two")
+
+
+class MetricsTestCase(TestCase):
+    def setUp(self):
+        directory = TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.enterContext(override_settings(METRICS_DIR=directory.name))
+        self.directory = Path(directory.name)
+        # свои буферы на тест, без фонового потока-писателя
+        self.enterContext(mock.patch.object(metrics, "_buffers", []))
+        self.enterContext(mock.patch.object(metrics, "_local", metrics.threading.local()))
+        self.enterContext(mock.patch.object(metrics, "_ensure_flusher"))
+
+    def test_request_is_recorded(self):
+        self.client.get("/req/get/?a=1&b=2")
+        snapshot = metrics.process_snapshot()
+        self.assertEqual(snapshot["requests"]["requestdataapp:get-view\tGET\t200"], 1)
+        histogram = snapshot["latency"]["requestdataapp:get-view\tGET"]
+        self.assertEqual(sum(histogram[:-1]), 1)
+
+    @override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "metrics"}})
+    def test_async_view_queries_are_recorded(self):
+        with translation.override("en"):
+            url = reverse("shopapp:products_export")
+        # цепочка middleware профиля ASGI и свой event loop, как у ASGI-сервера: без
+        # внешнего async_to_sync запросы async ORM идут в потоке sync_to_async
+        # через его собственное соединение
+        middleware = [name for name in settings.MIDDLEWARE if not name.startswith("debug_toolbar.")]
+        with override_settings(MIDDLEWARE=middleware):
+            response = asyncio.run(self.async_client.get(url))
+        self.assertEqual(response.status_code, 200)
+        queries, query_time = metrics.process_snapshot()["db"]["shopapp:products_export\tGET"]
+        self.assertGreater(queries, 0)
+
+    def test_streaming_body_queries_are_recorded(self):
+        staff = User.objects.create_user(username="metrics_exporter", password="qwerty", is_staff=True)
+        self.client.force_login(staff)
+        with translation.override("en"):
+            url = reverse("shopapp:orders_export")
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+            self.assertNotIn("shopapp:orders_export\tGET", metrics.process_snapshot().get("db", {}))
+            # тест-клиент закрывает ответ, дочитав тело
+            b"".join(response.streaming_content)
+        recorded, query_time = metrics.process_snapshot()["db"]["shopapp:orders_export\tGET"]
+        self.assertEqual(recorded, len(queries))
+
+    def test_async_streaming_body_queries_are_recorded(self):
+        async def body():
+            yield str(await User.objects.acount()).encode()
+
+        async def view(request):
+            return StreamingHttpResponse(body())
+
+        middleware = MetricsMiddleware(view)
+        response = asyncio.run(middleware(RequestFactory().get("/stream/")))
+        self.assertTrue(response.is_async)
+
+        async def consume():
+            return b"".join([chunk async for chunk in response])
+
+        self.assertEqual(asyncio.run(consume()), b"0")
+        response.close()
+        self.assertEqual(metrics.process_snapshot()["db"]["<unresolved>\tGET"][0], 1)
+
+    def test_endpoint_merges_worker_snapshots(self):
+        metrics.record("shopapp:products_list", "GET", 200, 0.02, 3, 0.001)
+        other = {
+            "requests": {"shopapp:products_list\tGET\t200": 4},
+            "latency": {"shopapp:products_list\tGET": [0, 0, 4] + [0] * 9 + [0.08]},
+            "db": {"shopapp:products_list\tGET": [12, 0.004]},
+        }
+        (self.directory / "metrics-999999-1.json").write_text(json.dumps(other))
+        staff = User.objects.create_user(username="metrics_staff", password="qwerty", is_staff=True)
+        self.client.force_login(staff)
+
+        response = self.client.get("/metrics")
+        self.assertEqual(response.status_code, 200)
+        body = response.content.decode()
+        self.assertIn('django_http_requests_total{view="shopapp:products_list",method="GET",status="200"} 5', body)
+        self.assertIn('django_db_queries_total{view="shopapp:products_list",method="GET"} 15', body)
+        self.assertIn(
+            'django_http_request_duration_seconds_bucket{view="shopapp:products_list",method="GET",le="0.025"} 5',
+            body,
+        )
+
+    def test_endpoint_requires_staff_or_allowed_ip(self):
+        response = self.client.get("/metrics", REMOTE_ADDR="10.1.2.3")
+        self.assertEqual(response.status_code, 403)
+        with override_settings(METRICS_ALLOWED_IPS=["127.0.0.1"]):
+            self.assertEqual(self.client.get("/metrics").status_code, 200)
+            # через локальный прокси адрес тот же, но доступ без токена закрыт
+            response = self.client.get("/metrics", HTTP_X_FORWARDED_FOR="203.0.113.5")
+            self.assertEqual(response.status_code, 403)
+
+    @override_settings(METRICS_TOKEN="secret", METRICS_ALLOWED_IPS=["127.0.0.1"])
+    def test_endpoint_token(self):
+        self.assertEqual(self.client.get("/metrics").status_code, 403)
+        self.assertEqual(self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer wrong").status_code, 403)
+        self.assertEqual(self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer secret").status_code, 200)
+
+    def test_dead_worker_snapshots_are_retired(self):
+        def write(name, count, age=0):
+            path = self.directory / name
+            path.write_text(json.dumps({"requests": {"shopapp:products_list\tGET\t200": count}}))
+            os.utime(path, (time.time() - age, time.time() - age))
+
+        # тот же pid после перезапуска: старый файл не перезаписывается
+        write("metrics-100-1.json", 5, age=3600)
+        write("metrics-100-2.json", 2)
+        self.assertEqual(metrics.collect()["requests"]["shopapp:products_list\tGET\t200"], 7)
+        self.assertFalse((self.directory / "metrics-100-1.json").exists())
+        self.assertTrue((self.directory / "retired.json").exists())
+        self.assertEqual(metrics.collect()["requests"]["shopapp:products_list\tGET\t200"], 7)
+
+
+class QueryRecorderTestCase(TestCase):
+    def test_fingerprint_collapses_literals_and_in_lists(self):
+        self.assertEqual(
+            fingerprint("SELECT * FROM t WHERE id IN (%s, %s, %s)  AND name = 'x'"),
+            fingerprint("SELECT * FROM t WHERE id IN (%s) AND name = 'y'"),
+        )
+
+    def test_duplicates_are_reported(self):
+        recorder = QueryRecorder()
+        with recorder.record():
+            for user_id in range(12):
+                User.objects.filter(pk=user_id).exists()
+        self.assertEqual(recorder.count, 12)
+        self.assertEqual(recorder.duplicates()[0][1], 12)
+        with self.assertLogs("requestdataapp.queries", "WARNING") as logs:
+            problems = check_budget("some-view", recorder)
+        self.assertEqual(len(problems), 1)
+        self.assertIn("repeated 12 times", logs.output[0])
+
+
+class SQLiteTuningTestCase(TestCase):
+    def setUp(self):
+        directory = TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.root = Path(directory.name)
+
+    def file_connection(self):
+        # отдельное соединение с файловой базой: тестовая база живет в памяти, WAL там недоступен
+        wrapper = DatabaseWrapper({**connection.settings_dict, "NAME": self.root / "tuned.sqlite3"}, alias="tuned")
+        wrapper.ensure_connection()
+        self.addCleanup(wrapper.close)
+        return wrapper
+
+    def test_pragmas_applied_on_connect(self):
+        status = pragma_status(self.file_connection())
+        self.assertEqual(status["journal_mode"], "wal")
+        self.assertEqual(status["synchronous"], 1)
+        self.assertEqual(status["busy_timeout"], 5000)
+        self.assertEqual(status["temp_store"], 2)
+
+    def test_atomic_takes_write_lock_at_begin(self):
+        wrapper = self.file_connection()
+        with wrapper.cursor() as cursor:
+            cursor.execute("CREATE TABLE item (name TEXT)")
+        other = sqlite3.connect(self.root / "tuned.sqlite3", timeout=0)
+        self.addCleanup(other.close)
+        connections[wrapper.alias] = wrapper
+        self.addCleanup(connections.__delitem__, wrapper.alias)
+        with transaction.atomic(using=wrapper.alias):
+            # транзакция еще ничего не записала, но писатель уже один
+            wrapper.cursor().execute("SELECT count(*) FROM item").fetchone()
+            with self.assertRaisesMessage(sqlite3.OperationalError, "database is locked"):
+                other.execute("BEGIN IMMEDIATE")
+
+    @override_settings(SQLITE_TUNING=False)
+    def test_tuning_can_be_disabled(self):
+        self.assertEqual(pragma_status(self.file_connection())["journal_mode"], "delete")
+
+    def test_checkpoint_truncates_wal(self):
+        wrapper = self.file_connection()
+        with wrapper.cursor() as cursor:
+            cursor.execute("CREATE TABLE item (name TEXT)")
+            cursor.executemany("INSERT INTO item VALUES (%s)", [("x" * 100,)] * 200)
+        self.assertGreater(wal_size(wrapper), 0)
+        busy, log_pages, moved = checkpoint(wrapper, "truncate")
+        self.assertEqual((busy, log_pages, moved), (0, 0, 0))
+        self.assertEqual(wal_size(wrapper), 0)
+        with self.assertRaises(ValueError):
+            checkpoint(wrapper, "everything")
+
+    def test_backup_keeps_latest_copies(self):
+        wrapper = self.file_connection()
+        with wrapper.cursor() as cursor:
+            cursor.execute("CREATE TABLE item (name TEXT)")
+            cursor.execute("INSERT INTO item VALUES ('lamp')")
+        directory = self.root / "backups"
+        for _ in range(3):
+            last = backup(wrapper, directory, keep=2)
+        self.assertEqual(sorted(directory.iterdir())[-1], last)
+        self.assertEqual(len(list(directory.iterdir())), 2)
+        copy = sqlite3.connect(last)
+        self.addCleanup(copy.close)
+        self.assertEqual(copy.execute("PRAGMA journal_mode").fetchone()[0], "delete")
+        self.assertEqual(copy.execute("SELECT name FROM item").fetchall(), [("lamp",)])
+
+    def test_backup_retention_ignores_other_files(self):
+        wrapper = self.file_connection()
+        directory = self.root / "backups"
+        directory.mkdir()
+        unrelated = directory / "tuned-manual.sqlite3"
+        unrelated.touch()
+        for _ in range(2):
+            last = backup(wrapper, directory, keep=1)
+        self.assertEqual(sorted(directory.iterdir()), [last, unrelated])
+
+    def test_failed_backup_removes_partial(self):
+        wrapper = self.file_connection()
+        directory = self.root / "backups"
+        connect = sqlite3.connect
+
+        def connect_with_failing_source(database, **kwargs):
+            db = connect(database, **kwargs)
+            # первое соединение в backup() - источник, копирование с него обрывается
+            if patched.call_count > 1:
+                return db
+            source = mock.Mock(wraps=db)
+            source.backup.side_effect = sqlite3.OperationalError("disk I/O error")
+            return source
+
+        with mock.patch.object(sqlite3, "connect", side_effect=connect_with_failing_source) as patched:
+            with self.assertRaises(sqlite3.OperationalError):
+                backup(wrapper, directory)
+        self.assertEqual(list(directory.iterdir()), [])
+
+    def test_command_status(self):
+        stdout = StringIO()
+        call_command("sqlite_maintenance", "status", stdout=stdout)
+        self.assertIn(f"busy_timeout: {settings.SQLITE_PRAGMAS['busy_timeout']}", stdout.getvalue())
+        self.assertIn("wal size: 0 bytes", stdout.getvalue())
@@ -1,6 +1,11 @@
-from django.core.files.storage import FileSystemStorage
+from django.conf import settings
+from django.core.exceptions import PermissionDenied
+from django.core.files.storage import default_storage
 from django.http import HttpRequest, HttpResponse
 from django.shortcuts import render
+from django.utils.crypto import constant_time_compare
+
+from . import metrics
 
 from .forms import UserBioForm, UploadFileForm
 def process_get_view(request: HttpRequest) -> HttpResponse:
@@ -26,7 +31,7 @@ def handle_file_upload(request: HttpRequest) -> HttpResponse:
         if form.is_valid():
             # myfile = request.FILES["myfile"]
             myfile = form.cleaned_data["file"]
-            fs = FileSystemStorage()
+            fs = default_storage
             if myfile.size > 1048576:
                 return render(request, "requestdataapp/error-message.html")
             filename = fs.save(myfile.name, myfile)
@@ -38,3 +43,24 @@ def handle_file_upload(request: HttpRequest) -> HttpResponse:
     }
     return render(request, "requestdataapp/file-upload.html", context=context)
 
+
+def metrics_allowed(request: HttpRequest) -> bool:
+    if request.user.is_staff:
+        return True
+    if settings.METRICS_TOKEN:
+        return constant_time_compare(request.headers.get("Authorization", ""), f"Bearer {settings.METRICS_TOKEN}")
+    # без токена - только прямые запросы с разрешенных адресов: запрос через прокси несет X-Forwarded-For
+    return (
+        "HTTP_X_FORWARDED_FOR" not in request.META
+        and request.META.get("REMOTE_ADDR") in settings.METRICS_ALLOWED_IPS
+    )
+
+
+def metrics_view(request: HttpRequest) -> HttpResponse:
+    """Метрики всех воркеров в текстовом формате Prometheus."""
+    if not metrics_allowed(request):
+        raise PermissionDenied
+    return HttpResponse(
+        metrics.render_prometheus(metrics.collect()),
+        content_type="text/plain; version=0.0.4; charset=utf-8",
+    )
@@ -1,33 +1,82 @@
-from io import TextIOWrapper
-from csv import DictReader
-
-from django.contrib import admin
+from django.contrib import admin, messages
 from django.db.models import QuerySet
 from django.http import HttpRequest, HttpResponse
 from django.shortcuts import render, redirect
 from django.urls import path
+from django.utils import timezone
 
-from .common import save_csv_products
+from .cache import PRODUCTS_GENERATION, bump_generation_on_commit, user_orders_generation
+from .common import ImportSummary, save_csv_orders, save_csv_products
 from .models import Product, Order, ProductImage
+from .totals import refresh_totals_for_orders
 from .admin_mixins import ExportAsCSVMixin
 from .forms import CSVImportForm
 
-class OrderInline(admin.TabularInline):
+class CachedChoicesInlineMixin:
+    """
+    Варианты выбора для внешних ключей строк inline читаются один раз на запрос.
+
+    Без этого каждая строка формсета заново выполняет запрос к своему queryset.
+    """
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        field = super().formfield_for_foreignkey(db_field, request, **kwargs)
+        if field is not None and request is not None:
+            cache = request.__dict__.setdefault("_inline_choices", {})
+            key = (db_field.model._meta.label, db_field.name)
+            if key not in cache:
+                cache[key] = list(field.choices)
+            field.choices = cache[key]
+        return field
+
+class OrderProductsAdminMixin:
+    """
+    Inline связей заказ-товар сохраняет строки through-модели напрямую,
+    m2m_changed при этом не отправляется: итоги заказов и кеш выгрузок
+    заказов обновляются здесь.
+    """
+    def save_formset(self, request, form, formset, change):
+        super().save_formset(request, form, formset, change)
+        if formset.model is not Order.products.through:
+            return
+        order_ids = set()
+        for inline_form in formset.forms:
+            if inline_form.has_changed():
+                # initial - заказ, из которого строку перенесли
+                order_ids.update((inline_form.instance.order_id, inline_form.initial.get("order")))
+        order_ids.discard(None)
+        if not order_ids:
+            return
+        refresh_totals_for_orders(order_ids)
+        user_ids = set(Order.objects.filter(pk__in=order_ids).values_list("user_id", flat=True))
+        bump_generation_on_commit(*(user_orders_generation(user_id) for user_id in user_ids))
+
+class OrderInline(CachedChoicesInlineMixin, admin.TabularInline):
     model = Product.orders.through
 
 class ProductInline(admin.StackedInline):
     model = ProductImage
 
+def message_import_summary(modeladmin: admin.ModelAdmin, request: HttpRequest, summary: ImportSummary):
+    for error in summary.errors:
+        modeladmin.message_user(request, f"Line {error['line']}: {error['error']}", level=messages.WARNING)
+    modeladmin.message_user(
+        request,
+        f"Data from CSV was imported: {summary.imported} of {summary.rows} rows, {summary.errors_total} errors",
+        level=messages.SUCCESS if summary.ok else messages.WARNING,
+    )
+
 @admin.action(description="Archive products")
 def mark_archived(modeladmin: admin.ModelAdmin, request: HttpRequest, queryset: QuerySet):
-    queryset.update(archived=True)
+    queryset.update(archived=True, updated_at=timezone.now())
+    bump_generation_on_commit(PRODUCTS_GENERATION)
 
 @admin.action(description="Unarchive products")
 def mark_unarchived(modeladmin: admin.ModelAdmin, request: HttpRequest, queryset: QuerySet):
-    queryset.update(archived=False)
+    queryset.update(archived=False, updated_at=timezone.now())
+    bump_generation_on_commit(PRODUCTS_GENERATION)
 
 @admin.register(Product)
-class ProductAdmin(admin.ModelAdmin, ExportAsCSVMixin):
+class ProductAdmin(OrderProductsAdminMixin, admin.ModelAdmin, ExportAsCSVMixin):
     change_list_template = "shopapp/products_changelist.html"
     actions = [
         mark_archived, mark_unarchived, "export_csv",
@@ -75,11 +124,12 @@ class ProductAdmin(admin.ModelAdmin, ExportAsCSVMixin):
             }
             return render(request, "admin/csv_form.html", context, status=400)
 
-        save_csv_products(
+        summary = save_csv_products(
             file = form.files["csv_file"].file,
             encoding=request.encoding,
+            created_by=request.user,
         )
-        self.message_user(request, "Data from CSV was imported")
+        message_import_summary(self, request, summary)
         return redirect("..")
 
     def get_urls(self):
@@ -96,16 +146,18 @@ class ProductAdmin(admin.ModelAdmin, ExportAsCSVMixin):
 
 # admin.site.register(Product, ProductAdmin)
 
-class ProductInline(admin.TabularInline):
+class ProductInline(CachedChoicesInlineMixin, admin.TabularInline):
     model = Order.products.through
 
 @admin.register(Order)
-class OrderAdmin(admin.ModelAdmin):
+class OrderAdmin(OrderProductsAdminMixin, admin.ModelAdmin):
     change_list_template = "shopapp/orders_changelist.html"
     inlines = [
         ProductInline
     ]
-    list_display = "delivery_address", "promocode", "created_at", "user_verbose"
+    list_display = "delivery_address", "promocode", "created_at", "user_verbose", "total_amount", "products_count"
+    list_filter = "created_at",
+    readonly_fields = "total_amount", "products_count"
 
     def get_queryset(self, request):
         return Order.objects.select_related("user").prefetch_related("products")
@@ -127,22 +179,11 @@ class OrderAdmin(admin.ModelAdmin):
             }
             return render(request, "admin/csv_form.html", context, status=400)
 
-        csv_file = TextIOWrapper(
-            form.files["csv_file"].file,
+        summary = save_csv_orders(
+            file=form.files["csv_file"].file,
             encoding=request.encoding,
         )
-        reader = DictReader(csv_file)
-
-        orders = [
-            Order(**row)
-            for row in reader
-        ]
-        Order.objects.bulk_create(orders)
-        products = Product.objects.only("id").all()
-        for order in orders:
-            for product in products:
-                order.products.add(product)
-        self.message_user(request, "Data from CSV was imported")
+        message_import_summary(self, request, summary)
         return redirect("..")
 
     def get_urls(self):
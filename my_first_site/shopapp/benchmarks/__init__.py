@@ -0,0 +1,9 @@
+"""
+Замеры производительности ключевых view магазина и импорта CSV.
+
+Запуск: python manage.py benchmark --scale 1000 --output bench.json --baseline old.json
+"""
+from .dataset import seed_dataset
+from .runner import Scenario, compare, default_scenarios, run_benchmarks
+
+__all__ = ["Scenario", "compare", "default_scenarios", "run_benchmarks", "seed_dataset"]
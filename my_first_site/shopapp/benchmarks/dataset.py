@@ -0,0 +1,40 @@
+"""
+Набор данных для замеров: пользователи, товары и заказы заданного масштаба.
+
+Данные строит shopapp.seeding и зависят только от scale и seed, поэтому
+результаты разных запусков сравнимы между собой.
+"""
+from django.contrib.auth.models import User
+from django.db.models import Count
+
+from .. import seeding
+from ..models import Order
+
+BENCH_USERNAME = "benchmark_admin"
+
+
+def seed_dataset(scale: int, seed: int = 42) -> dict:
+    """
+    scale - число товаров и заказов; покупателей в 50 раз меньше.
+
+    Возвращает сводку с числом объектов, id администратора (от него идут
+    запросы) и id самого активного покупателя (для выгрузки его заказов).
+    """
+    admin = User.objects.create_user(
+        username=BENCH_USERNAME, password="bench", is_staff=True, is_superuser=True,
+    )
+    result = seeding.seed(seeding.SeedPlan(
+        users=max(1, scale // 50), products=scale, orders=scale, seed=seed, prefix="bench",
+    ))
+    customer = (
+        Order.objects.values("user_id").annotate(orders=Count("pk")).order_by("-orders", "user_id").first()
+    )
+    return {
+        "users": result.users,
+        "products": result.products,
+        "images": result.images,
+        "orders": result.orders,
+        "links": result.links,
+        "user_id": admin.pk,
+        "customer_id": customer["user_id"] if customer else admin.pk,
+    }
@@ -0,0 +1,234 @@
+"""
+Прогон сценариев и сравнение результатов с эталоном.
+
+Каждый сценарий выполняется warmup раз без замеров, затем iterations раз
+с замером времени и числа SQL-запросов, и еще один раз под tracemalloc
+для пикового потребления памяти (tracemalloc заметно замедляет код,
+поэтому в замеры времени он не попадает).
+"""
+import math
+import platform
+import time
+import tracemalloc
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from io import BytesIO
+from urllib.parse import urlencode
+from wsgiref.util import setup_testing_defaults
+
+import django
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.signals import request_finished, request_started
+from django.db import close_old_connections
+from django.test import Client
+from django.urls import reverse
+from django.utils import timezone, translation
+
+from requestdataapp.queries import QueryRecorder
+from ..common import save_csv_products
+from ..models import Product
+
+CSV_IMPORT_ROWS = 1000
+
+
+@dataclass
+class Scenario:
+    """HTTP GET к view (view, kwargs, params) или вызов функции call."""
+    name: str
+    view: str = ""
+    kwargs: dict = field(default_factory=dict)
+    params: dict = field(default_factory=dict)
+    call: object = None
+
+    def path(self) -> str:
+        return reverse(self.view, kwargs=self.kwargs)
+
+
+def default_scenarios(user_id: int, customer_id: int = None) -> list:
+    product_id = Product.objects.filter(archived=False).order_by("pk").values_list("pk", flat=True).first()
+    return [
+        Scenario("products_list", "shopapp:products_list"),
+        Scenario("product_details", "shopapp:product_details", kwargs={"pk": product_id}),
+        Scenario("products_api", "shopapp:product-list"),
+        Scenario("products_api_cursor", "shopapp:product-list", params={"pagination": "cursor", "ordering": "price"}),
+        Scenario("products_export", "shopapp:products_export"),
+        Scenario("orders_export", "shopapp:orders_export"),
+        Scenario("orders_export_ndjson", "shopapp:orders_export", params={"format": "ndjson"}),
+        Scenario("user_orders_export", "shopapp:users_orders_export", kwargs={"user_id": customer_id or user_id}),
+        Scenario("csv_import", call=csv_import_call(User.objects.get(pk=user_id))),
+    ]
+
+
+def csv_import_call(created_by: User, rows: int = CSV_IMPORT_ROWS):
+    """Импорт CSV с обновлением существующих товаров: повторные прогоны дают ту же работу."""
+    lines = ["id,name,price,discount"]
+    for pk, name, price, discount in Product.objects.order_by("pk").values_list("pk", "name", "price", "discount")[:rows]:
+        lines.append(f"{pk},{name},{price},{discount}")
+    data = "\n".join(lines).encode()
+
+    def call():
+        summary = save_csv_products(BytesIO(data), "utf-8", created_by=created_by)
+        return 200 if summary.ok else 500
+    return call
+
+
+class ClientRunner:
+    """Запросы через django.test.Client: полный стек middleware без сети."""
+    name = "client"
+
+    def __init__(self, user: User):
+        self.client = Client()
+        self.client.force_login(user)
+
+    def __call__(self, path: str, params: dict) -> int:
+        response = self.client.get(path, params)
+        if response.streaming:
+            for _ in response.streaming_content:
+                pass
+        return response.status_code
+
+
+class WSGIRunner:
+    """Запросы напрямую в WSGIHandler, как их передает WSGI-сервер."""
+    name = "wsgi"
+
+    def __init__(self, user: User):
+        self.application = WSGIHandler()
+        client = Client()
+        client.force_login(user)
+        self.cookie = f"{settings.SESSION_COOKIE_NAME}={client.cookies[settings.SESSION_COOKIE_NAME].value}"
+
+    def __call__(self, path: str, params: dict) -> int:
+        environ = {
+            "REQUEST_METHOD": "GET",
+            "PATH_INFO": path,
+            "QUERY_STRING": urlencode(params),
+            "HTTP_HOST": "testserver",
+            "HTTP_COOKIE": self.cookie,
+        }
+        setup_testing_defaults(environ)
+        status = []
+        result = self.application(environ, lambda code, headers, exc_info=None: status.append(code))
+        try:
+            for _ in result:
+                pass
+        finally:
+            if hasattr(result, "close"):
+                result.close()
+        return int(status[0].split()[0])
+
+
+RUNNERS = {runner.name: runner for runner in (ClientRunner, WSGIRunner)}
+
+
+@contextmanager
+def keep_connections():
+    """
+    Не закрывать соединение с базой после каждого запроса (как Client в тестах).
+
+    Тестовая база SQLite живет в памяти и пропадает вместе с последним соединением.
+    """
+    request_started.disconnect(close_old_connections)
+    request_finished.disconnect(close_old_connections)
+    try:
+        yield
+    finally:
+        request_started.connect(close_old_connections)
+        request_finished.connect(close_old_connections)
+
+
+def percentile(values, pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+
+def measure(call, iterations: int, warmup: int) -> dict:
+    errors = 0
+    for _ in range(warmup):
+        call()
+    timings = []
+    queries = []
+    for _ in range(iterations):
+        recorder = QueryRecorder()
+        with recorder.record():
+            start = time.perf_counter()
+            status = call()
+            timings.append(time.perf_counter() - start)
+        queries.append(recorder.count)
+        errors += status >= 400
+    tracemalloc.start()
+    try:
+        call()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {
+        "iterations": iterations,
+        "errors": errors,
+        "mean_ms": round(sum(timings) / len(timings) * 1000, 3),
+        "p50_ms": round(percentile(timings, 50) * 1000, 3),
+        "p95_ms": round(percentile(timings, 95) * 1000, 3),
+        "p99_ms": round(percentile(timings, 99) * 1000, 3),
+        "queries": max(queries),
+        "peak_memory_kb": round(peak / 1024, 1),
+    }
+
+
+def run_benchmarks(scenarios, runners, user: User, iterations: int = 30, warmup: int = 3, meta: dict = None) -> dict:
+    """
+    Результат: {"meta": {...}, "results": {сценарий: {раннер: метрики}}}.
+
+    Сценарии-функции (call) не зависят от раннера и пишутся под ключом "call".
+    """
+    results = {}
+    with keep_connections(), translation.override(settings.LANGUAGES[0][0]):
+        instances = [RUNNERS[name](user) for name in runners]
+        for scenario in scenarios:
+            if scenario.call is not None:
+                results[scenario.name] = {"call": measure(scenario.call, iterations, warmup)}
+                continue
+            path = scenario.path()
+            results[scenario.name] = {
+                runner.name: measure(lambda: runner(path, scenario.params), iterations, warmup)
+                for runner in instances
+            }
+    return {
+        "meta": {
+            **(meta or {}),
+            "iterations": iterations,
+            "warmup": warmup,
+            "python": platform.python_version(),
+            "django": django.get_version(),
+            "created_at": timezone.now().isoformat(),
+        },
+        "results": results,
+    }
+
+
+def compare(current: dict, baseline: dict, threshold: float = 0.2) -> list:
+    """
+    Регрессии относительно baseline: p95 выросло больше чем на threshold
+    (доля) или выросло число запросов. Ответы с ошибками (4xx/5xx) - регрессия
+    всегда, даже без эталона: такой view быстр и дешев, но сломан.
+    Остальные проверки для сценариев без эталона пропускаются.
+    """
+    for key in ("scale", "seed"):
+        if current["meta"].get(key) != baseline["meta"].get(key):
+            raise ValueError(
+                f"Baseline {key} is {baseline['meta'].get(key)}, current run uses {current['meta'].get(key)}"
+            )
+    regressions = []
+    for scenario, runners in current["results"].items():
+        for runner, stats in runners.items():
+            if stats.get("errors"):
+                regressions.append(f"{scenario}/{runner}: {stats['errors']} error responses")
+            base = baseline["results"].get(scenario, {}).get(runner)
+            if base is None:
+                continue
+            if stats["p95_ms"] > base["p95_ms"] * (1 + threshold):
+                regressions.append(f"{scenario}/{runner}: p95 {base['p95_ms']}ms -> {stats['p95_ms']}ms")
+            if stats["queries"] > base["queries"]:
+                regressions.append(f"{scenario}/{runner}: queries {base['queries']} -> {stats['queries']}")
+    return regressions
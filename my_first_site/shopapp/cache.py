@@ -0,0 +1,297 @@
+"""
+Кеширование с инвалидацией по поколениям.
+
+Для каждой группы данных (например, товаров) в кеше хранится счетчик поколения.
+Номер поколения входит в ключ кеша страниц, поэтому любое изменение данных
+(bump_generation) делает старые записи недостижимыми без очистки всего кеша.
+
+Поколение не увеличивается через incr, а заменяется новым значением: у
+FileBasedCache incr - это чтение и запись по отдельности. Блокировки
+get_or_compute берутся через cache.add с уникальным токеном и снимаются,
+только если токен еще свой. Строгий single-flight требует атомарного add
+(Redis, Memcached, DatabaseCache, см. CACHES в settings); с файловым кешем
+гонка сводится к редкому повторному пересчету.
+"""
+import asyncio
+import hashlib
+import time
+import uuid
+from functools import wraps
+
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse
+from django.views.decorators.cache import cache_page
+
+PRODUCTS_GENERATION = "products"
+USER_ORDERS_GENERATION = "orders:user:{user_id}"
+
+GENERATION_KEY = "shopapp:generation:{name}"
+LOCK_KEY = "{key}:lock"
+
+
+def _new_generation() -> int:
+    # новое значение не должно совпасть со старыми, даже если счетчик вытеснили из кеша
+    return time.time_ns()
+
+
+def get_generation(name: str) -> int:
+    key = GENERATION_KEY.format(name=name)
+    generation = cache.get(key)
+    if generation is None:
+        cache.add(key, _new_generation(), None)
+        generation = cache.get(key)
+    return generation
+
+
+async def aget_generation(name: str) -> int:
+    key = GENERATION_KEY.format(name=name)
+    generation = await cache.aget(key)
+    if generation is None:
+        await cache.aadd(key, _new_generation(), None)
+        generation = await cache.aget(key)
+    return generation
+
+
+def bump_generation(*names: str):
+    generation = _new_generation()
+    cache.set_many({GENERATION_KEY.format(name=name): generation for name in names}, None)
+
+
+def user_orders_generation(user_id) -> str:
+    return USER_ORDERS_GENERATION.format(user_id=user_id)
+
+
+def bump_generation_on_commit(*names: str):
+    """Сдвигает поколение после коммита, чтобы в кеш не попали незакоммиченные данные."""
+    transaction.on_commit(lambda: bump_generation(*names))
+
+
+def generation_cache_page(timeout: int, *generations: str, key_prefix: str = "shopapp"):
+    """
+    Аналог cache_page, у которого в префикс ключа входят текущие поколения данных.
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            prefix = "{}:{}".format(
+                key_prefix,
+                ".".join(str(get_generation(name)) for name in generations),
+            )
+            return cache_page(timeout, key_prefix=prefix)(view_func)(request, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _acquire_lock(lock_key: str, timeout: int):
+    """Токен захваченной блокировки или None, если ее держит другой воркер."""
+    token = uuid.uuid4().hex
+    # повторное чтение отсекает проигравшего в гонке неатомарного add
+    if cache.add(lock_key, token, timeout) and cache.get(lock_key) == token:
+        return token
+    return None
+
+
+def _release_lock(lock_key: str, token: str):
+    # блокировка могла истечь и достаться другому воркеру - ее не трогаем
+    if cache.get(lock_key) == token:
+        cache.delete(lock_key)
+
+
+async def _aacquire_lock(lock_key: str, timeout: int):
+    token = uuid.uuid4().hex
+    if await cache.aadd(lock_key, token, timeout) and await cache.aget(lock_key) == token:
+        return token
+    return None
+
+
+async def _arelease_lock(lock_key: str, token: str):
+    if await cache.aget(lock_key) == token:
+        await cache.adelete(lock_key)
+
+
+def get_or_compute(
+    key: str,
+    compute,
+    soft_ttl: int,
+    hard_ttl: int,
+    lock_timeout: int = 30,
+    wait_timeout: float = 10,
+    poll_interval: float = 0.05,
+):
+    """
+    Кеш с stale-while-revalidate и single-flight пересчетом.
+
+    Значение считается свежим soft_ttl секунд и хранится hard_ttl секунд.
+    После soft_ttl пересчитывает только тот воркер, который захватил блокировку
+    (cache.add), остальные отдают устаревшее значение. Если значения нет совсем,
+    остальные воркеры ждут результата до wait_timeout, а не идут в базу все сразу.
+    Пересчет дольше lock_timeout чужую блокировку не снимает.
+    """
+    lock_key = LOCK_KEY.format(key=key)
+
+    def refresh(token):
+        try:
+            value = compute()
+            cache.set(key, (value, time.time() + soft_ttl), hard_ttl)
+            return value
+        finally:
+            _release_lock(lock_key, token)
+
+    entry = cache.get(key)
+    if entry is not None:
+        value, fresh_until = entry
+        if time.time() < fresh_until:
+            return value
+        token = _acquire_lock(lock_key, lock_timeout)
+        return refresh(token) if token else value
+
+    token = _acquire_lock(lock_key, lock_timeout)
+    if token:
+        return refresh(token)
+
+    deadline = time.time() + wait_timeout
+    while time.time() < deadline:
+        time.sleep(poll_interval)
+        entry = cache.get(key)
+        if entry is not None:
+            return entry[0]
+    # пересчитывающий воркер завис или упал - не оставляем запрос без ответа
+    return compute()
+
+
+async def aget_or_compute(
+    key: str,
+    compute,
+    soft_ttl: int,
+    hard_ttl: int,
+    lock_timeout: int = 30,
+    wait_timeout: float = 10,
+    poll_interval: float = 0.05,
+):
+    """Вариант get_or_compute для async view: compute - корутинная функция, ожидание не блокирует цикл событий."""
+    lock_key = LOCK_KEY.format(key=key)
+
+    async def refresh(token):
+        try:
+            value = await compute()
+            await cache.aset(key, (value, time.time() + soft_ttl), hard_ttl)
+            return value
+        finally:
+            await _arelease_lock(lock_key, token)
+
+    entry = await cache.aget(key)
+    if entry is not None:
+        value, fresh_until = entry
+        if time.time() < fresh_until:
+            return value
+        token = await _aacquire_lock(lock_key, lock_timeout)
+        return await refresh(token) if token else value
+
+    token = await _aacquire_lock(lock_key, lock_timeout)
+    if token:
+        return await refresh(token)
+
+    deadline = time.time() + wait_timeout
+    while time.time() < deadline:
+        await asyncio.sleep(poll_interval)
+        entry = await cache.aget(key)
+        if entry is not None:
+            return entry[0]
+    return await compute()
+
+
+class _UncacheableResponse(Exception):
+    pass
+
+
+def _cached_response(response):
+    """Тело и заголовки ответа для кеша; None, если ответ кешировать нельзя."""
+    if response.status_code != 200 or response.streaming:
+        return None
+    return response.content, list(response.items())
+
+
+def _restore_response(entry: tuple) -> HttpResponse:
+    content, headers = entry
+    response = HttpResponse(content)
+    for name, value in headers:
+        response[name] = value
+    return response
+
+
+def swr_cache_page(soft_ttl: int, hard_ttl: int, *generations: str, key_prefix: str = "shopapp:swr"):
+    """
+    Декоратор view: кеширует готовое тело ответа через get_or_compute.
+
+    В ключ входят полный URL, язык запроса и текущие поколения данных.
+    Кешируются только успешные ответы на GET/HEAD, вместе с заголовками.
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ("GET", "HEAD"):
+                return view_func(request, *args, **kwargs)
+
+            uncacheable = []
+
+            def render():
+                response = view_func(request, *args, **kwargs)
+                if hasattr(response, "render") and callable(response.render):
+                    response = response.render()
+                entry = _cached_response(response)
+                if entry is None:
+                    uncacheable.append(response)
+                    raise _UncacheableResponse
+                return entry
+
+            key = _swr_key(request, key_prefix, [get_generation(name) for name in generations])
+            try:
+                return _restore_response(get_or_compute(key, render, soft_ttl, hard_ttl))
+            except _UncacheableResponse:
+                return uncacheable[0]
+        return wrapper
+    return decorator
+
+
+def _swr_key(request, key_prefix: str, generations) -> str:
+    url_hash = hashlib.md5(request.build_absolute_uri().encode()).hexdigest()
+    # h - в записи тело и все заголовки (раньше только Content-Type)
+    return "{}:h:{}:{}:{}".format(
+        key_prefix,
+        ".".join(str(generation) for generation in generations),
+        getattr(request, "LANGUAGE_CODE", ""),
+        url_hash,
+    )
+
+
+def aswr_cache_page(soft_ttl: int, hard_ttl: int, *generations: str, key_prefix: str = "shopapp:swr"):
+    """
+    swr_cache_page для async-метода get у View, с тем же форматом ключа.
+
+    Декорирует сам метод (self, request, ...): method_decorator в Django 4.2
+    не поддерживает корутины.
+    """
+    def decorator(method):
+        @wraps(method)
+        async def wrapper(self, request, *args, **kwargs):
+            if request.method not in ("GET", "HEAD"):
+                return await method(self, request, *args, **kwargs)
+
+            uncacheable = []
+
+            async def render():
+                response = await method(self, request, *args, **kwargs)
+                entry = _cached_response(response)
+                if entry is None:
+                    uncacheable.append(response)
+                    raise _UncacheableResponse
+                return entry
+
+            key = _swr_key(request, key_prefix, [await aget_generation(name) for name in generations])
+            try:
+                return _restore_response(await aget_or_compute(key, render, soft_ttl, hard_ttl))
+            except _UncacheableResponse:
+                return uncacheable[0]
+        return wrapper
+    return decorator
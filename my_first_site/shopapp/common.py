@@ -1,19 +1,285 @@
 from csv import DictReader
+from dataclasses import dataclass, field
 from io import TextIOWrapper
+from itertools import islice
 
-from shopapp.models import Product
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
 
+from shopapp.cache import PRODUCTS_GENERATION, bump_generation_on_commit
+from shopapp.linking import sync_order_products
+from shopapp.models import Order, Product
+from shopapp.totals import refresh_totals_for_products
 
-def save_csv_products(file, encoding):
+IMPORT_BATCH_SIZE = 1000
+IMPORT_MAX_ERRORS = 100
+
+PRODUCT_CSV_FIELDS = (
+    "name",
+    "description",
+    "price",
+    "discount",
+    "archived",
+    "created_by",
+)
+PRODUCT_CSV_KEY_FIELDS = ("id", "pk")
+
+ORDER_CSV_FIELDS = (
+    "delivery_address",
+    "promocode",
+    "user",
+    "products",
+)
+ORDER_CSV_PRODUCTS_SEPARATOR = ";"
+
+
+@dataclass
+class ImportSummary:
+    """Итог импорта: сколько строк прочитано, сохранено и какие строки с ошибками."""
+    rows: int = 0
+    imported: int = 0
+    batches: int = 0
+    errors: list = field(default_factory=list)
+    errors_total: int = 0
+    max_errors: int = IMPORT_MAX_ERRORS
+
+    def add_error(self, line: int, message: str):
+        self.errors_total += 1
+        # храним только первые max_errors, чтобы память не росла на плохом файле
+        if len(self.errors) < self.max_errors:
+            self.errors.append({"line": line, "error": message})
+
+    @property
+    def ok(self) -> bool:
+        return self.errors_total == 0
+
+    def as_dict(self) -> dict:
+        return {
+            "rows": self.rows,
+            "imported": self.imported,
+            "batches": self.batches,
+            "errors_total": self.errors_total,
+            "errors": self.errors,
+        }
+
+
+def _format_error(exc: ValidationError) -> str:
+    return "; ".join(exc.messages)
+
+
+def iter_csv_products(reader: DictReader, summary: ImportSummary, created_by: User = None):
+    """
+    Генератор (Product, заполненные в строке поля) из строк CSV.
+
+    Значения приводятся к типам через form-поля модели (те же правила, что в админке),
+    строки с ошибками попадают в summary и пропускаются. Пустые ячейки не
+    заполняют поле: у нового товара остается значение по умолчанию,
+    у существующего - текущее.
+    """
+    meta = Product._meta
+    form_fields = {
+        name: meta.get_field(name).formfield()
+        for name in PRODUCT_CSV_FIELDS
+        if name != "created_by"
+    }
+    for row in reader:
+        summary.rows += 1
+        line = reader.line_num
+        if None in row:
+            # лишние ячейки DictReader складывает под ключ None
+            summary.add_error(line, f"Row has {len(row[None])} more cells than the header")
+            continue
+        values = {}
+        try:
+            for name, raw in row.items():
+                if name in PRODUCT_CSV_KEY_FIELDS:
+                    if raw:
+                        values["id"] = meta.pk.clean(raw, None)
+                    continue
+                if raw in ("", None):
+                    continue
+                if name == "created_by":
+                    values["created_by_id"] = meta.pk.clean(raw, None)
+                else:
+                    values[name] = form_fields[name].clean(raw)
+        except ValidationError as exc:
+            summary.add_error(line, f"{name}: {_format_error(exc)}")
+            continue
+
+        supplied = frozenset(values) - {"id"}
+        if "created_by_id" not in values:
+            if created_by is None:
+                summary.add_error(line, "created_by: This field is required.")
+                continue
+            values["created_by_id"] = created_by.pk
+        yield Product(**values), supplied
+
+
+def save_csv_products(
+    file,
+    encoding,
+    created_by: User = None,
+    batch_size: int = IMPORT_BATCH_SIZE,
+    update_existing: bool = True,
+) -> ImportSummary:
+    """
+    Потоковый импорт товаров из CSV.
+
+    Строки читаются генератором и сохраняются пачками по batch_size,
+    каждая пачка - в своей транзакции. Строки с колонкой id/pk обновляют
+    существующий товар (upsert по первичному ключу) только в заполненных
+    ячейках, остальные создаются.
+    """
+    csv_file = TextIOWrapper(
+        file,
+        encoding=encoding or "utf-8",
+    )
+    reader = DictReader(csv_file)
+    summary = ImportSummary()
+
+    columns = reader.fieldnames or []
+    unknown = set(columns) - set(PRODUCT_CSV_FIELDS) - set(PRODUCT_CSV_KEY_FIELDS)
+    if unknown:
+        summary.add_error(1, "Unknown columns: " + ", ".join(sorted(unknown)))
+        return summary
+
+    upsert = update_existing and any(name in PRODUCT_CSV_KEY_FIELDS for name in columns)
+
+    products = iter_csv_products(reader, summary, created_by=created_by)
+    while True:
+        batch = list(islice(products, batch_size))
+        if not batch:
+            break
+        summary.batches += 1
+        try:
+            with transaction.atomic():
+                if upsert:
+                    _upsert_products(batch)
+                else:
+                    Product.objects.bulk_create([product for product, _ in batch])
+        except IntegrityError as exc:
+            summary.add_error(reader.line_num, f"Batch {summary.batches} rejected: {exc}")
+            continue
+        summary.imported += len(batch)
+    if summary.imported:
+        # bulk_create не шлет post_save, поэтому сбрасываем кеш товаров явно
+        bump_generation_on_commit(PRODUCTS_GENERATION)
+    return summary
+
+
+def _upsert_products(batch: list):
+    """
+    Строки без id создаются, строки с id пишутся через INSERT ... ON CONFLICT,
+    сгруппированные по набору заполненных полей: обновляются только они.
+    """
+    Product.objects.bulk_create([product for product, _ in batch if product.id is None])
+    groups = {}
+    for product, supplied in batch:
+        if product.id is not None:
+            groups.setdefault(supplied, []).append(product)
+    for supplied, products in groups.items():
+        Product.objects.bulk_create(
+            products,
+            update_conflicts=True,
+            unique_fields=["id"],
+            # created_by_id -> created_by и т.п.: update_fields принимает имена полей
+            update_fields=[Product._meta.get_field(name).name for name in supplied] + ["updated_at"],
+        )
+        if "price" in supplied:
+            refresh_totals_for_products(product.id for product in products)
+
+
+def iter_csv_orders(reader: DictReader, summary: ImportSummary):
+    """Генератор (номер строки, Order, id товаров) из строк CSV заказов."""
+    meta = Order._meta
+    form_fields = {
+        name: meta.get_field(name).formfield()
+        for name in ("delivery_address", "promocode")
+    }
+    for row in reader:
+        summary.rows += 1
+        line = reader.line_num
+        if None in row:
+            summary.add_error(line, f"Row has {len(row[None])} more cells than the header")
+            continue
+        values = {}
+        try:
+            for name in form_fields:
+                values[name] = form_fields[name].clean(row.get(name) or "")
+            values["user_id"] = meta.pk.clean(row.get("user") or None, None)
+            product_ids = {
+                meta.pk.clean(product_id.strip(), None)
+                for product_id in (row.get("products") or "").split(ORDER_CSV_PRODUCTS_SEPARATOR)
+                if product_id.strip()
+            }
+        except ValidationError as exc:
+            summary.add_error(line, _format_error(exc))
+            continue
+        if values["user_id"] is None:
+            summary.add_error(line, "user: This field is required.")
+            continue
+        values["promocode"] = values["promocode"] or ""
+        yield line, Order(**values), product_ids
+
+
+def save_csv_orders(file, encoding, batch_size: int = IMPORT_BATCH_SIZE) -> ImportSummary:
+    """
+    Потоковый импорт заказов из CSV.
+
+    Колонка products - id товаров через ";". На каждую пачку строк
+    пользователи и товары проверяются двумя запросами, заказы пишутся
+    одним bulk_create, связи - через sync_order_products, в одной транзакции.
+    Если пользователя или товар удалили после проверки, пачка отклоняется
+    с ошибкой в summary, как в импорте товаров.
+    """
     csv_file = TextIOWrapper(
         file,
-        encoding=encoding,
+        encoding=encoding or "utf-8",
     )
     reader = DictReader(csv_file)
+    summary = ImportSummary()
+
+    unknown = set(reader.fieldnames or []) - set(ORDER_CSV_FIELDS)
+    if unknown:
+        summary.add_error(1, "Unknown columns: " + ", ".join(sorted(unknown)))
+        return summary
+
+    rows = iter_csv_orders(reader, summary)
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            break
+        summary.batches += 1
+
+        user_ids = set(User.objects.filter(
+            pk__in={order.user_id for _, order, _ in batch}
+        ).values_list("pk", flat=True))
+        product_ids = set(Product.objects.filter(
+            pk__in=set().union(*(ids for _, _, ids in batch))
+        ).values_list("pk", flat=True))
+
+        valid = []
+        for line, order, ids in batch:
+            if order.user_id not in user_ids:
+                summary.add_error(line, f"user: User {order.user_id} does not exist.")
+            elif ids - product_ids:
+                missing = ", ".join(str(pk) for pk in sorted(ids - product_ids))
+                summary.add_error(line, f"products: Products {missing} do not exist.")
+            else:
+                valid.append((order, ids))
+        if not valid:
+            continue
 
-    products = [
-        Product(**row)
-        for row in reader
-    ]
-    Product.objects.bulk_create(products)
-    return products
+        try:
+            with transaction.atomic():
+                orders = Order.objects.bulk_create([order for order, _ in valid])
+                sync_order_products(
+                    {order.pk: ids for order, ids in valid},
+                    batch_size=batch_size,
+                )
+        except IntegrityError as exc:
+            summary.add_error(reader.line_num, f"Batch {summary.batches} rejected: {exc}")
+            continue
+        summary.imported += len(orders)
+    return summary
@@ -0,0 +1,100 @@
+"""
+Условные ответы (304 Not Modified) для страниц и API товаров и заказов.
+
+Версия объекта - его updated_at (для заказа еще и самый свежий updated_at
+его товаров). Она читается одним запросом по индексу до того, как view
+построит сериализатор или контекст шаблона, и переиспользуется для ETag и Last-Modified.
+"""
+from calendar import timegm
+from functools import wraps
+
+from django.db.models import Max
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from django.views.decorators.http import condition
+
+from .models import Order, Product
+
+
+def product_version(pk):
+    return Product.objects.filter(pk=pk).values_list("updated_at", flat=True).first()
+
+
+async def aproduct_version(pk):
+    return await Product.objects.filter(pk=pk).values_list("updated_at", flat=True).afirst()
+
+
+def order_version(pk):
+    row = (
+        Order.objects
+        .filter(pk=pk)
+        .annotate(products_updated_at=Max("products__updated_at"))
+        .values_list("updated_at", "products_updated_at")
+        .first()
+    )
+    if row is None:
+        return None
+    return max(version for version in row if version is not None)
+
+
+def conditional_on_version(version_func, etag_prefix: str):
+    """
+    Декоратор view на основе django condition(): ETag и Last-Modified
+    из версии объекта с pk из URL; версия запрашивается один раз на запрос.
+    """
+    def get_version(request, pk, **kwargs):
+        versions = request.__dict__.setdefault("_shopapp_versions", {})
+        key = (etag_prefix, pk)
+        if key not in versions:
+            versions[key] = version_func(pk)
+        return versions[key]
+
+    def etag(request, *args, pk=None, **kwargs):
+        version = get_version(request, pk)
+        if version is None:
+            return None
+        return f"{etag_prefix}-{pk}-{version.timestamp():.6f}"
+
+    def last_modified(request, *args, pk=None, **kwargs):
+        return get_version(request, pk)
+
+    return condition(etag_func=etag, last_modified_func=last_modified)
+
+
+def aconditional_on_version(version_func, etag_prefix: str):
+    """
+    conditional_on_version для async-метода get у View: версию читает
+    корутина version_func, ETag и Last-Modified те же, что у синхронного варианта.
+
+    Декорирует сам метод (self, request, ...): method_decorator в Django 4.2
+    не поддерживает корутины. pk должен приходить из URL именованным аргументом.
+    """
+    def decorator(method):
+        @wraps(method)
+        async def wrapper(self, request, *args, **kwargs):
+            if "pk" not in kwargs:
+                raise TypeError(f"{method.__qualname__} needs a pk keyword argument from the URL")
+            if request.method not in ("GET", "HEAD"):
+                return await method(self, request, *args, **kwargs)
+            pk = kwargs["pk"]
+            version = await version_func(pk)
+            etag = last_modified = None
+            if version is not None:
+                etag = quote_etag(f"{etag_prefix}-{pk}-{version.timestamp():.6f}")
+                last_modified = timegm(version.utctimetuple())
+            response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if response is None:
+                response = await method(self, request, *args, **kwargs)
+            if last_modified and not response.has_header("Last-Modified"):
+                response["Last-Modified"] = http_date(last_modified)
+            if etag:
+                response.headers.setdefault("ETag", etag)
+            return response
+        return wrapper
+    return decorator
+
+
+product_api_conditional = conditional_on_version(product_version, "product-api")
+order_conditional = conditional_on_version(order_version, "order")
+order_api_conditional = conditional_on_version(order_version, "order-api")
+product_aconditional = aconditional_on_version(aproduct_version, "product")
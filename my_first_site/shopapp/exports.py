@@ -0,0 +1,135 @@
+"""
+Потоковая выгрузка данных магазина.
+
+Генераторы читают queryset порциями на стороне сервера и отдают
+готовые куски тела ответа, поэтому память не растет вместе с размером выгрузки.
+"""
+import csv
+import zlib
+from operator import itemgetter
+
+from django.contrib.auth.models import User
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import QuerySet
+from django.http import StreamingHttpResponse
+
+from .models import Order, Product
+
+EXPORT_CHUNK_SIZE = 2000
+ORDERS_EXPORT_CHUNK_SIZE = 500
+
+
+class Echo:
+    """Псевдо-файл для csv.writer: write() возвращает строку вместо записи."""
+
+    def write(self, value):
+        return value
+
+
+def iter_csv_rows(queryset: QuerySet, fields, chunk_size: int = EXPORT_CHUNK_SIZE):
+    writer = csv.writer(Echo())
+    yield writer.writerow(fields)
+    # values_list + iterator: без создания моделей и без кеша результата в queryset
+    rows = queryset.values_list(*fields).iterator(chunk_size=chunk_size)
+    buffer = []
+    for row in rows:
+        buffer.append(writer.writerow(row))
+        if len(buffer) >= chunk_size:
+            yield "".join(buffer)
+            buffer = []
+    if buffer:
+        yield "".join(buffer)
+
+
+def iter_gzip(chunks, encoding: str = "utf-8"):
+    compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode(encoding))
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def csv_streaming_response(queryset: QuerySet, fields, filename: str, gzip: bool = False) -> StreamingHttpResponse:
+    chunks = iter_csv_rows(queryset, fields)
+    if gzip:
+        chunks = iter_gzip(chunks)
+        filename += ".gz"
+    response = StreamingHttpResponse(
+        chunks,
+        content_type="application/gzip" if gzip else "text/csv",
+    )
+    response["Content-Disposition"] = f"attachment; filename={filename}"
+    return response
+
+
+def iter_orders_export(queryset: QuerySet, chunk_size: int = ORDERS_EXPORT_CHUNK_SIZE):
+    """
+    Заказы с пользователями и товарами, порциями по chunk_size.
+
+    Порции выбираются по pk (keyset), для каждой порции пользователи, связи
+    и товары читаются тремя запросами - число запросов не зависит от числа заказов.
+    """
+    through = Order.products.through
+    last_pk = 0
+    while True:
+        orders = list(
+            queryset
+            .filter(pk__gt=last_pk)
+            .order_by("pk")
+            .values("id", "delivery_address", "promocode", "user_id")[:chunk_size]
+        )
+        if not orders:
+            return
+        last_pk = orders[-1]["id"]
+
+        users = {
+            user["id"]: user
+            for user in User.objects
+            .filter(pk__in={order["user_id"] for order in orders})
+            .values("id", "username", "is_staff")
+        }
+        links = list(
+            through.objects
+            .filter(order_id__in=[order["id"] for order in orders])
+            .values_list("order_id", "product_id")
+        )
+        products = {
+            product["id"]: product
+            for product in Product.objects
+            .filter(pk__in={product_id for _, product_id in links})
+            .values("id", "name", "price", "archived")
+        }
+        order_products = {}
+        for order_id, product_id in links:
+            order_products.setdefault(order_id, []).append(products[product_id])
+
+        for order in orders:
+            user_id = order.pop("user_id")
+            order["user"] = users[user_id]
+            # тот же порядок, что и у order.products.all() (Product.Meta.ordering)
+            order["products"] = sorted(order_products.get(order["id"], []), key=itemgetter("name", "price"))
+            yield order
+
+
+def iter_json_array(items, key: str):
+    encoder = DjangoJSONEncoder()
+    yield '{"%s": [' % key
+    separator = ""
+    for item in items:
+        yield separator + encoder.encode(item)
+        separator = ","
+    yield "]}"
+
+
+def iter_ndjson(items):
+    encoder = DjangoJSONEncoder()
+    for item in items:
+        yield encoder.encode(item) + "\n"
+
+
+def orders_streaming_response(queryset: QuerySet, ndjson: bool = False) -> StreamingHttpResponse:
+    orders = iter_orders_export(queryset)
+    if ndjson:
+        return StreamingHttpResponse(iter_ndjson(orders), content_type="application/x-ndjson")
+    return StreamingHttpResponse(iter_json_array(orders, "orders"), content_type="application/json")
@@ -4,14 +4,46 @@ from django.core import validators
 from .models import Product, Order
 from django.contrib.auth.models import Group
 
+
+class MultipleFileInput(forms.FileInput):
+    allow_multiple_selected = True
+
+    def __init__(self, attrs=None):
+        super().__init__({"multiple": True, **(attrs or {})})
+
+    def value_from_datadict(self, data, files, name):
+        if hasattr(files, "getlist"):
+            return files.getlist(name)
+        return files.get(name)
+
+
+class MultipleFileField(forms.FileField):
+    """
+    Несколько файлов в одном поле. Файлы проверяются только по расширению,
+    без декодирования: содержимое изображений проверяется в фоне (shopapp.images).
+    """
+    widget = MultipleFileInput
+    default_validators = [validators.validate_image_file_extension]
+
+    def clean(self, data, initial=None):
+        if not isinstance(data, (list, tuple)):
+            data = [data] if data else []
+        if not data and self.required:
+            raise forms.ValidationError(self.error_messages["required"], code="required")
+        return [super(MultipleFileField, self).clean(file, initial) for file in data]
+
+
 class ProductForm(forms.ModelForm):
     class Meta:
         model = Product
         fields = 'name', 'price', 'description', 'discount', "preview"
 
-    images = forms.ImageField(
-        widget=forms.ClearableFileInput(attrs={"multiple": True}),
-    )
+    images = MultipleFileField(required=False)
+
+
+class ProductImagesForm(forms.Form):
+    images = MultipleFileField()
+    description = forms.CharField(max_length=200, required=False)
 
 class OrderForm(forms.ModelForm):
     class Meta:
@@ -0,0 +1,200 @@
+"""
+Уменьшенные копии изображений товаров (WebP и JPEG фиксированной ширины).
+
+Копии строятся Pillow в фоновом пуле потоков после коммита транзакции,
+поэтому запрос с загрузкой файла не ждет их. Пути к копиям хранятся
+в JSON-поле рядом с исходным файлом:
+
+    {"source": "<имя исходного файла>", "webp": {"160": "<имя>", ...}, "jpeg": {...}}
+
+Если source не совпадает с текущим файлом, копии устарели и строятся заново.
+"""
+import logging
+import posixpath
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connections, transaction
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from .models import Product, ProductImage
+
+log = logging.getLogger(__name__)
+
+VARIANT_WIDTHS = (160, 320, 640)
+VARIANT_FORMATS = {
+    # формат: (формат Pillow, расширение, параметры сохранения)
+    "webp": ("WEBP", "webp", {"quality": 80, "method": 4}),
+    "jpeg": ("JPEG", "jpg", {"quality": 82, "optimize": True, "progressive": True}),
+}
+
+_executor = None
+
+
+def variant_name(source: str, width: int, ext: str) -> str:
+    directory, filename = posixpath.split(source)
+    stem = posixpath.splitext(filename)[0]
+    return posixpath.join(directory, "variants", f"{stem}-{width}w.{ext}")
+
+
+def _flatten(image: Image.Image) -> Image.Image:
+    # JPEG не поддерживает прозрачность: подкладываем белый фон
+    if image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info):
+        image = image.convert("RGBA")
+        background = Image.new("RGB", image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel("A"))
+        return background
+    return image.convert("RGB")
+
+
+def generate_variants(source: str, storage=default_storage) -> dict:
+    """Строит копии файла source и возвращает словарь для JSON-поля."""
+    with storage.open(source, "rb") as file:
+        original = Image.open(file)
+        original = _flatten(ImageOps.exif_transpose(original))
+
+    # не увеличиваем: ширины больше исходной заменяются самой исходной шириной
+    widths = sorted({min(width, original.width) for width in VARIANT_WIDTHS})
+    variants = {"source": source}
+    for key, (pillow_format, ext, options) in VARIANT_FORMATS.items():
+        variants[key] = {}
+        for width in widths:
+            image = original
+            if width < original.width:
+                height = max(1, round(original.height * width / original.width))
+                image = original.resize((width, height), Image.LANCZOS)
+            buffer = BytesIO()
+            image.save(buffer, pillow_format, **options)
+            name = variant_name(source, width, ext)
+            if storage.exists(name):
+                storage.delete(name)
+            variants[key][str(width)] = storage.save(name, ContentFile(buffer.getvalue()))
+    return variants
+
+
+def variant_names(variants: dict) -> set:
+    return {
+        name
+        for key in VARIANT_FORMATS
+        for name in (variants or {}).get(key, {}).values()
+    }
+
+
+def _store_variants(queryset, field: str, variants_field: str, force: bool = False, storage=default_storage):
+    row = queryset.values("pk", field, variants_field).first()
+    if row is None or not row[field]:
+        return None
+    previous = row[variants_field] or {}
+    if not force and previous.get("source") == row[field]:
+        return None
+    variants = generate_variants(row[field], storage=storage)
+    # файл могли заменить, пока строились копии: тогда результат не сохраняем
+    updated = queryset.filter(**{field: row[field]}).update(**{variants_field: variants})
+    if not updated:
+        stale = variant_names(variants)
+    elif getattr(storage, "deduplicates", False):
+        # каждое сохранение - отдельная ссылка на файл, старые ссылки отпускаем все
+        stale = variant_names(previous)
+    else:
+        stale = variant_names(previous) - variant_names(variants)
+    for name in stale:
+        storage.delete(name)
+    return variants if updated else None
+
+
+def process_product_preview(product_id: int, force: bool = False) -> bool:
+    if _store_variants(Product.objects.filter(pk=product_id), "preview", "preview_variants", force=force):
+        Product.objects.filter(pk=product_id).update(updated_at=timezone.now())
+        return True
+    return False
+
+
+def process_product_image(image_id: int, force: bool = False) -> bool:
+    if _store_variants(ProductImage.objects.filter(pk=image_id), "image", "variants", force=force):
+        Product.objects.filter(images__pk=image_id).update(updated_at=timezone.now())
+        return True
+    return False
+
+
+def save_product_images(product: Product, files, description: str = "", storage=default_storage) -> list:
+    """
+    Сохраняет загруженные файлы и создает строки ProductImage одним bulk_create.
+
+    Файлы пишутся в хранилище потоково (по чанкам), без декодирования;
+    проверка содержимого и построение копий идут в фоне после коммита.
+    Если сохранить файлы или строки не удалось, уже записанные файлы удаляются.
+    """
+    field = ProductImage._meta.get_field("image")
+    images = []
+    try:
+        for file in files:
+            image = ProductImage(product=product, description=description)
+            image.image = storage.save(field.generate_filename(image, file.name), file)
+            images.append(image)
+        if not images:
+            return images
+        with transaction.atomic():
+            ProductImage.objects.bulk_create(images)
+            # bulk_create не отправляет post_save: версию товара сдвигаем сами
+            Product.objects.filter(pk=product.pk).update(updated_at=timezone.now())
+            schedule(process_uploaded_images, [image.pk for image in images])
+    except BaseException:
+        for image in images:
+            storage.delete(image.image.name)
+        raise
+    return images
+
+
+def process_uploaded_images(image_ids):
+    """Проверяет, что файлы - изображения; битые удаляет, для остальных строит копии."""
+    for image in ProductImage.objects.filter(pk__in=image_ids).only("pk", "product", "image"):
+        name = image.image.name
+        try:
+            with default_storage.open(name, "rb") as file:
+                Image.open(file).verify()
+        except Exception as exc:
+            log.warning("Uploaded product image %s is not a valid image: %s", name, exc)
+            image.delete()
+            if not getattr(default_storage, "deduplicates", False):
+                # в хранилище с подсчетом ссылок файл отпускает само удаление строки
+                default_storage.delete(name)
+            continue
+        process_product_image(image.pk)
+
+
+def _run(func, *args):
+    try:
+        func(*args)
+    except Exception:
+        log.exception("Image variants failed: %s%r", func.__name__, args)
+    finally:
+        # у потока пула свое соединение с базой, не оставляем его открытым
+        connections.close_all()
+
+
+def get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.IMAGE_VARIANTS_WORKERS,
+            thread_name_prefix="image-variants",
+        )
+    return _executor
+
+
+def schedule(func, *args):
+    """Ставит обработку в очередь после коммита (или выполняет сразу, если IMAGE_VARIANTS_ASYNC выключен)."""
+    def submit():
+        if settings.IMAGE_VARIANTS_ASYNC:
+            get_executor().submit(_run, func, *args)
+        else:
+            func(*args)
+    transaction.on_commit(submit)
+
+
+def needs_variants(name: str, variants: dict) -> bool:
+    return bool(name) and (variants or {}).get("source") != name
@@ -0,0 +1,85 @@
+"""
+Пакетная синхронизация связей Order.products.
+
+Вместо order.products.add(product) по одному INSERT на товар сравниваем
+желаемые связи с уже существующими строками таблицы связей и вставляем
+(и при replace=True удаляем) только разницу, пачками по batch_size заказов.
+"""
+from dataclasses import dataclass
+
+from django.db import transaction
+
+from .cache import bump_generation_on_commit, user_orders_generation
+from .models import Order
+from .totals import refresh_totals_for_orders
+
+LINK_BATCH_SIZE = 1000
+
+
+@dataclass
+class LinkResult:
+    added: int = 0
+    removed: int = 0
+    orders_changed: int = 0
+
+
+def sync_order_products(
+    links: dict,
+    replace: bool = False,
+    batch_size: int = LINK_BATCH_SIZE,
+    dry_run: bool = False,
+) -> LinkResult:
+    """
+    links - словарь {order_id: набор product_id}.
+
+    Без replace недостающие связи только добавляются, с replace лишние удаляются.
+    m2m_changed при этом не отправляется, поэтому итоги заказов и кеш выгрузок
+    обновляются здесь же. dry_run считает разницу, ничего не записывая.
+    """
+    if batch_size < 1:
+        raise ValueError(f"batch_size must be positive, got {batch_size}")
+    through = Order.products.through
+    result = LinkResult()
+    order_ids = list(links)
+    for start in range(0, len(order_ids), batch_size):
+        chunk = order_ids[start:start + batch_size]
+        existing = {}
+        for link_id, order_id, product_id in (
+            through.objects
+            .filter(order_id__in=chunk)
+            .values_list("id", "order_id", "product_id")
+        ):
+            existing.setdefault(order_id, {})[product_id] = link_id
+
+        to_add = []
+        to_remove = []
+        changed = set()
+        for order_id in chunk:
+            wanted = set(links[order_id])
+            current = existing.get(order_id, {})
+            for product_id in wanted - set(current):
+                to_add.append(through(order_id=order_id, product_id=product_id))
+                changed.add(order_id)
+            if replace:
+                for product_id, link_id in current.items():
+                    if product_id not in wanted:
+                        to_remove.append(link_id)
+                        changed.add(order_id)
+
+        result.added += len(to_add)
+        result.removed += len(to_remove)
+        result.orders_changed += len(changed)
+        if dry_run or not changed:
+            continue
+
+        with transaction.atomic():
+            if to_add:
+                through.objects.bulk_create(to_add, batch_size=batch_size, ignore_conflicts=True)
+            for remove_start in range(0, len(to_remove), batch_size):
+                through.objects.filter(pk__in=to_remove[remove_start:remove_start + batch_size]).delete()
+            refresh_totals_for_orders(changed)
+            user_ids = set(
+                Order.objects.filter(pk__in=changed).values_list("user_id", flat=True).distinct()
+            )
+            bump_generation_on_commit(*(user_orders_generation(user_id) for user_id in user_ids))
+    return result
@@ -17,14 +17,12 @@ class Command(BaseCommand):
         # )
         # print(result)
 
-        orders = Order.objects.annotate(
-            total=Sum("products__price", default=0),
-            products_count=Count("products"),
-        )
-        for order in orders:
+        # итоги хранятся в заказе (см. recalculate_order_totals), join по товарам не нужен
+        orders = Order.objects.only("id", "total_amount", "products_count").order_by("pk")
+        for order in orders.iterator():
             print(
                 f"Order #{order.id} "
                 f"with {order.products_count} "
-                f"products worth {order.total}"
+                f"products worth {order.total_amount}"
             )
         self.stdout.write("Done")
\ No newline at end of file
@@ -0,0 +1,96 @@
+import json
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import BaseCommand, CommandError
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+from shopapp.benchmarks import compare, default_scenarios, run_benchmarks, seed_dataset
+from shopapp.benchmarks.runner import RUNNERS
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a throwaway test database and measure latency (p50/p95/p99), "
+        "queries per request and peak memory of the shop views"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--scale", type=int, default=1000, help="Number of products and orders")
+        parser.add_argument("--seed", type=int, default=42)
+        parser.add_argument("--iterations", type=int, default=30)
+        parser.add_argument("--warmup", type=int, default=3)
+        parser.add_argument("--runner", action="append", choices=sorted(RUNNERS), help="Default: all runners")
+        parser.add_argument("--scenario", action="append", help="Run only these scenarios")
+        parser.add_argument("--output", default="benchmark-results.json")
+        parser.add_argument("--baseline", help="Results file to compare against")
+        parser.add_argument("--threshold", type=float, default=0.2, help="Allowed p95 growth, 0.2 = 20%%")
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options["baseline"]:
+            baseline = json.loads(Path(options["baseline"]).read_text())
+
+        # отдельная тестовая база и кеш в памяти: рабочие данные и кеш не трогаем
+        test_runner = DiscoverRunner(verbosity=0, interactive=False)
+        test_runner.setup_test_environment()
+        old_config = test_runner.setup_databases()
+        try:
+            with TemporaryDirectory() as metrics_dir, override_settings(
+                CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "benchmark"}},
+                METRICS_DIR=metrics_dir,
+            ):
+                cache.clear()
+                self.stdout.write(f"Seed dataset, scale {options['scale']}")
+                summary = seed_dataset(options["scale"], seed=options["seed"])
+                self.stdout.write(", ".join(f"{key}: {value}" for key, value in summary.items() if not key.endswith("_id")))
+                scenarios = default_scenarios(summary["user_id"], summary["customer_id"])
+                if options["scenario"]:
+                    unknown = set(options["scenario"]) - {scenario.name for scenario in scenarios}
+                    if unknown:
+                        raise CommandError(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+                    scenarios = [scenario for scenario in scenarios if scenario.name in options["scenario"]]
+                result = run_benchmarks(
+                    scenarios,
+                    options["runner"] or sorted(RUNNERS),
+                    User.objects.get(pk=summary["user_id"]),
+                    iterations=options["iterations"],
+                    warmup=options["warmup"],
+                    meta={"scale": options["scale"], "seed": options["seed"], "dataset": summary},
+                )
+        finally:
+            test_runner.teardown_databases(old_config)
+            test_runner.teardown_test_environment()
+
+        for scenario, runners in result["results"].items():
+            for runner, stats in runners.items():
+                self.stdout.write(
+                    f"{scenario:<22} {runner:<6} p50 {stats['p50_ms']:>9.2f}ms  p95 {stats['p95_ms']:>9.2f}ms  "
+                    f"p99 {stats['p99_ms']:>9.2f}ms  queries {stats['queries']:>3}  "
+                    f"peak {stats['peak_memory_kb']:>9.1f}KB  errors {stats['errors']}"
+                )
+        Path(options["output"]).write_text(json.dumps(result, indent=2))
+        self.stdout.write(f"Results written to {options['output']}")
+
+        if baseline is None:
+            failed = [
+                f"{scenario}/{runner}"
+                for scenario, runners in result["results"].items()
+                for runner, stats in runners.items()
+                if stats["errors"]
+            ]
+            if failed:
+                raise CommandError(f"Error responses in {', '.join(failed)}")
+            return
+        try:
+            regressions = compare(result, baseline, options["threshold"])
+        except ValueError as exc:
+            raise CommandError(str(exc))
+        if regressions:
+            for line in regressions:
+                self.stderr.write(line)
+            raise CommandError(f"{len(regressions)} regressions against {options['baseline']}")
+        self.stdout.write(self.style.SUCCESS(f"No regressions against {options['baseline']}"))
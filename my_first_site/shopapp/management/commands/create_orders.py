@@ -1,23 +1,38 @@
-from typing import Sequence
-
 from django.contrib.auth.models import User
-from django.core.management import BaseCommand
+from django.core.management import BaseCommand, CommandError
 from django.db import transaction
 
+from shopapp.linking import LINK_BATCH_SIZE, sync_order_products
 from shopapp.models import Order, Product
 
 class Command(BaseCommand):
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=LINK_BATCH_SIZE)
+        parser.add_argument("--dry-run", action="store_true", help="Show what would change without writing")
+
     @transaction.atomic
     def handle(self, *args, **options):
+        if options["batch_size"] < 1:
+            raise CommandError("--batch-size must be a positive integer")
         self.stdout.write("Create order with products")
         user = User.objects.get(username="admin")
-        products: Sequence[Product] = Product.objects.only("id").all()
-        order, created = Order.objects.get_or_create(
+        product_ids = set(Product.objects.values_list("pk", flat=True))
+        order_fields = dict(
             delivery_address="ul Novaya, d 100",
             promocode="promo5",
             user=user,
         )
-        for product in products:
-            order.products.add(product)
-        order.save()
-        self.stdout.write(f"Create order {order}")
+        if options["dry_run"]:
+            order = Order.objects.filter(**order_fields).first()
+            if order is None:
+                self.stdout.write(f"Would create order with {len(product_ids)} products")
+                return
+        else:
+            order, created = Order.objects.get_or_create(**order_fields)
+        result = sync_order_products(
+            {order.pk: product_ids},
+            batch_size=options["batch_size"],
+            dry_run=options["dry_run"],
+        )
+        prefix = "Would link" if options["dry_run"] else "Linked"
+        self.stdout.write(f"{prefix} {result.added} products to order {order}")
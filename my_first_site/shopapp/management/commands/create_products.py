@@ -1,16 +1,24 @@
-from django.core.management import BaseCommand
+from django.contrib.auth.models import User
+from django.core.management import BaseCommand, CommandError
 from shopapp.models import Product
 
 class Command(BaseCommand):
+    def add_arguments(self, parser):
+        parser.add_argument("--username", default="admin", help="Author of the created products")
+
     def handle(self, *args, **options):
         self.stdout.write("Create products")
+        try:
+            user = User.objects.get(username=options["username"])
+        except User.DoesNotExist:
+            raise CommandError(f"User {options['username']!r} does not exist")
         products_names = [
             "Laptop",
             "Desktop",
             "Smartphone"
         ]
         for product_name in products_names:
-            product, created = Product.objects.get_or_create(name=product_name)
+            product, created = Product.objects.get_or_create(name=product_name, defaults={"created_by": user})
             self.stdout.write(f"Create product {product.name}")
 
-        self.stdout.write(self.style.SUCCESS("Products created"))
\ No newline at end of file
+        self.stdout.write(self.style.SUCCESS("Products created"))
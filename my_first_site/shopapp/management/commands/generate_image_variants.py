@@ -0,0 +1,32 @@
+from django.core.management import BaseCommand
+
+from shopapp.images import needs_variants, process_product_image, process_product_preview
+from shopapp.models import Product, ProductImage
+
+
+class Command(BaseCommand):
+    help = "Build missing or stale WebP/JPEG variants for product previews and images"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--force", action="store_true", help="Rebuild variants that are up to date")
+
+    def handle(self, *args, **options):
+        force = options["force"]
+        previews = Product.objects.exclude(preview="").exclude(preview__isnull=True)
+        targets = [
+            (process_product_preview, previews, "preview", "preview_variants"),
+            (process_product_image, ProductImage.objects.all(), "image", "variants"),
+        ]
+        for process, queryset, field, variants_field in targets:
+            self.stdout.write(f"Build variants for {queryset.model._meta.verbose_name_plural}")
+            built = failed = 0
+            rows = queryset.order_by("pk").values_list("pk", field, variants_field).iterator(chunk_size=500)
+            for pk, name, variants in rows:
+                if not force and not needs_variants(name, variants):
+                    continue
+                try:
+                    built += process(pk, force=force)
+                except Exception as exc:
+                    failed += 1
+                    self.stderr.write(f"{name}: {exc}")
+            self.stdout.write(self.style.SUCCESS(f"Built: {built}, failed: {failed}"))
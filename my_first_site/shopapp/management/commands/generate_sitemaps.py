@@ -0,0 +1,27 @@
+from django.conf import settings
+from django.core.management import BaseCommand
+
+from my_first_site.sitemap_tools import write_sitemaps
+from my_first_site.sitemaps import sitemaps
+
+
+class Command(BaseCommand):
+    help = "Write sitemap index and sitemap pages to SITEMAP_DIR"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--directory", default=settings.SITEMAP_DIR)
+        parser.add_argument("--domain", default=settings.SITEMAP_DOMAIN)
+        parser.add_argument("--protocol", default="https", choices=["http", "https"])
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"Generate sitemaps in {options['directory']}")
+        result = write_sitemaps(
+            sitemaps,
+            options["directory"],
+            domain=options["domain"],
+            protocol=options["protocol"],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Pages: {result.pages}, written: {result.written}, "
+            f"unchanged: {result.unchanged}, removed: {result.removed}"
+        ))
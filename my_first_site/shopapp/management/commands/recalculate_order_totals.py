@@ -0,0 +1,40 @@
+from django.core.management import BaseCommand
+from django.db import transaction
+
+from shopapp.models import Order
+from shopapp.totals import TOTALS_BATCH_SIZE, iter_order_pk_ranges, refresh_order_totals, stale_orders
+
+
+class Command(BaseCommand):
+    help = "Recalculate or verify denormalized Order.total_amount and Order.products_count"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=TOTALS_BATCH_SIZE)
+        parser.add_argument(
+            "--verify",
+            action="store_true",
+            help="Only report orders whose stored totals are out of date",
+        )
+
+    def handle(self, *args, **options):
+        verify = options["verify"]
+        self.stdout.write("Verify order totals" if verify else "Recalculate order totals")
+        processed = 0
+        mismatched = 0
+        for first_pk, last_pk in iter_order_pk_ranges(options["batch_size"]):
+            batch = Order.objects.filter(pk__gte=first_pk, pk__lte=last_pk)
+            if verify:
+                stale = list(stale_orders(batch).values_list("pk", flat=True))
+                mismatched += len(stale)
+                for pk in stale:
+                    self.stdout.write(f"Order #{pk} has stale totals")
+                processed += batch.count()
+            else:
+                with transaction.atomic():
+                    processed += refresh_order_totals(batch, touch=False)
+        if verify and mismatched:
+            self.stdout.write(self.style.WARNING(f"{mismatched} of {processed} orders have stale totals"))
+        elif verify:
+            self.stdout.write(self.style.SUCCESS(f"All {processed} orders are up to date"))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Recalculated {processed} orders"))
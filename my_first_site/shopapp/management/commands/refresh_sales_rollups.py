@@ -0,0 +1,32 @@
+from datetime import timedelta
+
+from django.core.management import BaseCommand
+
+from shopapp.rollups import ROLLUP_BATCH_SIZE, ROLLUP_SAFETY_LAG, refresh_sales_rollups
+
+
+class Command(BaseCommand):
+    help = "Add orders created since the last run to the sales rollup tables"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=ROLLUP_BATCH_SIZE)
+        parser.add_argument(
+            "--full",
+            action="store_true",
+            help="Drop rollups and rebuild them from all orders",
+        )
+        parser.add_argument(
+            "--lag",
+            type=int,
+            default=int(ROLLUP_SAFETY_LAG.total_seconds()),
+            help="Leave orders younger than this many seconds for the next run",
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write("Refresh sales rollups")
+        processed = refresh_sales_rollups(
+            batch_size=options["batch_size"],
+            full=options["full"],
+            lag=timedelta(seconds=options["lag"]),
+        )
+        self.stdout.write(self.style.SUCCESS(f"Processed {processed} new orders"))
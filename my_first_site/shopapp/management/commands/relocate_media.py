@@ -0,0 +1,55 @@
+from django.apps import apps
+from django.core.management import BaseCommand
+from django.utils import timezone
+
+from my_first_site.media_paths import relocate_files
+from shopapp.cache import PRODUCTS_GENERATION, bump_generation_on_commit, user_orders_generation
+from shopapp.models import Product
+
+
+def products_moved(products):
+    bump_generation_on_commit(PRODUCTS_GENERATION)
+
+
+def product_images_moved(images):
+    # картинки входят в представление товара: сдвигаем его версию для ETag
+    Product.objects.filter(pk__in={image.product_id for image in images}).update(updated_at=timezone.now())
+    bump_generation_on_commit(PRODUCTS_GENERATION)
+
+
+def orders_moved(orders):
+    bump_generation_on_commit(*{user_orders_generation(order.user_id) for order in orders})
+
+
+class Command(BaseCommand):
+    help = "Move uploaded files into the sharded media layout"
+
+    targets = [
+        ("shopapp.Product", "preview", None, products_moved),
+        ("shopapp.ProductImage", "image", "product", product_images_moved),
+        ("shopapp.Order", "receipt", None, orders_moved),
+        ("myauth.Profile", "avatar", None, None),
+    ]
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument("--dry-run", action="store_true", help="Only count files to move")
+
+    def handle(self, *args, **options):
+        for label, field_name, related, on_moved in self.targets:
+            queryset = apps.get_model(label).objects.all()
+            if related:
+                # upload_to берет ключ у связанного объекта
+                queryset = queryset.select_related(related)
+            self.stdout.write(f"Relocate {label}.{field_name}")
+            moved, skipped = relocate_files(
+                queryset,
+                field_name,
+                batch_size=options["batch_size"],
+                dry_run=options["dry_run"],
+                on_moved=on_moved,
+            )
+            action = "To move" if options["dry_run"] else "Moved"
+            self.stdout.write(self.style.SUCCESS(f"{action}: {moved}, skipped: {skipped}"))
+        if not options["dry_run"]:
+            self.stdout.write("Run generate_image_variants to rebuild variants of moved product images")
@@ -0,0 +1,52 @@
+import time
+
+from django.core.management import BaseCommand, CommandError
+
+from shopapp.seeding import SEED_BATCH_SIZE, SEED_PASSWORD, SeedPlan, seed
+
+
+class Command(BaseCommand):
+    help = "Generate synthetic users, products, product images metadata and orders for load testing"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=1000)
+        parser.add_argument("--products", type=int, default=10000)
+        parser.add_argument("--orders", type=int, default=50000)
+        parser.add_argument("--images", type=float, default=1.5, help="Mean number of images per product")
+        parser.add_argument("--days", type=int, default=365, help="Spread creation dates over this many days")
+        parser.add_argument("--seed", type=int, default=42)
+        parser.add_argument("--prefix", default="seed", help="Username prefix of generated users")
+        parser.add_argument("--batch-size", type=int, default=SEED_BATCH_SIZE)
+        parser.add_argument("--workers", type=int, default=1, help="Processes generating rows")
+
+    def handle(self, *args, **options):
+        plan = SeedPlan(
+            users=options["users"],
+            products=options["products"],
+            orders=options["orders"],
+            images=options["images"],
+            days=options["days"],
+            seed=options["seed"],
+            prefix=options["prefix"],
+            batch_size=options["batch_size"],
+            workers=options["workers"],
+        )
+        start = time.monotonic()
+        verbosity = options["verbosity"]
+
+        def progress(kind, done, total):
+            if verbosity > 1 or done == total:
+                self.stdout.write(f"{kind}: {done}/{total}")
+
+        try:
+            result = seed(plan, progress=progress)
+        except ValueError as exc:
+            raise CommandError(str(exc))
+        self.stdout.write(self.style.SUCCESS(
+            f"Users: {result.users}, products: {result.products}, images: {result.images}, "
+            f"orders: {result.orders}, links: {result.links} in {time.monotonic() - start:.1f}s"
+        ))
+        self.stdout.write(
+            f"Password of generated users: {SEED_PASSWORD!r}. "
+            f"Run refresh_sales_rollups to include the new orders in sales rollups."
+        )
@@ -1,18 +1,29 @@
-from django.core.management import BaseCommand
+from django.core.management import BaseCommand, CommandError
 
+from shopapp.linking import LINK_BATCH_SIZE, sync_order_products
 from shopapp.models import Order, Product
 
 
 class Command(BaseCommand):
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=LINK_BATCH_SIZE)
+        parser.add_argument("--dry-run", action="store_true", help="Show what would change without writing")
+
     def handle(self, *args, **options):
+        if options["batch_size"] < 1:
+            raise CommandError("--batch-size must be a positive integer")
         order = Order.objects.first()
         if not order:
             self.stdout.write("no order found")
             return
-        products = Product.objects.all()
-        for product in products:
-            order.products.add(product)
-
-        order.save()
+        product_ids = set(Product.objects.values_list("pk", flat=True))
+        result = sync_order_products(
+            {order.pk: product_ids},
+            batch_size=options["batch_size"],
+            dry_run=options["dry_run"],
+        )
 
-        self.stdout.write(self.style.SUCCESS(f"Successfully added products {order.products.all()} to order {order}"))
\ No newline at end of file
+        if options["dry_run"]:
+            self.stdout.write(f"Would add {result.added} products to order {order}")
+            return
+        self.stdout.write(self.style.SUCCESS(f"Successfully added {result.added} products to order {order}"))
@@ -0,0 +1,44 @@
+# Generated by Django 4.2 on 2026-10-18 05:31
+
+from django.db import migrations, models
+
+
+BACKFILL_ORDER_TOTALS = """
+UPDATE shopapp_order SET
+    total_amount = COALESCE((
+        SELECT SUM(p.price)
+        FROM shopapp_order_products op
+        JOIN shopapp_product p ON p.id = op.product_id
+        WHERE op.order_id = shopapp_order.id
+    ), 0),
+    products_count = (
+        SELECT COUNT(*)
+        FROM shopapp_order_products op
+        WHERE op.order_id = shopapp_order.id
+    )
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shopapp', '0013_product_fts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='products_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='total_amount',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=12),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['total_amount', 'id'], name='shopapp_order_total_id_idx'),
+        ),
+        migrations.RunSQL(BACKFILL_ORDER_TOTALS, migrations.RunSQL.noop),
+    ]
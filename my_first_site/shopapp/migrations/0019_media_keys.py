@@ -0,0 +1,55 @@
+# Generated by Django 4.2 on 2026-10-18 05:46
+
+from django.db import migrations, models
+import shopapp.models
+import uuid
+
+
+def fill_media_keys(apps, schema_editor):
+    # default=uuid4 в AddField дал бы всем существующим строкам один и тот же ключ
+    for model_name in ("Product", "Order"):
+        model = apps.get_model("shopapp", model_name)
+        batch = []
+        for obj in model.objects.only("pk").iterator(chunk_size=1000):
+            obj.media_key = uuid.uuid4()
+            batch.append(obj)
+            if len(batch) >= 1000:
+                model.objects.bulk_update(batch, ["media_key"])
+                batch = []
+        model.objects.bulk_update(batch, ["media_key"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shopapp', '0018_image_variants'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='media_key',
+            field=models.UUIDField(null=True, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='media_key',
+            field=models.UUIDField(null=True, editable=False),
+        ),
+        migrations.RunPython(fill_media_keys, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='order',
+            name='media_key',
+            field=models.UUIDField(default=uuid.uuid4, editable=False),
+        ),
+        migrations.AlterField(
+            model_name='product',
+            name='media_key',
+            field=models.UUIDField(default=uuid.uuid4, editable=False),
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='receipt',
+            field=models.FileField(null=True, upload_to=shopapp.models.order_receipt_path),
+        ),
+    ]
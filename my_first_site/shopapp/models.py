@@ -1,13 +1,14 @@
+import uuid
+
 from django.contrib.auth.models import User
 from django.db import models
 from django.urls import reverse
 from django.utils.translation import gettext_lazy as _
 
+from my_first_site.media_paths import sharded_path
+
 def product_preview_directory_path(instance: "Product", filename: str) -> str:
-    return 'products/product_{pk}/preview/{filename}'.format(
-        pk=instance.pk,
-        filename=filename,
-    )
+    return sharded_path("products", instance.media_key, "preview/" + filename)
 
 
 class Product(models.Model):
@@ -21,15 +22,28 @@ class Product(models.Model):
         ordering = ["name", "price"]
         verbose_name = _('Product')
         verbose_name_plural = _('Products')
+        indexes = [
+            models.Index(fields=["name", "id"], name="shopapp_product_name_id_idx"),
+            models.Index(fields=["price", "id"], name="shopapp_product_price_id_idx"),
+            models.Index(fields=["discount", "id"], name="shopapp_product_disc_id_idx"),
+            # keyset-обход для карты сайта: archived=False, по убыванию (created_at, id)
+            models.Index(fields=["archived", "created_at", "id"], name="shopapp_product_sitemap_idx"),
+        ]
 
     name = models.CharField(max_length=100, db_index=True)
     description = models.TextField(null=False, blank=True, db_index=True)
     price = models.DecimalField(default=0, max_digits=8, decimal_places=2)
     discount = models.PositiveSmallIntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
+    # версия для условных GET (ETag/Last-Modified), см. shopapp.conditional
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
     archived = models.BooleanField(default=False)
     created_by = models.ForeignKey(User, on_delete=models.PROTECT)
+    # ключ каталога с файлами товара, известен до сохранения (см. my_first_site.media_paths)
+    media_key = models.UUIDField(default=uuid.uuid4, editable=False)
     preview = models.ImageField(null=True, blank=True, upload_to=product_preview_directory_path)
+    # уменьшенные копии preview, см. shopapp.images
+    preview_variants = models.JSONField(default=dict, blank=True, editable=False)
 
     # @property
     # def description_short(self) -> str:
@@ -45,24 +59,75 @@ class Product(models.Model):
         return reverse("shopapp:product_details", kwargs={"pk": self.pk})
 
 def product_images_directory_path(instance: "ProductImage", filename: str) -> str:
-    return "products/product_{pk}/images/{filename/".format(
-        pk=instance.product.pk,
-        filename=filename,
-    )
+    return sharded_path("products", instance.product.media_key, "images/" + filename)
 
 class ProductImage(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="images")
     image = models.ImageField(upload_to=product_images_directory_path)
     description = models.CharField(max_length=200, null=False, blank=True)
+    variants = models.JSONField(default=dict, blank=True, editable=False)
+
+def order_receipt_path(instance: "Order", filename: str) -> str:
+    return sharded_path("orders", instance.media_key, "receipts/" + filename)
+
 
 class Order(models.Model):
     class Meta:
         verbose_name = _('Order')
         verbose_name_plural = _('Orders')
+        indexes = [
+            models.Index(fields=["created_at", "id"], name="shopapp_order_created_id_idx"),
+            models.Index(fields=["total_amount", "id"], name="shopapp_order_total_id_idx"),
+        ]
     delivery_address = models.TextField(null=True, blank=True)
     promocode = models.CharField(max_length=20, null=False, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
     user = models.ForeignKey(User, on_delete=models.PROTECT)
     products = models.ManyToManyField(Product, related_name="orders")
-    receipt = models.FileField(null=True, upload_to='orders/receipts/')
+    media_key = models.UUIDField(default=uuid.uuid4, editable=False)
+    receipt = models.FileField(null=True, upload_to=order_receipt_path)
+    # денормализованные итоги, см. shopapp.totals
+    total_amount = models.DecimalField(default=0, max_digits=12, decimal_places=2, editable=False)
+    products_count = models.PositiveIntegerField(default=0, editable=False)
+
+
+
+class DailySalesRollup(models.Model):
+    """Продажи за день. Заполняется командой refresh_sales_rollups, см. shopapp.rollups"""
+    class Meta:
+        ordering = ["-date"]
+
+    date = models.DateField(unique=True)
+    orders_count = models.PositiveIntegerField(default=0)
+    items_count = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(default=0, max_digits=14, decimal_places=2)
+
+
+class ProductSalesRollup(models.Model):
+    class Meta:
+        ordering = ["-revenue"]
+
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, related_name="sales_rollup")
+    orders_count = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(default=0, max_digits=14, decimal_places=2)
+    last_order_at = models.DateTimeField(null=True)
+
+
+class UserSalesRollup(models.Model):
+    class Meta:
+        ordering = ["-revenue"]
+
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name="sales_rollup")
+    orders_count = models.PositiveIntegerField(default=0)
+    items_count = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(default=0, max_digits=14, decimal_places=2)
+    first_order_at = models.DateTimeField(null=True)
+    last_order_at = models.DateTimeField(null=True)
+
 
+class RollupWatermark(models.Model):
+    """Последний заказ, уже учтенный в таблицах продаж."""
+    name = models.CharField(max_length=50, unique=True)
+    last_order_id = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
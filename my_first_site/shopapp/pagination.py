@@ -0,0 +1,183 @@
+"""
+Пагинация для API магазина.
+
+По умолчанию используется обычная постраничная пагинация (PageNumberPagination).
+Клиент может включить keyset (cursor) режим параметром ``?pagination=cursor``:
+страницы выбираются по индексу ``(поле сортировки, pk)`` без OFFSET и COUNT(*),
+поэтому глубокие страницы стоят столько же, сколько первая.
+"""
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as BinasciiError
+from datetime import date, datetime
+from collections import OrderedDict
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.filters import OrderingFilter
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Keyset пагинация по одному полю сортировки с pk в качестве tie-breaker.
+
+    Допустимые поля берутся из ``view.keyset_ordering_fields``,
+    поле по умолчанию - из ``view.keyset_default_ordering`` (иначе "pk").
+    Курсор непрозрачен для клиента и содержит значение ключа последней строки.
+    """
+    page_size = api_settings.PAGE_SIZE
+    page_size_query_param = "page_size"
+    max_page_size = 100
+    cursor_query_param = "cursor"
+    ordering_param = OrderingFilter.ordering_param
+    invalid_cursor_message = "Invalid cursor"
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.ordering = self.get_ordering(request, view)
+        field_name = self.ordering.lstrip("-")
+        descending = self.ordering.startswith("-")
+        self.field = queryset.model._meta.pk if field_name == "pk" else queryset.model._meta.get_field(field_name)
+
+        order_by = [self.ordering] if field_name == "pk" else [self.ordering, "-pk" if descending else "pk"]
+        queryset = queryset.order_by(*order_by)
+
+        position = self.decode_cursor(request)
+        if position is not None:
+            queryset = queryset.filter(self.get_keyset_filter(field_name, descending, *position))
+
+        results = list(queryset[:self.page_size + 1])
+        self.has_next = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        return self.page
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def get_ordering(self, request, view):
+        allowed = getattr(view, "keyset_ordering_fields", [])
+        default = getattr(view, "keyset_default_ordering", "pk")
+        ordering = request.query_params.get(self.ordering_param, "").split(",")[0].strip()
+        if ordering.lstrip("-") in allowed or ordering.lstrip("-") == "pk":
+            return ordering
+        return default
+
+    def get_keyset_filter(self, field_name, descending, value, pk):
+        op = "lt" if descending else "gt"
+        if field_name == "pk":
+            return Q(**{f"pk__{op}": pk})
+        return Q(**{f"{field_name}__{op}": value}) | Q(**{field_name: value, f"pk__{op}": pk})
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            data = json.loads(urlsafe_b64decode(encoded.encode("ascii")))
+            if data["o"] != self.ordering:
+                raise NotFound(self.invalid_cursor_message)
+            value = None if data["v"] is None else self.field.to_python(data["v"])
+            return value, int(data["pk"])
+        except (TypeError, ValueError, KeyError, UnicodeError, BinasciiError, DjangoValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, obj):
+        value = getattr(obj, self.field.attname)
+        if isinstance(value, (datetime, date)):
+            value = value.isoformat()
+        elif value is not None:
+            value = str(value)
+        data = json.dumps({"o": self.ordering, "v": value, "pk": obj.pk}, separators=(",", ":"))
+        return urlsafe_b64encode(data.encode("ascii")).decode("ascii")
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return replace_query_param(self.base_url, self.cursor_query_param, self.encode_cursor(self.page[-1]))
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ("next", self.get_next_link()),
+            ("results", data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "required": ["results"],
+            "properties": {
+                "next": {"type": "string", "nullable": True, "format": "uri"},
+                "results": schema,
+            },
+        }
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                "name": self.cursor_query_param,
+                "required": False,
+                "in": "query",
+                "description": "Keyset cursor value returned in `next`",
+                "schema": {"type": "string"},
+            },
+            {
+                "name": self.page_size_query_param,
+                "required": False,
+                "in": "query",
+                "description": "Number of results to return per page",
+                "schema": {"type": "integer"},
+            },
+        ]
+
+
+class OptInKeysetPagination(BasePagination):
+    """
+    Постраничная пагинация, которая переключается в keyset режим
+    по ``?pagination=cursor`` (или при наличии ``cursor`` в запросе).
+    """
+    mode_query_param = "pagination"
+    keyset_class = KeysetPagination
+    page_number_class = PageNumberPagination
+
+    def use_keyset(self, request):
+        return (
+            request.query_params.get(self.mode_query_param) == "cursor"
+            or self.keyset_class.cursor_query_param in request.query_params
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        paginator_class = self.keyset_class if self.use_keyset(request) else self.page_number_class
+        self.paginator = paginator_class()
+        return self.paginator.paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        return self.paginator.get_paginated_response(data)
+
+    def get_paginated_response_schema(self, schema):
+        return self.page_number_class().get_paginated_response_schema(schema)
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                "name": self.mode_query_param,
+                "required": False,
+                "in": "query",
+                "description": "Set to `cursor` to switch to keyset pagination without total count",
+                "schema": {"type": "string", "enum": ["cursor"]},
+            },
+            *self.page_number_class().get_schema_operation_parameters(view),
+            *self.keyset_class().get_schema_operation_parameters(view),
+        ]
@@ -0,0 +1,149 @@
+"""
+Инкрементальные сводные таблицы продаж (по дням, товарам и покупателям).
+
+refresh_sales_rollups обрабатывает только заказы с pk больше сохраненного
+watermark, порциями по batch_size, каждая порция - в своей транзакции.
+Заказ учитывается один раз, с составом и ценами на момент обработки;
+если старые заказы менялись, сводки пересобираются с нуля (full=True).
+
+Порядок pk не совпадает с порядком коммитов: заказ с меньшим pk из более
+долгой транзакции может стать видимым уже после заказа с большим pk и
+оказаться ниже watermark. Поэтому обработка останавливается на первом
+заказе моложе lag (ROLLUP_SAFETY_LAG): такие заказы и все следующие за ними
+ждут следующего запуска. lag должен быть больше самой долгой транзакции,
+создающей заказы; заказы из более долгих транзакций (например, импорт с
+заданной датой создания) учитываются только пересборкой с full=True.
+"""
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import DailySalesRollup, Order, ProductSalesRollup, RollupWatermark, UserSalesRollup
+
+SALES_WATERMARK = "sales"
+ROLLUP_BATCH_SIZE = 1000
+ROLLUP_SAFETY_LAG = timedelta(minutes=5)
+
+
+def _counter():
+    return {"orders_count": 0, "items_count": 0, "revenue": Decimal("0")}
+
+
+def _merge(model, key_field: str, deltas: dict, extra=None):
+    """
+    Прибавляет deltas к строкам сводки: существующие строки читаются одним
+    запросом и сохраняются bulk_update, недостающие создаются bulk_create.
+    """
+    existing = model.objects.in_bulk(list(deltas), field_name=key_field)
+    to_update, to_create = [], []
+    for key, delta in deltas.items():
+        row = existing.get(key)
+        if row is None:
+            row = model(**{key_field: key})
+            to_create.append(row)
+        else:
+            to_update.append(row)
+        for name, value in delta.items():
+            if name in ("orders_count", "items_count", "revenue"):
+                setattr(row, name, getattr(row, name) + value)
+        if extra:
+            extra(row, delta)
+    fields = [name for name in next(iter(deltas.values())) if hasattr(model, name)]
+    model.objects.bulk_update(to_update, fields)
+    model.objects.bulk_create(to_create)
+
+
+def _merge_dates(row, delta):
+    first, last = delta.get("first_order_at"), delta.get("last_order_at")
+    if first and hasattr(row, "first_order_at") and (row.first_order_at is None or first < row.first_order_at):
+        row.first_order_at = first
+    if last and (row.last_order_at is None or last > row.last_order_at):
+        row.last_order_at = last
+
+
+def _process_batch(watermark: RollupWatermark, batch_size: int, cutoff) -> int:
+    orders = list(
+        Order.objects
+        .filter(pk__gt=watermark.last_order_id)
+        .order_by("pk")
+        .values("id", "created_at", "user_id", "total_amount", "products_count")[:batch_size]
+    )
+    for index, order in enumerate(orders):
+        if order["created_at"] >= cutoff:
+            # дальше могут быть видны не все заказы: ждем следующего запуска
+            del orders[index:]
+            break
+    if not orders:
+        return 0
+
+    daily = defaultdict(_counter)
+    users = defaultdict(lambda: {**_counter(), "first_order_at": None, "last_order_at": None})
+    products = defaultdict(lambda: {"orders_count": 0, "revenue": Decimal("0"), "last_order_at": None})
+    created = {}
+
+    for order in orders:
+        created[order["id"]] = order["created_at"]
+        day = daily[timezone.localdate(order["created_at"])]
+        user = users[order["user_id"]]
+        for counter in (day, user):
+            counter["orders_count"] += 1
+            counter["items_count"] += order["products_count"]
+            counter["revenue"] += order["total_amount"]
+        if user["first_order_at"] is None or order["created_at"] < user["first_order_at"]:
+            user["first_order_at"] = order["created_at"]
+        if user["last_order_at"] is None or order["created_at"] > user["last_order_at"]:
+            user["last_order_at"] = order["created_at"]
+
+    links = (
+        Order.products.through.objects
+        .filter(order_id__in=list(created))
+        .values_list("order_id", "product_id", "product__price")
+    )
+    for order_id, product_id, price in links:
+        product = products[product_id]
+        product["orders_count"] += 1
+        product["revenue"] += price
+        if product["last_order_at"] is None or created[order_id] > product["last_order_at"]:
+            product["last_order_at"] = created[order_id]
+
+    _merge(DailySalesRollup, "date", daily)
+    _merge(UserSalesRollup, "user_id", users, extra=_merge_dates)
+    if products:
+        _merge(ProductSalesRollup, "product_id", products, extra=_merge_dates)
+
+    watermark.last_order_id = orders[-1]["id"]
+    watermark.save(update_fields=["last_order_id", "updated_at"])
+    return len(orders)
+
+
+def reset_sales_rollups():
+    with transaction.atomic():
+        DailySalesRollup.objects.all().delete()
+        ProductSalesRollup.objects.all().delete()
+        UserSalesRollup.objects.all().delete()
+        RollupWatermark.objects.filter(name=SALES_WATERMARK).delete()
+
+
+def refresh_sales_rollups(
+    batch_size: int = ROLLUP_BATCH_SIZE,
+    full: bool = False,
+    lag: timedelta = ROLLUP_SAFETY_LAG,
+) -> int:
+    """
+    Учитывает в сводках новые заказы старше lag. Возвращает число
+    обработанных заказов.
+    """
+    if full:
+        reset_sales_rollups()
+    cutoff = timezone.now() - lag
+    processed = 0
+    while True:
+        with transaction.atomic():
+            watermark, _ = RollupWatermark.objects.select_for_update().get_or_create(name=SALES_WATERMARK)
+            count = _process_batch(watermark, batch_size, cutoff)
+        if not count:
+            return processed
+        processed += count
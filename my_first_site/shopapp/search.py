@@ -0,0 +1,127 @@
+"""
+Полнотекстовый поиск по товарам.
+
+На SQLite используется виртуальная таблица FTS5 с external content
+(``shopapp_product_fts``), которую синхронизируют триггеры на ``shopapp_product``.
+Триггеры ставятся миграцией и проверяются после каждого migrate: SQLite
+пересоздает таблицу при изменении схемы, и триггеры при этом пропадают.
+На других СУБД фильтр откатывается к обычному SearchFilter (icontains).
+"""
+from django.db import connections
+from django.db.models.expressions import RawSQL
+from rest_framework.filters import SearchFilter
+
+FTS_TABLE = "shopapp_product_fts"
+PRODUCT_TABLE = "shopapp_product"
+
+FTS_TRIGGERS = {
+    f"{FTS_TABLE}_ai": f"""
+        CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON {PRODUCT_TABLE} BEGIN
+            INSERT INTO {FTS_TABLE}(rowid, name, description) VALUES (new.id, new.name, new.description);
+        END
+    """,
+    f"{FTS_TABLE}_ad": f"""
+        CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON {PRODUCT_TABLE} BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, description)
+            VALUES ('delete', old.id, old.name, old.description);
+        END
+    """,
+    f"{FTS_TABLE}_au": f"""
+        CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF name, description ON {PRODUCT_TABLE} BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, description)
+            VALUES ('delete', old.id, old.name, old.description);
+            INSERT INTO {FTS_TABLE}(rowid, name, description) VALUES (new.id, new.name, new.description);
+        END
+    """,
+}
+
+_fts_enabled = {}
+
+
+def fts_supported(connection) -> bool:
+    if connection.vendor != "sqlite":
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+        return bool(cursor.fetchone()[0])
+
+
+def install_product_fts(connection):
+    """Создает FTS таблицу и триггеры, если их нет. Безопасно вызывать повторно."""
+    if not fts_supported(connection):
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT name FROM sqlite_master WHERE name = %s OR name IN (%s, %s, %s)",
+            [FTS_TABLE, *FTS_TRIGGERS],
+        )
+        existing = {row[0] for row in cursor.fetchall()}
+        if existing == {FTS_TABLE, *FTS_TRIGGERS}:
+            return
+        cursor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+            f"name, description, content='{PRODUCT_TABLE}', content_rowid='id', "
+            f"tokenize='unicode61 remove_diacritics 2')"
+        )
+        for sql in FTS_TRIGGERS.values():
+            cursor.execute(sql)
+        cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+    _fts_enabled.pop(connection.alias, None)
+
+
+def uninstall_product_fts(connection):
+    if connection.vendor != "sqlite":
+        return
+    with connection.cursor() as cursor:
+        for name in FTS_TRIGGERS:
+            cursor.execute(f"DROP TRIGGER IF EXISTS {name}")
+        cursor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+    _fts_enabled.pop(connection.alias, None)
+
+
+def fts_enabled(connection) -> bool:
+    if connection.alias not in _fts_enabled:
+        _fts_enabled[connection.alias] = (
+            connection.vendor == "sqlite"
+            and FTS_TABLE in connection.introspection.table_names(include_views=True)
+        )
+    return _fts_enabled[connection.alias]
+
+
+def build_match_query(terms) -> str:
+    """Каждый термин - префиксная фраза FTS5, термины объединяются через AND."""
+    return " ".join(
+        '"{}"*'.format(term.replace('"', '""'))
+        for term in terms
+    )
+
+
+class ProductSearchFilter(SearchFilter):
+    """
+    Поиск товаров по FTS индексу с сортировкой по релевантности (bm25).
+
+    Если явно задан ``?ordering=``, его применит OrderingFilter после этого фильтра.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        search_terms = self.get_search_terms(request)
+        connection = connections[queryset.db]
+        if not search_terms or not fts_enabled(connection):
+            return super().filter_queryset(request, queryset, view)
+
+        match = build_match_query(search_terms)
+        matched_ids = RawSQL(
+            f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s",
+            [match],
+        )
+        rank = RawSQL(
+            f"SELECT bm25({FTS_TABLE}) FROM {FTS_TABLE} "
+            f"WHERE {FTS_TABLE} MATCH %s AND rowid = {PRODUCT_TABLE}.id",
+            [match],
+        )
+        return (
+            queryset
+            .filter(pk__in=matched_ids)
+            .annotate(search_rank=rank)
+            .order_by("search_rank", "pk")
+        )
@@ -0,0 +1,304 @@
+"""
+Генерация синтетических данных магазина в объемах, близких к рабочим.
+
+Строки генерируются порциями; порция k каждого вида данных строится
+от своего генератора random.Random("<seed>:<вид>:<k>"), а первичные ключи
+назначаются заранее (следующие после текущего максимума), поэтому
+результат зависит только от seed и размера порции, но не от числа процессов.
+
+Генераторы сразу отдают значения, подготовленные для базы
+(get_db_prep_save), и с workers > 1 эта работа идет в пуле процессов.
+Основной процесс только пишет готовые строки через executemany, минуя
+сборку моделей и компиляцию INSERT в ORM; каждая порция - в своей транзакции
+(SQLite все равно допускает одного писателя). Сигналы при этом не
+отправляются: итоги заказов, полнотекстовый индекс и кеш обновляются здесь же.
+
+Распределения:
+- популярность товаров и активность покупателей - степенные (немного
+  товаров попадает в большую часть заказов, немного покупателей делает
+  большую часть заказов);
+- цены - логнормальные, размер заказа - геометрический (в среднем около двух товаров);
+- даты создания равномерны за последние days дней.
+"""
+import math
+import random
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timezone as dt_timezone
+from decimal import Decimal
+from multiprocessing import Pool
+
+import django
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.color import no_style
+from django.db import DEFAULT_DB_ALIAS, connection, connections, transaction
+from django.utils import timezone
+
+from my_first_site.media_paths import sharded_path
+from .cache import PRODUCTS_GENERATION, bump_generation
+from .models import Order, Product, ProductImage
+from .search import fts_enabled, install_product_fts, uninstall_product_fts
+from .totals import refresh_order_totals
+
+SEED_BATCH_SIZE = 5000
+SEED_PASSWORD = "seed"
+
+PRODUCT_POPULARITY_SKEW = 3.0
+CUSTOMER_ACTIVITY_SKEW = 2.0
+ORDER_SIZE_CONTINUE = 0.45
+ORDER_MAX_PRODUCTS = 20
+PRICE_LOG_MEAN = math.log(2500)
+PRICE_LOG_SIGMA = 1.0
+MAX_PRICE_CENTS = 99999999
+ARCHIVED_SHARE = 0.05
+IMAGES_MAX_PER_PRODUCT = 8
+
+ADJECTIVES = ("Compact", "Classic", "Smart", "Wireless", "Premium", "Eco", "Portable", "Pro", "Mini", "Ultra")
+NOUNS = ("Laptop", "Phone", "Chair", "Lamp", "Desk", "Kettle", "Speaker", "Monitor", "Backpack", "Camera")
+STREETS = ("ul Lesnaya", "ul Sadovaya", "ul Novaya", "pr Mira", "ul Polevaya", "ul Shkolnaya")
+PROMOCODES = ("", "", "", "", "promo5", "sale10", "welcome")
+DISCOUNTS = (0, 0, 0, 0, 5, 10, 15, 20)
+
+
+@dataclass
+class SeedPlan:
+    users: int
+    products: int
+    orders: int
+    images: float = 1.5
+    days: int = 365
+    seed: int = 42
+    prefix: str = "seed"
+    batch_size: int = SEED_BATCH_SIZE
+    workers: int = 1
+
+
+@dataclass
+class SeedResult:
+    users: int = 0
+    products: int = 0
+    images: int = 0
+    orders: int = 0
+    links: int = 0
+
+
+@dataclass
+class _Context:
+    """Общие для всех порций значения: момент запуска и первые pk новых строк."""
+    now: float
+    password: str
+    first_user: int
+    first_product: int
+    first_order: int
+
+
+def _rng(seed: int, kind: str, chunk: int) -> random.Random:
+    return random.Random(f"{seed}:{kind}:{chunk}")
+
+
+def _skewed(rnd: random.Random, size: int, skew: float) -> int:
+    # индекс со степенным распределением: малые индексы выпадают чаще
+    return min(size - 1, int(size * rnd.random() ** skew))
+
+
+def _moment(rnd: random.Random, now: float, days: int) -> datetime:
+    return datetime.fromtimestamp(now - rnd.random() * days * 86400, tz=dt_timezone.utc)
+
+
+def _media_key(rnd: random.Random) -> uuid.UUID:
+    return uuid.UUID(int=rnd.getrandbits(128), version=4)
+
+
+def _fields(model, with_pk: bool = True) -> list:
+    return [field for field in model._meta.concrete_fields if with_pk or not field.primary_key]
+
+
+class _Rows:
+    """Строки одной таблицы: значения полей по attname, недостающие берутся из default."""
+    # такие значения база принимает как есть, get_db_prep_save для них не нужен
+    NATIVE_TYPES = (int, str, type(None))
+
+    def __init__(self, model, with_pk: bool = True):
+        # само соединение, а не прокси django.db.connection: тот ищет его на каждое обращение
+        self.connection = connections[DEFAULT_DB_ALIAS]
+        self.fields = [(field.attname, field.get_db_prep_save) for field in _fields(model, with_pk)]
+        self.defaults = {field.attname: field.get_default() for field in _fields(model, with_pk)}
+        self.rows = []
+
+    def add(self, **values):
+        row = []
+        for attname, prepare in self.fields:
+            value = values.get(attname, self.defaults[attname])
+            row.append(value if isinstance(value, self.NATIVE_TYPES) else prepare(value, self.connection))
+        self.rows.append(tuple(row))
+
+
+def generate_users(task) -> dict:
+    plan, chunk, start, count, context = task
+    rnd = _rng(plan.seed, "users", chunk)
+    users = _Rows(User)
+    for index in range(start, start + count):
+        users.add(
+            id=context.first_user + index,
+            username=f"{plan.prefix}_{index}",
+            email=f"{plan.prefix}_{index}@example.com",
+            password=context.password,
+            date_joined=_moment(rnd, context.now, plan.days),
+        )
+    return {"users": users.rows}
+
+
+def generate_products(task) -> dict:
+    plan, chunk, start, count, context = task
+    rnd = _rng(plan.seed, "products", chunk)
+    products = _Rows(Product)
+    images = _Rows(ProductImage, with_pk=False)
+    for index in range(start, start + count):
+        pk = context.first_product + index
+        name = f"{rnd.choice(ADJECTIVES)} {rnd.choice(NOUNS)} {index}"
+        created_at = _moment(rnd, context.now, plan.days)
+        media_key = _media_key(rnd)
+        products.add(
+            id=pk,
+            name=name,
+            description=f"{name}: synthetic product for load testing",
+            price=Decimal(min(MAX_PRICE_CENTS, max(1, int(rnd.lognormvariate(PRICE_LOG_MEAN, PRICE_LOG_SIGMA))))) / 100,
+            discount=rnd.choice(DISCOUNTS),
+            archived=rnd.random() < ARCHIVED_SHARE,
+            created_by_id=context.first_user + rnd.randrange(plan.users),
+            created_at=created_at,
+            updated_at=created_at,
+            media_key=media_key,
+        )
+        # только метаданные: файлов картинок нет
+        photos = min(IMAGES_MAX_PER_PRODUCT, int(rnd.expovariate(1 / plan.images))) if plan.images else 0
+        for number in range(photos):
+            images.add(
+                product_id=pk,
+                image=sharded_path("products", media_key, f"images/seed-{number}.jpg"),
+                description=f"{name}, photo {number + 1}",
+            )
+    return {"products": products.rows, "images": images.rows}
+
+
+def generate_orders(task) -> dict:
+    plan, chunk, start, count, context = task
+    rnd = _rng(plan.seed, "orders", chunk)
+    orders = _Rows(Order)
+    links = _Rows(Order.products.through, with_pk=False)
+    for index in range(start, start + count):
+        pk = context.first_order + index
+        created_at = _moment(rnd, context.now, plan.days)
+        orders.add(
+            id=pk,
+            user_id=context.first_user + _skewed(rnd, plan.users, CUSTOMER_ACTIVITY_SKEW),
+            delivery_address=f"{rnd.choice(STREETS)}, d {rnd.randint(1, 200)}",
+            promocode=rnd.choice(PROMOCODES),
+            created_at=created_at,
+            updated_at=created_at,
+            media_key=_media_key(rnd),
+        )
+        size = 1
+        while size < min(ORDER_MAX_PRODUCTS, plan.products) and rnd.random() < ORDER_SIZE_CONTINUE:
+            size += 1
+        products = set()
+        while len(products) < size:
+            products.add(_skewed(rnd, plan.products, PRODUCT_POPULARITY_SKEW))
+        for product in sorted(products):
+            links.add(order_id=pk, product_id=context.first_product + product)
+    return {"orders": orders.rows, "links": links.rows}
+
+
+def _tasks(plan: SeedPlan, total: int, context: _Context) -> list:
+    return [
+        (plan, chunk, start, min(plan.batch_size, total - start), context)
+        for chunk, start in enumerate(range(0, total, plan.batch_size))
+    ]
+
+
+def _insert_sql(model, with_pk: bool) -> str:
+    quote = connection.ops.quote_name
+    fields = _fields(model, with_pk)
+    return "INSERT INTO {} ({}) VALUES ({})".format(
+        quote(model._meta.db_table),
+        ", ".join(quote(field.column) for field in fields),
+        ", ".join(["%s"] * len(fields)),
+    )
+
+
+def _next_pk(model) -> int:
+    return (model.objects.order_by("-pk").values_list("pk", flat=True).first() or 0) + 1
+
+
+def seed(plan: SeedPlan, progress=None) -> SeedResult:
+    """
+    Создает plan.users пользователей, plan.products товаров с метаданными
+    картинок (файлы не создаются) и plan.orders заказов со связями.
+
+    progress(вид, сделано, всего) вызывается после каждой порции.
+    """
+    if plan.users < 1 and (plan.products or plan.orders):
+        raise ValueError("Products and orders need at least one user")
+    if plan.products < 1 and plan.orders:
+        raise ValueError("Orders need at least one product")
+    if User.objects.filter(username__startswith=f"{plan.prefix}_").exists():
+        raise ValueError(f"Users with prefix {plan.prefix!r} already exist, choose another prefix")
+
+    progress = progress or (lambda kind, done, total: None)
+    context = _Context(
+        now=timezone.now().timestamp(),
+        password=make_password(SEED_PASSWORD),
+        first_user=_next_pk(User),
+        first_product=_next_pk(Product),
+        first_order=_next_pk(Order),
+    )
+    # ключи совпадают с полями SeedResult и с ключами, которые отдают генераторы
+    statements = {
+        "users": _insert_sql(User, with_pk=True),
+        "products": _insert_sql(Product, with_pk=True),
+        "images": _insert_sql(ProductImage, with_pk=False),
+        "orders": _insert_sql(Order, with_pk=True),
+        "links": _insert_sql(Order.products.through, with_pk=False),
+    }
+    result = SeedResult()
+
+    pool = Pool(plan.workers, initializer=django.setup) if plan.workers > 1 else None
+    generate = pool.imap if pool else map
+    # на большой вставке дешевле перестроить полнотекстовый индекс целиком, чем вести его триггерами
+    rebuild_fts = fts_enabled(connection) and plan.products > Product.objects.count()
+    if rebuild_fts:
+        uninstall_product_fts(connection)
+    try:
+        for kind, generator, total in (
+            ("users", generate_users, plan.users),
+            ("products", generate_products, plan.products),
+            ("orders", generate_orders, plan.orders),
+        ):
+            for tables in generate(generator, _tasks(plan, total, context)):
+                with transaction.atomic(), connection.cursor() as cursor:
+                    for table, rows in tables.items():
+                        if rows:
+                            cursor.executemany(statements[table], rows)
+                        setattr(result, table, getattr(result, table) + len(rows))
+                    if "orders" in tables:
+                        # m2m_changed не отправлялся: итоги заказов порции считаем сами
+                        last = context.first_order + result.orders - 1
+                        refresh_order_totals(
+                            Order.objects.filter(pk__range=(last - len(tables["orders"]) + 1, last)),
+                            touch=False,
+                        )
+                progress(kind, getattr(result, kind), total)
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+        if rebuild_fts:
+            install_product_fts(connection)
+
+    # pk назначены явно: счетчики последовательностей (там, где они есть) сдвигаем за них
+    with connection.cursor() as cursor:
+        for sql in connection.ops.sequence_reset_sql(no_style(), [User, Product, Order]):
+            cursor.execute(sql)
+    bump_generation(PRODUCTS_GENERATION)
+    return result
@@ -1,6 +1,6 @@
 from rest_framework import serializers
 
-from .models import Product, Order
+from .models import Product, Order, DailySalesRollup, ProductSalesRollup, UserSalesRollup
 
 class ProductSerializer(serializers.ModelSerializer):
     class Meta:
@@ -27,4 +27,45 @@ class OrderSerializer(serializers.ModelSerializer):
             "user",
             "products",
             "receipt",
+            "total_amount",
+            "products_count",
+        )
+        read_only_fields = (
+            "total_amount",
+            "products_count",
+        )
+
+
+class DailySalesRollupSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = DailySalesRollup
+        fields = (
+            "date",
+            "orders_count",
+            "items_count",
+            "revenue",
+        )
+
+
+class ProductSalesRollupSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ProductSalesRollup
+        fields = (
+            "product",
+            "orders_count",
+            "revenue",
+            "last_order_at",
+        )
+
+
+class UserSalesRollupSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = UserSalesRollup
+        fields = (
+            "user",
+            "orders_count",
+            "items_count",
+            "revenue",
+            "first_order_at",
+            "last_order_at",
         )
@@ -0,0 +1,121 @@
+from django.db import connections
+from django.db.models.signals import m2m_changed, post_delete, post_migrate, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from requestdataapp.storage import track_file_references
+
+from . import images
+from .cache import PRODUCTS_GENERATION, bump_generation_on_commit, user_orders_generation
+from .models import Order, Product, ProductImage
+from .search import install_product_fts
+from .totals import refresh_totals_for_orders, refresh_totals_for_products
+
+
+@receiver(post_migrate)
+def ensure_product_fts(sender, using, **kwargs):
+    # SQLite пересоздает таблицу при изменении схемы и теряет триггеры FTS
+    if sender.name == "shopapp":
+        install_product_fts(connections[using])
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidate_products_cache(sender, **kwargs):
+    bump_generation_on_commit(PRODUCTS_GENERATION)
+
+
+@receiver(pre_save, sender=Order)
+def remember_previous_order_user(sender, instance: Order, update_fields=None, **kwargs):
+    if instance.pk is None or (update_fields is not None and "user" not in update_fields):
+        return
+    instance._previous_user_id = (
+        Order.objects.filter(pk=instance.pk).values_list("user_id", flat=True).first()
+    )
+
+
+@receiver(post_save, sender=Order)
+@receiver(post_delete, sender=Order)
+def invalidate_user_orders_cache(sender, instance: Order, **kwargs):
+    user_ids = {instance.user_id, getattr(instance, "_previous_user_id", None)} - {None}
+    bump_generation_on_commit(*(user_orders_generation(user_id) for user_id in user_ids))
+
+
+@receiver(m2m_changed, sender=Order.products.through)
+def invalidate_user_orders_cache_on_products(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse and action in ("post_add", "post_remove", "post_clear"):
+        user_ids = {instance.user_id}
+    elif reverse and action in ("post_add", "post_remove") and pk_set:
+        user_ids = set(Order.objects.filter(pk__in=pk_set).values_list("user_id", flat=True))
+    elif reverse and action == "pre_clear":
+        # после clear связей уже нет, поэтому заказы товара ищем до очистки
+        user_ids = set(instance.orders.values_list("user_id", flat=True))
+    else:
+        return
+    bump_generation_on_commit(*(user_orders_generation(user_id) for user_id in user_ids))
+
+
+@receiver(m2m_changed, sender=Order.products.through)
+def refresh_order_totals_on_products(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse and action in ("post_add", "post_remove", "post_clear"):
+        refresh_totals_for_orders([instance.pk])
+    elif reverse and action in ("post_add", "post_remove") and pk_set:
+        refresh_totals_for_orders(pk_set)
+    elif reverse and action == "pre_clear":
+        instance._cleared_order_ids = list(instance.orders.values_list("pk", flat=True))
+    elif reverse and action == "post_clear":
+        refresh_totals_for_orders(getattr(instance, "_cleared_order_ids", []))
+
+
+@receiver(pre_save, sender=Product)
+def remember_previous_product_price(sender, instance: Product, update_fields=None, **kwargs):
+    if instance.pk is None or (update_fields is not None and "price" not in update_fields):
+        return
+    instance._previous_price = (
+        Product.objects.filter(pk=instance.pk).values_list("price", flat=True).first()
+    )
+
+
+@receiver(post_save, sender=Product)
+def refresh_order_totals_on_price(sender, instance: Product, created, **kwargs):
+    previous = getattr(instance, "_previous_price", None)
+    if not created and previous is not None and previous != instance.price:
+        refresh_totals_for_products([instance.pk])
+
+
+@receiver(pre_delete, sender=Product)
+def remember_product_orders(sender, instance: Product, **kwargs):
+    # связи удаляются каскадом без m2m_changed
+    instance._orders = list(instance.orders.values_list("pk", "user_id"))
+
+
+@receiver(post_delete, sender=Product)
+def refresh_order_totals_on_delete(sender, instance: Product, **kwargs):
+    orders = getattr(instance, "_orders", [])
+    refresh_totals_for_orders(order_id for order_id, _ in orders)
+    bump_generation_on_commit(*{user_orders_generation(user_id) for _, user_id in orders})
+
+
+@receiver(post_save, sender=Product)
+def schedule_preview_variants(sender, instance: Product, raw=False, **kwargs):
+    if not raw and images.needs_variants(instance.preview.name, instance.preview_variants):
+        images.schedule(images.process_product_preview, instance.pk)
+
+
+@receiver(post_save, sender=ProductImage)
+def schedule_image_variants(sender, instance: ProductImage, raw=False, **kwargs):
+    if not raw and images.needs_variants(instance.image.name, instance.variants):
+        images.schedule(images.process_product_image, instance.pk)
+
+
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+def touch_product_on_image_change(sender, instance: ProductImage, **kwargs):
+    # картинки входят в представление товара: сдвигаем его версию для ETag
+    Product.objects.filter(pk=instance.product_id).update(updated_at=timezone.now())
+
+
+# ссылки на файлы в хранилище с подсчетом ссылок (requestdataapp.storage)
+track_file_references(Product, "preview", extra_names=lambda product: images.variant_names(product.preview_variants))
+track_file_references(ProductImage, "image", extra_names=lambda image: images.variant_names(image.variants))
+track_file_references(Order, "receipt")
@@ -1,15 +1,15 @@
-from django.contrib.sitemaps import Sitemap
-from django.urls import reverse
+from my_first_site.sitemap_tools import KeysetSitemap
 
 from .models import Product
 
 
-class ShopSitemap(Sitemap):
-    chagefreq = "never"
+class ShopSitemap(KeysetSitemap):
+    changefreq = "never"
     priority = 0.5
+    date_field = "created_at"
 
-    def items(self):
-        return (Product.objects.order_by("-created_at"))
+    def get_queryset(self):
+        return Product.objects.filter(archived=False).only("pk", "created_at", "updated_at")
 
     def lastmod(self, obj: Product):
-        return obj.created_at
+        return obj.updated_at
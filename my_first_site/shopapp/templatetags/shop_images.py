@@ -0,0 +1,46 @@
+from django import template
+from django.core.files.storage import default_storage
+from django.utils.html import format_html, format_html_join
+
+from ..images import needs_variants
+
+register = template.Library()
+
+
+@register.filter
+def srcset(variants: dict, key: str = "jpeg") -> str:
+    """"url 160w, url 320w, ..." для копий одного формата из shopapp.images."""
+    widths = (variants or {}).get(key, {})
+    return ", ".join(
+        f"{default_storage.url(name)} {width}w"
+        for width, name in sorted(widths.items(), key=lambda item: int(item[0]))
+    )
+
+
+@register.simple_tag
+def responsive_image(field, variants: dict, alt: str = "", sizes: str = "100vw"):
+    """
+    <picture> с WebP и JPEG копиями; пока копий нет или они построены из
+    прежнего файла - обычный <img> с исходным файлом.
+    """
+    if not field:
+        return ""
+    if needs_variants(field.name, variants) or not variants.get("jpeg"):
+        return format_html('<img src="{}" alt="{}" loading="lazy">', field.url, alt)
+    jpeg = variants["jpeg"]
+    fallback = jpeg[max(jpeg, key=int)]
+    sources = format_html_join(
+        "",
+        '<source type="{}" srcset="{}" sizes="{}">',
+        [
+            (content_type, srcset(variants, key), sizes)
+            for key, content_type in (("webp", "image/webp"), ("jpeg", "image/jpeg"))
+            if variants.get(key)
+        ],
+    )
+    return format_html(
+        '<picture>{}<img src="{}" alt="{}" loading="lazy"></picture>',
+        sources,
+        default_storage.url(fallback),
+        alt,
+    )
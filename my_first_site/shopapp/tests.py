@@ -1,11 +1,52 @@
-from django.contrib.auth.models import User, Permission
-from django.test import TestCase
+import asyncio
+from django.contrib.auth.models import Group, User, Permission
+from django.test import RequestFactory, TestCase, override_settings
 from django.urls import reverse
+import gzip
+import json
+from csv import DictReader
+from datetime import timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
 from string import ascii_letters
 from random import choices
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest import mock
+from PIL import Image
 from django.conf import settings
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.http import HttpResponse
+from django.db import IntegrityError, connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone, translation
 
-from shopapp.models import Product, Order
+from requestdataapp.models import StoredBlob
+from requestdataapp.queries import QueryBudgetTestMixin
+from shopapp.benchmarks import compare, default_scenarios, run_benchmarks, seed_dataset
+from shopapp.cache import (
+    PRODUCTS_GENERATION,
+    aget_or_compute,
+    aswr_cache_page,
+    bump_generation,
+    get_generation,
+    get_or_compute,
+    swr_cache_page,
+    user_orders_generation,
+)
+from shopapp.conditional import product_aconditional
+from shopapp.common import save_csv_orders, save_csv_products
+from shopapp.models import Product, Order, ProductImage, DailySalesRollup, ProductSalesRollup, UserSalesRollup
+from shopapp.seeding import SeedPlan, seed
+from shopapp.totals import stale_orders
+from shopapp.images import save_product_images, variant_names
+from shopapp.linking import sync_order_products
+from shopapp.rollups import refresh_sales_rollups
+from shopapp.sitemap import ShopSitemap
+from shopapp.templatetags.shop_images import responsive_image
 from shopapp.utils import add_two_numbers
 
 
@@ -174,5 +215,1105 @@ class OrdersExportTestCase(TestCase):
             }
             for order in orders
         ]
-        orders_data = response.json()
+        orders_data = json.loads(b"".join(response.streaming_content))
         self.assertEqual(orders_data["orders"], expected_data)
+
+    def test_get_orders_view_ndjson_filtered(self):
+        response = self.client.get(
+            reverse("shopapp:orders_export"),
+            {"format": "ndjson", "created_after": "2023-04-15", "user": "1"},
+        )
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual([json.loads(line)["id"] for line in lines], [2])
+
+    def test_get_orders_view_invalid_filter(self):
+        response = self.client.get(reverse("shopapp:orders_export"), {"created_after": "yesterday"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_get_orders_view_query_count(self):
+        # сессия + пользователь + 4 запроса на порцию заказов + пустая последняя порция
+        with self.assertNumQueries(7):
+            response = self.client.get(reverse("shopapp:orders_export"))
+            b"".join(response.streaming_content)
+
+
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+class ProductApiKeysetPaginationTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username="keyset_user", password="qwerty")
+        Product.objects.bulk_create([
+            Product(name=f"Product {i % 5}", price=i, created_by=cls.user)
+            for i in range(23)
+        ])
+
+    def walk_pages(self, ordering):
+        url = reverse("shopapp:product-list") + f"?pagination=cursor&ordering={ordering}&page_size=10"
+        seen = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            data = response.json()
+            self.assertNotIn("count", data)
+            seen.extend(item["pk"] for item in data["results"])
+            url = data["next"]
+        return seen
+
+    def test_walk_all_pages_by_name(self):
+        expected = list(Product.objects.order_by("name", "pk").values_list("pk", flat=True))
+        self.assertEqual(self.walk_pages("name"), expected)
+
+    def test_walk_all_pages_by_price_desc(self):
+        expected = list(Product.objects.order_by("-price", "-pk").values_list("pk", flat=True))
+        self.assertEqual(self.walk_pages("-price"), expected)
+
+    def test_invalid_cursor(self):
+        response = self.client.get(reverse("shopapp:product-list"), {"cursor": "garbage"})
+        self.assertEqual(response.status_code, 404)
+
+    def test_page_number_is_default(self):
+        response = self.client.get(reverse("shopapp:product-list"))
+        self.assertEqual(response.json()["count"], 23)
+
+
+class ProductCSVDownloadTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username="csv_user", password="qwerty")
+        Product.objects.bulk_create([
+            Product(name=f"Product {i}", description="csv", price=i, created_by=cls.user)
+            for i in range(5)
+        ])
+
+    def test_download_csv_streams_rows(self):
+        response = self.client.get(reverse("shopapp:product-download-csv"))
+        self.assertTrue(response.streaming)
+        rows = list(DictReader(StringIO(b"".join(response.streaming_content).decode())))
+        self.assertEqual(len(rows), 5)
+        self.assertEqual(set(rows[0]), {"name", "description", "price", "discount"})
+
+    def test_download_csv_gzip(self):
+        response = self.client.get(reverse("shopapp:product-download-csv"), {"gzip": "1"})
+        self.assertEqual(response["Content-Type"], "application/gzip")
+        content = gzip.decompress(b"".join(response.streaming_content)).decode()
+        self.assertEqual(len(content.splitlines()), 6)
+
+
+class SaveCSVProductsTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username="import_user", password="qwerty")
+
+    def import_csv(self, content, **kwargs):
+        return save_csv_products(BytesIO(content.encode()), encoding="utf-8", created_by=self.user, **kwargs)
+
+    def test_import_in_batches(self):
+        rows = "".join(f"Product {i},desc,{i}.50,{i % 10}\n" for i in range(25))
+        summary = self.import_csv("name,description,price,discount\n" + rows, batch_size=10)
+        self.assertTrue(summary.ok)
+        self.assertEqual(summary.imported, 25)
+        self.assertEqual(summary.batches, 3)
+        self.assertEqual(Product.objects.get(name="Product 3").price, Decimal("3.50"))
+
+    def test_invalid_rows_reported(self):
+        summary = self.import_csv("name,price,discount\nGood,10,1\nBad,abc,1\nNegative,1,-5\n")
+        self.assertEqual(summary.imported, 1)
+        self.assertEqual([error["line"] for error in summary.errors], [3, 4])
+
+    def test_upsert_by_id(self):
+        product = Product.objects.create(name="Old name", price=1, created_by=self.user)
+        summary = self.import_csv(f"id,name,price\n{product.pk},New name,5\n,Another,7\n")
+        self.assertTrue(summary.ok)
+        product.refresh_from_db()
+        self.assertEqual(product.name, "New name")
+        self.assertEqual(product.price, Decimal("5"))
+        self.assertTrue(Product.objects.filter(name="Another").exists())
+
+    def test_upsert_keeps_blank_cells(self):
+        author = User.objects.create_user(username="original_author", password="qwerty")
+        product = Product.objects.create(name="Lamp", price=12, discount=3, created_by=author)
+        summary = self.import_csv(f"id,name,price,discount,created_by\n{product.pk},Desk lamp,,,\n")
+        self.assertTrue(summary.ok)
+        product.refresh_from_db()
+        self.assertEqual(product.name, "Desk lamp")
+        self.assertEqual((product.price, product.discount, product.created_by), (Decimal("12"), 3, author))
+
+    def test_extra_cells_reported(self):
+        summary = self.import_csv("name,price\nGood,10\nBad,10,extra\n")
+        self.assertEqual(summary.imported, 1)
+        self.assertEqual([error["line"] for error in summary.errors], [3])
+
+    def test_unknown_columns(self):
+        summary = self.import_csv("name,color\nChair,red\n")
+        self.assertFalse(summary.ok)
+        self.assertFalse(Product.objects.exists())
+
+
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"}})
+class ProductSearchTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username="search_user", password="qwerty")
+        cls.laptop = Product.objects.create(name="Gaming laptop", description="fast laptop, laptop bag", created_by=cls.user)
+        cls.phone = Product.objects.create(name="Smartphone", description="goes well with a laptop", created_by=cls.user)
+        Product.objects.create(name="Desk", description="wooden", created_by=cls.user)
+
+    def search(self, term):
+        response = self.client.get(reverse("shopapp:product-list"), {"search": term})
+        return [item["pk"] for item in response.json()["results"]]
+
+    def test_search_ranked_by_relevance(self):
+        self.assertEqual(self.search("lapt"), [self.laptop.pk, self.phone.pk])
+
+    def test_index_follows_updates_and_deletes(self):
+        Product.objects.filter(pk=self.phone.pk).update(description="plain")
+        self.assertEqual(self.search("laptop"), [self.laptop.pk])
+        self.laptop.delete()
+        self.assertEqual(self.search("laptop"), [])
+
+
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "generations"}})
+class ProductListCacheInvalidationTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username="cache_user", password="qwerty")
+        cls.product = Product.objects.create(name="Cached", created_by=cls.user)
+
+    def setUp(self):
+        cache.clear()
+
+    def get_names(self):
+        response = self.client.get(reverse("shopapp:product-list"))
+        return [item["name"] for item in response.json()["results"]]
+
+    def test_save_invalidates_list(self):
+        self.assertEqual(self.get_names(), ["Cached"])
+        Product.objects.filter(pk=self.product.pk).update(name="Renamed")
+        self.assertEqual(self.get_names(), ["Cached"])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.name = "Saved"
+            self.product.save()
+        self.assertEqual(self.get_names(), ["Saved"])
+
+    def test_csv_import_invalidates_list(self):
+        self.assertEqual(self.get_names(), ["Cached"])
+        with self.captureOnCommitCallbacks(execute=True):
+            save_csv_products(BytesIO(b"name\nImported\n"), encoding="utf-8", created_by=self.user)
+        self.assertEqual(self.get_names(), ["Cached", "Imported"])
+
+
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "swr"}})
+class GetOrComputeTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        # язык из LANGUAGES: иначе reverse() до первого запроса дает префикс /en-us/, которого нет
+        self.enterContext(translation.override("en"))
+
+    def test_stale_value_served_while_another_worker_refreshes(self):
+        self.assertEqual(get_or_compute("swr-key", lambda: 1, soft_ttl=0, hard_ttl=60), 1)
+        cache.add("swr-key:lock", 1, 30)
+        self.assertEqual(get_or_compute("swr-key", lambda: 2, soft_ttl=0, hard_ttl=60), 1)
+        cache.delete("swr-key:lock")
+        self.assertEqual(get_or_compute("swr-key", lambda: 3, soft_ttl=60, hard_ttl=60), 3)
+        self.assertEqual(get_or_compute("swr-key", lambda: 4, soft_ttl=60, hard_ttl=60), 3)
+
+    def test_expired_lock_of_another_worker_is_kept(self):
+        def slow_compute():
+            # своя блокировка истекла, и ее взял другой воркер
+            cache.set("swr-key:lock", "other-worker", 30)
+            return 1
+
+        self.assertEqual(get_or_compute("swr-key", slow_compute, soft_ttl=60, hard_ttl=60), 1)
+        self.assertEqual(cache.get("swr-key:lock"), "other-worker")
+        cache.delete("swr-key:lock")
+
+        async def aslow_compute():
+            await cache.aset("aswr-key:lock", "other-worker", 30)
+            return 2
+
+        self.assertEqual(asyncio.run(aget_or_compute("aswr-key", aslow_compute, soft_ttl=60, hard_ttl=60)), 2)
+        self.assertEqual(cache.get("aswr-key:lock"), "other-worker")
+
+    def test_bump_generation_replaces_value(self):
+        generation = get_generation("swr-test")
+        with mock.patch.object(cache, "incr") as incr:
+            bump_generation("swr-test")
+        incr.assert_not_called()
+        self.assertNotEqual(get_generation("swr-test"), generation)
+
+    def test_headers_survive_cache_hit(self):
+        calls = []
+
+        def make_response(body):
+            calls.append(body)
+            response = HttpResponse(body, content_type="text/csv")
+            response["Content-Disposition"] = 'attachment; filename="export.csv"'
+            response["X-Export-Rows"] = "1"
+            return response
+
+        @swr_cache_page(60, 60)
+        def view(request):
+            return make_response("first")
+
+        class AsyncView:
+            @aswr_cache_page(60, 60, key_prefix="shopapp:swr-async")
+            async def get(self, request):
+                return make_response("first")
+
+        request = RequestFactory().get("/export/")
+        responses = [view(request), view(request)]
+        responses += [asyncio.run(AsyncView().get(request)) for _ in range(2)]
+        self.assertEqual(len(calls), 2)
+        for response in responses:
+            self.assertEqual(response.content, b"first")
+            self.assertEqual(response["Content-Type"], "text/csv")
+            self.assertEqual(response["Content-Disposition"], 'attachment; filename="export.csv"')
+            self.assertEqual(response["X-Export-Rows"], "1")
+
+    def test_products_export_empty_catalog(self):
+        response = self.client.get(reverse("shopapp:products_export"))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {"products": []})
+
+
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "user-orders"}})
+class UserOrdersExportCacheTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username="orders_owner", password="qwerty")
+        cls.product = Product.objects.create(name="Lamp", created_by=cls.user)
+        cls.order = Order.objects.create(delivery_address="ul Lesnaya", user=cls.user)
+        cls.order.products.add(cls.product)
+
+    def setUp(self):
+        cache.clear()
+        self.enterContext(translation.override("en"))
+        self.url = reverse("shopapp:users_orders_export", kwargs={"user_id": self.user.pk})
+
+    def test_cached_body_served_with_etag(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.json()["orders"][0]["products"], [self.product.pk])
+        etag = response["ETag"]
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_order_change_invalidates_cache(self):
+        etag = self.client.get(self.url)["ETag"]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.order.products.remove(self.product)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["orders"][0]["products"], [])
+
+
+class OrderTotalsTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username="totals_user", password="qwerty")
+        cls.chair = Product.objects.create(name="Chair", price="10.50", created_by=cls.user)
+        cls.table = Product.objects.create(name="Table", price="100.00", created_by=cls.user)
+
+    def setUp(self):
+        self.order = Order.objects.create(delivery_address="ul Sadovaya", user=self.user)
+
+    def assertTotals(self, total, count):
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.total_amount, Decimal(total))
+        self.assertEqual(self.order.products_count, count)
+
+    def test_totals_follow_m2m_changes(self):
+        self.order.products.add(self.chair, self.table)
+        self.assertTotals("110.50", 2)
+        self.table.orders.remove(self.order)
+        self.assertTotals("10.50", 1)
+        self.order.products.clear()
+        self.assertTotals("0", 0)
+
+    def test_totals_follow_price_change(self):
+        self.order.products.add(self.chair)
+        self.chair.price = Decimal("12.00")
+        self.chair.save()
+        self.assertTotals("12.00", 1)
+
+    @override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "admin-totals"}})
+    def test_totals_follow_admin_inline(self):
+        directory = TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=directory.name))
+        self.enterContext(translation.override("en"))
+        self.client.force_login(User.objects.create_superuser(username="totals_admin", password="qwerty"))
+        self.order.products.add(self.chair)
+        self.order.refresh_from_db()
+        updated_at = self.order.updated_at
+        generation = get_generation(user_orders_generation(self.user.pk))
+
+        url = reverse("admin:shopapp_order_change", args=[self.order.pk])
+        prefix = self.client.get(url).context["inline_admin_formsets"][0].formset.prefix
+        data = {
+            "delivery_address": self.order.delivery_address,
+            "promocode": "",
+            "user": self.user.pk,
+            "products": [self.chair.pk],
+            "receipt": SimpleUploadedFile("receipt.txt", b"receipt"),
+            f"{prefix}-TOTAL_FORMS": 2,
+            f"{prefix}-INITIAL_FORMS": 1,
+            f"{prefix}-0-id": Order.products.through.objects.get(order=self.order).pk,
+            f"{prefix}-0-order": self.order.pk,
+            f"{prefix}-0-product": self.chair.pk,
+            f"{prefix}-1-order": self.order.pk,
+            f"{prefix}-1-product": self.table.pk,
+        }
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(url, data)
+        self.assertEqual(response.status_code, 302)
+        self.assertTotals("110.50", 2)
+        self.assertGreater(self.order.updated_at, updated_at)
+        self.assertNotEqual(get_generation(user_orders_generation(self.user.pk)), generation)
+
+    def test_recalculate_command_fixes_stale_totals(self):
+        self.order.products.add(self.chair)
+        Order.objects.filter(pk=self.order.pk).update(total_amount=0, products_count=0)
+        out = StringIO()
+        call_command("recalculate_order_totals", "--verify", stdout=out)
+        self.assertIn(f"Order #{self.order.pk} has stale totals", out.getvalue())
+        call_command("recalculate_order_totals", "--batch-size", "1", stdout=StringIO())
+        self.assertTotals("10.50", 1)
+
+
+class SalesRollupsTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username="rollup_user", password="qwerty", is_staff=True)
+        cls.chair = Product.objects.create(name="Chair", price="10.00", created_by=cls.user)
+        cls.table = Product.objects.create(name="Table", price="100.00", created_by=cls.user)
+
+    def create_order(self, *products, recent=False):
+        order = Order.objects.create(delivery_address="ul Polevaya", user=self.user)
+        order.products.add(*products)
+        if not recent:
+            # старше ROLLUP_SAFETY_LAG, все в один день
+            yesterday = timezone.now().replace(hour=12, minute=0) - timedelta(days=1)
+            Order.objects.filter(pk=order.pk).update(created_at=yesterday)
+        return order
+
+    def test_incremental_refresh(self):
+        self.create_order(self.chair, self.table)
+        self.create_order(self.chair)
+        self.assertEqual(refresh_sales_rollups(batch_size=1), 2)
+        self.create_order(self.table)
+        self.assertEqual(refresh_sales_rollups(), 1)
+        self.assertEqual(refresh_sales_rollups(), 0)
+
+        day = DailySalesRollup.objects.get()
+        self.assertEqual((day.orders_count, day.items_count, day.revenue), (3, 4, Decimal("220.00")))
+        chair = ProductSalesRollup.objects.get(product=self.chair)
+        self.assertEqual((chair.orders_count, chair.revenue), (2, Decimal("20.00")))
+        user = UserSalesRollup.objects.get(user=self.user)
+        self.assertEqual((user.orders_count, user.revenue), (3, Decimal("220.00")))
+
+    def test_recent_orders_wait_for_next_run(self):
+        self.create_order(self.chair)
+        self.create_order(self.table, recent=True)
+        # заказ с большим pk, но старой датой: за свежим заказом не обрабатывается
+        self.create_order(self.chair)
+        self.assertEqual(refresh_sales_rollups(), 1)
+        self.assertEqual(refresh_sales_rollups(lag=timedelta(0)), 2)
+        self.assertEqual(sum(DailySalesRollup.objects.values_list("orders_count", flat=True)), 3)
+
+    def test_rollups_api(self):
+        self.create_order(self.table)
+        call_command("refresh_sales_rollups", stdout=StringIO())
+        self.client.force_login(self.user)
+        response = self.client.get(reverse("shopapp:productsalesrollup-list"))
+        self.assertEqual(response.json()["results"][0]["product"], self.table.pk)
+
+
+class SaveCSVOrdersTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username="orders_import_user", password="qwerty")
+        cls.chair = Product.objects.create(name="Chair", price="10.00", created_by=cls.user)
+        cls.table = Product.objects.create(name="Table", price="100.00", created_by=cls.user)
+
+    def test_import_links_only_listed_products(self):
+        content = (
+            "delivery_address,promocode,user,products\n"
+            f"ul Mira 1,SALE,{self.user.pk},{self.chair.pk};{self.table.pk}\n"
+            f"ul Mira 2,,{self.user.pk},{self.table.pk}\n"
+            f"ul Mira 3,,{self.user.pk},999999\n"
+            f"ul Mira 4,,999999,{self.chair.pk}\n"
+        )
+        # постоянное число запросов на пачку: проверка users/products, insert заказов,
+        # diff и insert связей, пересчет итогов, владельцы заказов и savepoint'ы
+        with self.assertNumQueries(11):
+            summary = save_csv_orders(BytesIO(content.encode()), encoding="utf-8", batch_size=10)
+        self.assertEqual(summary.imported, 2)
+        self.assertEqual([error["line"] for error in summary.errors], [4, 5])
+        first = Order.objects.get(delivery_address="ul Mira 1")
+        self.assertEqual(set(first.products.values_list("pk", flat=True)), {self.chair.pk, self.table.pk})
+        self.assertEqual(first.total_amount, Decimal("110.00"))
+        second = Order.objects.get(delivery_address="ul Mira 2")
+        self.assertEqual(list(second.products.values_list("pk", flat=True)), [self.table.pk])
+
+    def test_extra_cells_reported(self):
+        content = (
+            "delivery_address,promocode,user,products\n"
+            f"ul Mira 1,,{self.user.pk},{self.chair.pk}\n"
+            f"ul Mira 2,,{self.user.pk},{self.chair.pk},{self.table.pk}\n"
+        )
+        summary = save_csv_orders(BytesIO(content.encode()), encoding="utf-8")
+        self.assertEqual(summary.imported, 1)
+        self.assertEqual([error["line"] for error in summary.errors], [3])
+
+    def test_rows_deleted_after_check_reject_batch(self):
+        content = "delivery_address,promocode,user,products\n" + "".join(
+            f"ul Mira {number},,{self.user.pk},{self.chair.pk}\n" for number in (1, 2)
+        )
+        calls = []
+
+        def sync(links, batch_size):
+            # товар удалили между проверкой и записью связей
+            calls.append(links)
+            if len(calls) == 1:
+                raise IntegrityError("FOREIGN KEY constraint failed")
+            return sync_order_products(links, batch_size=batch_size)
+
+        with mock.patch("shopapp.common.sync_order_products", side_effect=sync):
+            summary = save_csv_orders(BytesIO(content.encode()), encoding="utf-8", batch_size=1)
+        self.assertEqual(summary.imported, 1)
+        self.assertEqual(summary.errors, [{"line": 2, "error": "Batch 1 rejected: FOREIGN KEY constraint failed"}])
+        self.assertEqual(list(Order.objects.values_list("delivery_address", flat=True)), ["ul Mira 2"])
+
+
+class SyncOrderProductsTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username="linking_user", password="qwerty")
+        cls.products = Product.objects.bulk_create([
+            Product(name=f"Product {i}", price=10, created_by=cls.user)
+            for i in range(4)
+        ])
+        cls.order = Order.objects.create(delivery_address="ul Tikhaya", user=cls.user)
+
+    def test_only_difference_is_written(self):
+        first, second, third, fourth = (product.pk for product in self.products)
+        self.order.products.add(first, second)
+        result = sync_order_products({self.order.pk: {second, third, fourth}}, replace=True)
+        self.assertEqual((result.added, result.removed), (2, 1))
+        self.assertEqual(set(self.order.products.values_list("pk", flat=True)), {second, third, fourth})
+        self.order.refresh_from_db()
+        self.assertEqual((self.order.products_count, self.order.total_amount), (3, Decimal("30")))
+
+    def test_dry_run_writes_nothing(self):
+        result = sync_order_products({self.order.pk: {self.products[0].pk}}, dry_run=True)
+        self.assertEqual(result.added, 1)
+        self.assertFalse(self.order.products.exists())
+
+    def test_update_orders_command(self):
+        call_command("update_orders", "--batch-size", "2", stdout=StringIO())
+        self.assertEqual(self.order.products.count(), 4)
+
+    def test_non_positive_batch_size_rejected(self):
+        with self.assertRaises(CommandError):
+            call_command("update_orders", "--batch-size", "0", stdout=StringIO())
+        with self.assertRaises(ValueError):
+            sync_order_products({self.order.pk: {self.products[0].pk}}, batch_size=0)
+
+
+class ConditionalGetTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser(username="conditional_admin", password="qwerty")
+        cls.product = Product.objects.create(name="Conditional", price=10, created_by=cls.user)
+        cls.order = Order.objects.create(delivery_address="ul Uslovnaya", user=cls.user)
+        cls.order.products.add(cls.product)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+        self.enterContext(translation.override("en"))
+
+    def assertNotModifiedAfter(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.has_header("Last-Modified"))
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(response.status_code, 304)
+        return response
+
+    def test_product_details_not_modified(self):
+        url = reverse("shopapp:product_details", kwargs={"pk": self.product.pk})
+        self.assertNotModifiedAfter(url)
+
+    def test_product_api_etag_changes_on_save(self):
+        url = reverse("shopapp:product-detail", kwargs={"pk": self.product.pk})
+        etag = self.client.get(url)["ETag"]
+        self.assertNotModifiedAfter(url)
+        self.product.price = 20
+        self.product.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_order_etag_follows_products(self):
+        url = reverse("shopapp:order_details", kwargs={"pk": self.order.pk})
+        etag = self.client.get(url)["ETag"]
+        self.assertNotModifiedAfter(url)
+        Product.objects.filter(pk=self.product.pk).update(updated_at=timezone.now() + timedelta(seconds=1))
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_order_api_not_modified(self):
+        self.assertNotModifiedAfter(reverse("shopapp:order-detail", kwargs={"pk": self.order.pk}))
+
+    def test_async_conditional_requires_pk_keyword(self):
+        class View:
+            @product_aconditional
+            async def get(self, request, pk):
+                return HttpResponse()
+
+        request = RequestFactory().get("/")
+        with self.assertRaises(TypeError):
+            asyncio.run(View().get(request, self.product.pk))
+
+
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "sitemaps"}})
+class SitemapTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username="sitemap_user", password="qwerty")
+        cls.products = Product.objects.bulk_create([
+            Product(name=f"Product {i}", created_by=cls.user, archived=i == 0)
+            for i in range(6)
+        ])
+
+    def setUp(self):
+        directory = TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+        self.enterContext(override_settings(SITEMAP_DIR=self.directory))
+        self.enterContext(mock.patch.object(ShopSitemap, "limit", 2))
+        cache.clear()
+
+    def generate(self):
+        out = StringIO()
+        call_command("generate_sitemaps", "--domain", "example.com", stdout=out)
+        return out.getvalue()
+
+    def test_pages_walk_all_active_products(self):
+        pages = list(ShopSitemap().iter_pages())
+        self.assertEqual([len(page) for page in pages], [2, 2, 1])
+        pks = [product.pk for page in pages for product in page]
+        self.assertEqual(pks, sorted((product.pk for product in self.products[1:]), reverse=True))
+
+    def test_generate_writes_only_changed_files(self):
+        self.assertIn("Pages: 3, written: 4", self.generate())
+        index = (self.directory / "sitemap.xml").read_text()
+        self.assertIn("https://example.com/sitemap-shop-3.xml", index)
+        self.assertIn("written: 0, unchanged: 4", self.generate())
+
+        Product.objects.filter(pk__in=[product.pk for product in self.products[1:3]]).update(archived=True)
+        self.assertIn("removed: 1", self.generate())
+        self.assertFalse((self.directory / "sitemap-shop-3.xml").exists())
+        with translation.override("en"):
+            archived = reverse("shopapp:product_details", kwargs={"pk": self.products[0].pk})
+            active = reverse("shopapp:product_details", kwargs={"pk": self.products[5].pk})
+        self.assertIn(active, (self.directory / "sitemap-shop-1.xml").read_text())
+        self.assertNotIn(archived, (self.directory / "sitemap-shop-1.xml").read_text())
+
+    def test_pregenerated_files_are_served(self):
+        self.generate()
+        response = self.client.get("/sitemap-shop-1.xml")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b"https://example.com/", b"".join(response.streaming_content))
+
+    def test_fallback_without_files(self):
+        response = self.client.get("/sitemap.xml")
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "/sitemap-shop-3.xml")
+        response = self.client.get("/sitemap-shop-3.xml")
+        self.assertContains(response, "<loc>", count=1)
+        self.assertEqual(self.client.get("/sitemap-shop-4.xml").status_code, 404)
+
+    def test_fallback_deep_page_uses_keyset(self):
+        self.client.get("/sitemap.xml")
+        # границы страниц закешированы: страница - один запрос по ключу, без COUNT и OFFSET
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/sitemap-shop-3.xml")
+        self.assertContains(response, f"/products/{self.products[1].pk}/")
+        sql = [query["sql"] for query in queries if "shopapp_product" in query["sql"]]
+        self.assertEqual(len(sql), 1)
+        self.assertNotIn("COUNT(", sql[0])
+        self.assertNotIn("OFFSET", sql[0])
+
+
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "feeds"}})
+class ProductFeedTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username="feed_user", password="qwerty")
+        Product.objects.create(name="First feed product", created_by=cls.user)
+
+    def setUp(self):
+        cache.clear()
+        self.enterContext(translation.override("en"))
+        self.url = reverse("shopapp:product_feed")
+
+    def test_not_modified_costs_one_query(self):
+        response = self.client.get(self.url)
+        self.assertContains(response, "First feed product")
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(response.status_code, 304)
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=response["Last-Modified"])
+        self.assertEqual(response.status_code, 304)
+
+    def test_cached_until_new_product(self):
+        etag = self.client.get(self.url)["ETag"]
+        with self.assertNumQueries(1):
+            self.assertContains(self.client.get(self.url), "First feed product")
+        Product.objects.create(name="Second feed product", created_by=self.user)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertContains(response, "Second feed product")
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_removed_products_leave_feed(self):
+        second = Product.objects.create(name="Second feed product", created_by=self.user)
+        self.assertContains(self.client.get(self.url), "Second feed product")
+        Product.objects.filter(name="First feed product").update(archived=True)
+        self.assertNotContains(self.client.get(self.url), "First feed product")
+        Product.objects.create(name="Third feed product", created_by=self.user)
+        self.assertContains(self.client.get(self.url), "Third feed product")
+        second.delete()
+        self.assertNotContains(self.client.get(self.url), "Second feed product")
+
+    def test_version_reads_only_feed_items(self):
+        Product.objects.bulk_create([Product(name=f"Old {i}", created_by=self.user) for i in range(10)])
+        etag = self.client.get(self.url)["ETag"]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        (sql,) = [query["sql"] for query in queries]
+        self.assertNotIn("COUNT(", sql)
+        self.assertNotIn("SUM(", sql)
+        self.assertIn("LIMIT 5", sql)
+
+    def test_etag_depends_on_language(self):
+        etag = self.client.get(self.url)["ETag"]
+        with translation.override("ru"):
+            url = reverse("shopapp:product_feed")
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+
+def make_image_file(name="preview.png", size=(800, 400), mode="RGBA"):
+    buffer = BytesIO()
+    Image.new(mode, size, (200, 10, 10, 128)).save(buffer, "PNG")
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type="image/png")
+
+
+@override_settings(IMAGE_VARIANTS_ASYNC=False)
+class ImageVariantsTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username="images_user", password="qwerty")
+
+    def setUp(self):
+        directory = TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=directory.name))
+        self.media = Path(directory.name)
+
+    def create_product(self, **kwargs):
+        with self.captureOnCommitCallbacks(execute=True):
+            product = Product.objects.create(name="With preview", created_by=self.user, **kwargs)
+        product.refresh_from_db()
+        return product
+
+    def test_variants_built_after_commit(self):
+        product = self.create_product(preview=make_image_file())
+        variants = product.preview_variants
+        self.assertEqual(variants["source"], product.preview.name)
+        self.assertEqual(sorted(variants["webp"], key=int), ["160", "320", "640"])
+        with Image.open(self.media / variants["webp"]["160"]) as image:
+            self.assertEqual((image.format, image.size), ("WEBP", (160, 80)))
+        with Image.open(self.media / variants["jpeg"]["640"]) as image:
+            self.assertEqual(image.format, "JPEG")
+
+    def test_small_image_is_not_upscaled(self):
+        product = self.create_product(preview=make_image_file(size=(100, 100)))
+        self.assertEqual(list(product.preview_variants["jpeg"]), ["100"])
+
+    def test_saving_without_new_file_does_not_rebuild(self):
+        product = self.create_product(preview=make_image_file())
+        with mock.patch("shopapp.images.generate_variants") as generate:
+            with self.captureOnCommitCallbacks(execute=True):
+                product.name = "Renamed"
+                product.save()
+        generate.assert_not_called()
+
+    def test_responsive_image_tag(self):
+        product = self.create_product(preview=make_image_file())
+        html = responsive_image(product.preview, product.preview_variants, alt="Preview", sizes="160px")
+        self.assertIn('<source type="image/webp"', html)
+        self.assertIn(".webp 320w", html)
+        self.assertIn('sizes="160px"', html)
+        self.assertIn(default_storage.url(product.preview_variants["jpeg"]["640"]), html)
+        self.assertIn('<img src="', responsive_image(product.preview, {}))
+        # копии от прежнего файла, новые еще не построены
+        stale = {**product.preview_variants, "source": "products/old.png"}
+        self.assertEqual(
+            responsive_image(product.preview, stale, alt="Preview"),
+            f'<img src="{product.preview.url}" alt="Preview" loading="lazy">',
+        )
+
+
+@override_settings(IMAGE_VARIANTS_ASYNC=False)
+class ProductImagesUploadTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser(username="upload_admin", password="qwerty")
+        cls.product = Product.objects.create(name="Gallery", created_by=cls.user)
+
+    def setUp(self):
+        directory = TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=directory.name))
+        self.enterContext(translation.override("en"))
+        self.client.force_login(self.user)
+
+    def test_api_upload_stores_valid_images(self):
+        broken = SimpleUploadedFile("broken.png", b"not an image", content_type="image/png")
+        files = [make_image_file("first.png"), make_image_file("second.png"), broken]
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                reverse("shopapp:product-upload-images", kwargs={"pk": self.product.pk}),
+                {"images": files, "description": "gallery"},
+            )
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(len(response.json()["images"]), 3)
+        images = list(self.product.images.order_by("pk"))
+        self.assertEqual([image.description for image in images], ["gallery", "gallery"])
+        self.assertTrue(all(image.variants.get("webp") for image in images))
+
+    def test_api_upload_rejects_non_images(self):
+        response = self.client.post(
+            reverse("shopapp:product-upload-images", kwargs={"pk": self.product.pk}),
+            {"images": [SimpleUploadedFile("notes.txt", b"text")]},
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(self.product.images.exists())
+
+    def test_api_upload_requires_change_permission(self):
+        url = reverse("shopapp:product-upload-images", kwargs={"pk": self.product.pk})
+        self.client.force_login(User.objects.create_user(username="upload_guest", password="qwerty"))
+        response = self.client.post(url, {"images": [make_image_file()]})
+        self.assertEqual(response.status_code, 403)
+        self.client.logout()
+        response = self.client.post(url, {"images": [make_image_file()]})
+        self.assertIn(response.status_code, (401, 403))
+        self.assertFalse(self.product.images.exists())
+
+    def test_failed_insert_removes_saved_files(self):
+        storage = mock.Mock(wraps=default_storage)
+        with mock.patch.object(ProductImage.objects, "bulk_create", side_effect=IntegrityError("boom")):
+            with self.assertRaises(IntegrityError):
+                save_product_images(self.product, [make_image_file("first.png"), make_image_file("second.png")], storage=storage)
+        deleted = [call.args[0] for call in storage.delete.call_args_list]
+        self.assertEqual(len(deleted), 2)
+        self.assertFalse(any(default_storage.exists(name) for name in deleted))
+
+    def test_update_view_saves_images(self):
+        url = reverse("shopapp:product_update", kwargs={"pk": self.product.pk})
+        self.assertContains(self.client.get(url), 'name="images" multiple')
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                url,
+                {
+                    "name": "Gallery",
+                    "price": "10",
+                    "description": "",
+                    "discount": "0",
+                    "images": [make_image_file("first.png"), make_image_file("second.png")],
+                },
+            )
+        self.assertRedirects(response, reverse("shopapp:product_details", kwargs={"pk": self.product.pk}))
+        self.assertEqual(self.product.images.count(), 2)
+
+
+@override_settings(
+    IMAGE_VARIANTS_ASYNC=False,
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "sharded-media"}},
+)
+class ShardedMediaTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username="media_user", password="qwerty")
+
+    def setUp(self):
+        directory = TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=directory.name))
+        self.media = Path(directory.name)
+        cache.clear()
+
+    def test_new_upload_goes_to_sharded_path(self):
+        product = Product(name="Sharded", created_by=self.user, preview=make_image_file("cover.png"))
+        key = product.media_key.hex
+        product.save()
+        self.assertEqual(product.preview.name, f"products/{key[:2]}/{key[2:4]}/{key}/preview/cover.png")
+
+    def test_relocate_command_moves_legacy_files(self):
+        legacy = self.media / "products/product_1/preview/old.png"
+        legacy.parent.mkdir(parents=True)
+        legacy.write_bytes(b"legacy")
+        product = Product.objects.create(name="Legacy", created_by=self.user)
+        Product.objects.filter(pk=product.pk).update(preview="products/product_1/preview/old.png")
+        product.refresh_from_db()
+        updated_at = product.updated_at
+        generation = get_generation(PRODUCTS_GENERATION)
+
+        out = StringIO()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command("relocate_media", "--batch-size", "1", stdout=out)
+        self.assertIn("Moved: 1, skipped: 0", out.getvalue())
+        product.refresh_from_db()
+        # новые URL файлов: ETag и кеш страниц товаров должны смениться
+        self.assertGreater(product.updated_at, updated_at)
+        self.assertNotEqual(get_generation(PRODUCTS_GENERATION), generation)
+        self.assertTrue(product.preview.name.startswith(f"products/{product.media_key.hex[:2]}/"))
+        self.assertEqual((self.media / product.preview.name).read_bytes(), b"legacy")
+        self.assertFalse(legacy.exists())
+
+        out = StringIO()
+        call_command("relocate_media", stdout=out)
+        self.assertIn("Moved: 0, skipped: 1", out.getvalue())
+
+
+@override_settings(
+    IMAGE_VARIANTS_ASYNC=False,
+    STORAGES={**settings.STORAGES, "default": {"BACKEND": "requestdataapp.storage.ContentAddressedStorage"}},
+)
+class ContentAddressedReferencesTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username="cas_user", password="qwerty")
+
+    def setUp(self):
+        directory = TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=directory.name))
+
+    def references(self, names):
+        return dict(StoredBlob.objects.filter(name__in=names).values_list("name", "refcount"))
+
+    def test_deleted_and_replaced_files_release_references(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            first = Product.objects.create(name="First", created_by=self.user, preview=make_image_file())
+            second = Product.objects.create(name="Second", created_by=self.user, preview=make_image_file())
+        first.refresh_from_db()
+        second.refresh_from_db()
+        name = first.preview.name
+        names = {name} | variant_names(first.preview_variants)
+        self.assertEqual(second.preview.name, name)
+        self.assertEqual(set(self.references(names).values()), {2})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertEqual(set(self.references(names).values()), {1})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second.preview = make_image_file(size=(300, 200))
+            second.save()
+        self.assertEqual(self.references(names), {})
+        self.assertFalse(default_storage.exists(name))
+
+    def test_same_file_uploaded_again_keeps_one_reference(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            order = Order.objects.create(
+                delivery_address="ul Kesha",
+                user=self.user,
+                receipt=SimpleUploadedFile("receipt.txt", b"paid"),
+            )
+        with self.captureOnCommitCallbacks(execute=True):
+            order.receipt = SimpleUploadedFile("receipt.txt", b"paid")
+            order.save()
+        self.assertEqual(self.references([order.receipt.name]), {order.receipt.name: 1})
+
+
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "query-budgets"}})
+class QueryBudgetTestCase(QueryBudgetTestMixin, TestCase):
+    """Число запросов списков и выгрузок не зависит от объема данных и не выходит за query_budgets.json."""
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username="budget_user", password="qwerty", is_staff=True, is_superuser=True)
+
+    def setUp(self):
+        self.enterContext(translation.override("en"))
+        self.client.force_login(self.user)
+        self.rounds = 0
+
+    def add_data(self):
+        self.rounds += 1
+        group = Group.objects.create(name=f"Budget group {self.rounds}")
+        group.permissions.add(*Permission.objects.all()[:3])
+        products = [
+            Product.objects.create(name=f"Budget {self.rounds}-{index}", price="10.00", created_by=self.user)
+            for index in range(3)
+        ]
+        for product in products:
+            order = Order.objects.create(delivery_address="ul Budget", user=self.user)
+            order.products.add(*products[:2])
+
+    def fetch(self, url):
+        cache.clear()
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        if response.streaming:
+            b"".join(response.streaming_content)
+
+    def assertQueriesWithinBudget(self, view, url):
+        self.add_data()
+        with self.assertMaxQueries(view=view) as first:
+            self.fetch(url)
+        self.add_data()
+        with self.assertMaxQueries(view=view) as second:
+            self.fetch(url)
+        self.assertEqual(first.count, second.count, f"{view}: query count grows with data")
+
+    def test_list_and_export_views(self):
+        views = [
+            ("shopapp:groups_list", {}),
+            ("shopapp:products_list", {}),
+            ("shopapp:products_export", {}),
+            ("shopapp:orders_list", {}),
+            ("shopapp:orders_export", {}),
+            ("shopapp:users_orders", {"user_id": self.user.pk}),
+            ("shopapp:users_orders_export", {"user_id": self.user.pk}),
+            ("shopapp:product-list", {}),
+            ("shopapp:order-list", {}),
+        ]
+        for view, kwargs in views:
+            with self.subTest(view=view):
+                self.assertQueriesWithinBudget(view, reverse(view, kwargs=kwargs))
+
+    def test_admin_inline_choices_loaded_once(self):
+        order = Order.objects.create(delivery_address="ul Admin", user=self.user)
+        url = reverse("admin:shopapp_order_change", args=[order.pk])
+        # первый запрос прогревает кеш ContentType
+        self.fetch(url)
+        counts = []
+        for size in (1, 4):
+            order.products.set(
+                Product.objects.create(name=f"Inline {size}-{index}", created_by=self.user) for index in range(size)
+            )
+            with self.assertMaxQueries() as recorder:
+                self.fetch(url)
+            counts.append(recorder.count)
+        self.assertEqual(counts[0], counts[1])
+
+
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "benchmarks"}})
+class BenchmarksTestCase(TestCase):
+    def test_scenarios_run_without_errors(self):
+        cache.clear()
+        summary = seed_dataset(20, seed=1)
+        self.assertEqual((summary["products"], summary["orders"]), (20, 20))
+        result = run_benchmarks(
+            default_scenarios(summary["user_id"], summary["customer_id"]),
+            ["client", "wsgi"],
+            User.objects.get(pk=summary["user_id"]),
+            iterations=2,
+            warmup=0,
+            meta={"scale": 20, "seed": 1},
+        )
+        self.assertEqual(set(result["results"]["orders_export"]), {"client", "wsgi"})
+        for scenario, runners in result["results"].items():
+            for runner, stats in runners.items():
+                self.assertEqual(stats["errors"], 0, f"{scenario}/{runner}")
+                self.assertLessEqual(stats["p50_ms"], stats["p99_ms"])
+
+    def test_compare_reports_regressions(self):
+        def run(p95, queries, errors=0):
+            stats = {"p95_ms": p95, "queries": queries, "errors": errors}
+            return {"meta": {"scale": 10, "seed": 1}, "results": {"products_list": {"client": stats}}}
+
+        self.assertEqual(compare(run(11.0, 3), run(10.0, 3), threshold=0.2), [])
+        self.assertEqual(len(compare(run(13.0, 4), run(10.0, 3), threshold=0.2)), 2)
+        # сломанный view отвечает быстрее и без запросов, но это регрессия
+        self.assertEqual(compare(run(2.0, 0, errors=5), run(10.0, 3)), ["products_list/client: 5 error responses"])
+        self.assertEqual(len(compare(run(2.0, 0, errors=5), {**run(10.0, 3), "results": {}})), 1)
+        with self.assertRaises(ValueError):
+            compare(run(10.0, 3), {**run(10.0, 3), "meta": {"scale": 20, "seed": 1}})
+
+
+class SeedDataTestCase(TestCase):
+    def test_seed_is_reproducible_across_workers(self):
+        plan = dict(users=5, products=30, orders=40, images=1.0, seed=7, batch_size=8)
+        first = seed(SeedPlan(prefix="first", workers=1, **plan))
+        second = seed(SeedPlan(prefix="second", workers=2, **plan))
+        self.assertEqual(first, second)
+        self.assertEqual((first.users, first.products, first.orders), (5, 30, 40))
+
+        products = list(Product.objects.order_by("pk").values_list("name", "price", "archived", "created_by__username"))
+        self.assertEqual(products[:30], [
+            (name, price, archived, author.replace("second_", "first_")) for name, price, archived, author in products[30:]
+        ])
+        links = Order.products.through.objects.count()
+        self.assertEqual(links, first.links * 2)
+        self.assertFalse(stale_orders(Order.objects.all()).exists())
+        self.assertEqual(ProductImage.objects.count(), first.images * 2)
+        self.assertLess(Order.objects.order_by("created_at").first().created_at, timezone.now() - timedelta(days=1))
+
+    def test_command_refuses_existing_prefix(self):
+        call_command("seed_data", "--users", "2", "--products", "3", "--orders", "3", stdout=StringIO())
+        with self.assertRaises(CommandError):
+            call_command("seed_data", "--users", "2", "--products", "3", "--orders", "3", stdout=StringIO())
+
+    def test_create_products_sets_author(self):
+        user = User.objects.create_user(username="admin", password="qwerty")
+        call_command("create_products", stdout=StringIO())
+        self.assertEqual(Product.objects.filter(created_by=user).count(), 3)
+
+
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "async-views"}})
+class AsyncViewsTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username="async_user", password="qwerty")
+        cls.product = Product.objects.create(name="Async Lamp", price=10, created_by=cls.user)
+        cls.order = Order.objects.create(delivery_address="ul Asinhronnaya", user=cls.user)
+        cls.order.products.add(cls.product)
+
+    def setUp(self):
+        cache.clear()
+        self.enterContext(translation.override("en"))
+
+    def test_views_are_async(self):
+        from shopapp.views import ProductDataExportView, ProductDetailsView, ProductListView, UserOrdersDataExportView
+        for view in (ProductListView, ProductDetailsView, ProductDataExportView, UserOrdersDataExportView):
+            self.assertTrue(view.view_is_async, view.__name__)
+
+    async def test_products_list_and_details(self):
+        response = await self.async_client.get(reverse("shopapp:products_list"))
+        self.assertContains(response, "Async Lamp")
+        url = reverse("shopapp:product_details", kwargs={"pk": self.product.pk})
+        response = await self.async_client.get(url)
+        self.assertContains(response, "Async Lamp")
+        response = await self.async_client.get(url, headers={"if-none-match": response["ETag"]})
+        self.assertEqual(response.status_code, 304)
+        response = await self.async_client.get(reverse("shopapp:product_details", kwargs={"pk": 0}))
+        self.assertEqual(response.status_code, 404)
+
+    async def test_exports_served_concurrently(self):
+        products_url = reverse("shopapp:products_export")
+        orders_url = reverse("shopapp:users_orders_export", kwargs={"user_id": self.user.pk})
+        responses = await asyncio.gather(*(
+            self.async_client.get(url) for url in (products_url, orders_url, products_url, orders_url)
+        ))
+        self.assertEqual([response.status_code for response in responses], [200] * 4)
+        self.assertEqual(responses[0].json()["products"][0]["name"], "Async Lamp")
+        self.assertEqual(responses[1].json()["orders"][0]["products"], [self.product.pk])
+        response = await self.async_client.get(reverse("shopapp:users_orders_export", kwargs={"user_id": 0}))
+        self.assertEqual(response.status_code, 404)
@@ -0,0 +1,91 @@
+"""
+Денормализованные итоги заказа: сумма (total_amount) и число товаров (products_count).
+
+Пересчет делается одним UPDATE с подзапросами по таблице связей,
+без выборки заказов и товаров в Python.
+"""
+from decimal import Decimal
+
+from django.db.models import Count, DecimalField, F, IntegerField, OuterRef, QuerySet, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Now
+
+from .cache import bump_generation_on_commit, user_orders_generation
+from .models import Order
+
+TOTALS_BATCH_SIZE = 1000
+
+
+def _through_for_order():
+    return Order.products.through.objects.filter(order_id=OuterRef("pk")).values("order_id")
+
+
+def calculated_total():
+    total = _through_for_order().annotate(total=Sum("product__price")).values("total")
+    return Coalesce(
+        Subquery(total, output_field=DecimalField(max_digits=12, decimal_places=2)),
+        Value(Decimal("0.00")),
+        output_field=DecimalField(max_digits=12, decimal_places=2),
+    )
+
+
+def calculated_count():
+    count = _through_for_order().annotate(count=Count("pk")).values("count")
+    return Coalesce(Subquery(count, output_field=IntegerField()), Value(0), output_field=IntegerField())
+
+
+def refresh_order_totals(queryset: QuerySet, touch: bool = True) -> int:
+    """touch=True сдвигает updated_at: состав заказа изменился, старые ETag недействительны."""
+    values = {
+        "total_amount": calculated_total(),
+        "products_count": calculated_count(),
+    }
+    if touch:
+        values["updated_at"] = Now()
+    return queryset.update(**values)
+
+
+def refresh_totals_for_orders(order_ids) -> int:
+    order_ids = list(order_ids)
+    updated = 0
+    for start in range(0, len(order_ids), TOTALS_BATCH_SIZE):
+        chunk = order_ids[start:start + TOTALS_BATCH_SIZE]
+        updated += refresh_order_totals(Order.objects.filter(pk__in=chunk))
+    return updated
+
+
+def refresh_totals_for_products(product_ids) -> int:
+    """
+    Пересчитывает заказы, в которые входят товары (например, после смены цены),
+    и сбрасывает кеш выгрузки заказов их владельцев.
+    """
+    through = Order.products.through
+    orders = Order.objects.filter(
+        pk__in=through.objects.filter(product_id__in=list(product_ids)).values("order_id")
+    )
+    user_ids = set(orders.values_list("user_id", flat=True).distinct())
+    bump_generation_on_commit(*(user_orders_generation(user_id) for user_id in user_ids))
+    return refresh_order_totals(orders)
+
+
+def iter_order_pk_ranges(batch_size: int = TOTALS_BATCH_SIZE):
+    """Диапазоны (first_pk, last_pk) по batch_size заказов, обход по индексу pk."""
+    last_pk = 0
+    while True:
+        pks = list(
+            Order.objects.filter(pk__gt=last_pk)
+            .order_by("pk")
+            .values_list("pk", flat=True)[:batch_size]
+        )
+        if not pks:
+            return
+        yield pks[0], pks[-1]
+        last_pk = pks[-1]
+
+
+def stale_orders(queryset: QuerySet) -> QuerySet:
+    """Заказы, у которых сохраненные итоги не совпадают с расчетными."""
+    return (
+        queryset
+        .alias(calc_total=calculated_total(), calc_count=calculated_count())
+        .exclude(total_amount=F("calc_total"), products_count=F("calc_count"))
+    )
@@ -19,6 +19,9 @@ from .views import (
     OrderDataExportView,
     ProductViewSet,
     OrderViewSet,
+    DailySalesRollupViewSet,
+    ProductSalesRollupViewSet,
+    UserSalesRollupViewSet,
     LatestProductsFeed,
     UserOrdersListView,
     UserOrdersDataExportView,
@@ -29,6 +32,9 @@ app_name = "shopapp"
 routers = DefaultRouter()
 routers.register("products", ProductViewSet)
 routers.register("orders", OrderViewSet)
+routers.register("rollups/daily", DailySalesRollupViewSet)
+routers.register("rollups/products", ProductSalesRollupViewSet)
+routers.register("rollups/users", UserSalesRollupViewSet)
 
 urlpatterns = [
     # path("", cache_page(60 * 3)(ShopIndexView.as_view()), name="index"),
@@ -3,38 +3,79 @@
 
 Разные view интернет-магазина: по товарам, заказам и т.д.
 """
+import hashlib
 import logging
+from datetime import datetime
 from timeit import default_timer
-from csv import DictWriter
 
+from asgiref.sync import sync_to_async
 from django.contrib.auth.models import Group, User
 from django.contrib.syndication.views import Feed
 from django.core.cache import cache
-from django.http import HttpResponse, HttpRequest, HttpResponseRedirect, JsonResponse
+from django.http import Http404, HttpResponse, HttpRequest, HttpResponseRedirect, JsonResponse, StreamingHttpResponse
 from django.shortcuts import render, redirect, reverse, get_object_or_404
 from django.urls import reverse_lazy
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.dateparse import parse_date, parse_datetime
 from django.utils.decorators import method_decorator
+from django.utils.http import quote_etag
 from django.views import View
 from django.views.decorators.cache import cache_page
 from django.views.generic import TemplateView, ListView, DetailView, CreateView, UpdateView, DeleteView
 from django.contrib.auth.mixins import LoginRequiredMixin, PermissionRequiredMixin, UserPassesTestMixin
-from rest_framework.viewsets import ModelViewSet
+from rest_framework.viewsets import ModelViewSet, ReadOnlyModelViewSet
 from rest_framework.decorators import action
 from rest_framework.request import Request
 from rest_framework.response import Response
 from rest_framework.parsers import MultiPartParser
-from rest_framework.filters import SearchFilter, OrderingFilter
+from rest_framework.renderers import JSONRenderer
+from rest_framework.filters import OrderingFilter
+from rest_framework.permissions import BasePermission, IsAdminUser, IsAuthenticated
 from django_filters.rest_framework import DjangoFilterBackend
 from drf_spectacular.utils import extend_schema, OpenApiResponse
 
+from my_first_site.feed_tools import CachedFeedMixin
+
+from .cache import (
+    PRODUCTS_GENERATION,
+    aget_generation,
+    aswr_cache_page,
+    generation_cache_page,
+    user_orders_generation,
+)
 from .common import save_csv_products
-from .forms import ProductForm, OrderForm, GroupForm
-from .models import Product, Order, ProductImage
-from .serializers import ProductSerializer, OrderSerializer
+from .conditional import (
+    order_api_conditional,
+    order_conditional,
+    product_aconditional,
+    product_api_conditional,
+)
+from .exports import csv_streaming_response, orders_streaming_response
+from .images import save_product_images
+from .forms import ProductForm, ProductImagesForm, OrderForm, GroupForm
+from .models import Product, Order, DailySalesRollup, ProductSalesRollup, UserSalesRollup
+from .pagination import OptInKeysetPagination
+from .search import ProductSearchFilter
+from .serializers import (
+    ProductSerializer,
+    OrderSerializer,
+    DailySalesRollupSerializer,
+    ProductSalesRollupSerializer,
+    UserSalesRollupSerializer,
+)
 
 
 log = logging.getLogger(__name__)
 
+
+class CanChangeProduct(BasePermission):
+    """Те же права, что у ProductUpdateView: суперпользователь или автор с change_product."""
+    def has_object_permission(self, request, view, obj: Product):
+        user = request.user
+        return user.is_superuser or (user.has_perm("shopapp.change_product") and user.id == obj.created_by_id)
+
+
 @extend_schema(description="Product views CRUD")
 class ProductViewSet(ModelViewSet):
     """
@@ -45,8 +86,9 @@ class ProductViewSet(ModelViewSet):
 
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
+    pagination_class = OptInKeysetPagination
     filter_backends = [
-        SearchFilter,
+        ProductSearchFilter,
         OrderingFilter,
     ]
     search_fields = ["name", "description"]
@@ -55,8 +97,9 @@ class ProductViewSet(ModelViewSet):
         "price",
         "discount",
     ]
+    keyset_ordering_fields = ordering_fields
 
-    @method_decorator(cache_page(60 * 2))
+    @method_decorator(generation_cache_page(60 * 60, PRODUCTS_GENERATION))
     def list(self, *args, **kwargs):
         # print("hello products list")
         return super().list(*args, **kwargs)
@@ -69,14 +112,12 @@ class ProductViewSet(ModelViewSet):
             404: OpenApiResponse(description="Empty response, product by id not found"),
         }
     )
+    @method_decorator(product_api_conditional)
     def retrieve(self, *args, **kwargs):
         return super().retrieve(*args, **kwargs)
 
     @action(methods=["get"], detail=False)
     def download_csv(self, request: Request):
-        response = HttpResponse(content_type="text/csv")
-        filename = "products-export.csv"
-        response["Content-Disposition"] =f"attachment; filename={filename}"
         queryset = self.filter_queryset(self.get_queryset())
         fields = [
             "name",
@@ -84,17 +125,12 @@ class ProductViewSet(ModelViewSet):
             "price",
             "discount",
         ]
-        queryset = queryset.only(*fields)
-        writer = DictWriter(response, fieldnames=fields)
-        writer.writeheader()
-
-        for product in queryset:
-            writer.writerow({
-                field: getattr(product, field)
-                for field in fields
-            })
-
-        return response
+        return csv_streaming_response(
+            queryset,
+            fields,
+            filename="products-export.csv",
+            gzip=request.query_params.get("gzip") == "1",
+        )
 
     @action(
         detail=False,
@@ -102,36 +138,128 @@ class ProductViewSet(ModelViewSet):
         parser_classes=[MultiPartParser]
     )
     def upload_csv(self, request: Request):
-        products = save_csv_products(
+        summary = save_csv_products(
             request.FILES["file"].file,
             encoding=request.encoding,
+            created_by=request.user if request.user.is_authenticated else None,
+        )
+        return Response(summary.as_dict(), status=200 if summary.imported or summary.ok else 400)
+
+    @extend_schema(
+        summary="Upload several images for a product",
+        description="Files are stored at once, validated and resized in the background",
+    )
+    @action(
+        detail=True,
+        methods=["post"],
+        parser_classes=[MultiPartParser],
+        permission_classes=[IsAuthenticated, CanChangeProduct],
+    )
+    def upload_images(self, request: Request, pk=None):
+        product = self.get_object()
+        form = ProductImagesForm(request.data, request.FILES)
+        if not form.is_valid():
+            return Response(form.errors, status=400)
+        images = save_product_images(product, form.cleaned_data["images"], form.cleaned_data["description"])
+        return Response(
+            {"images": [{"pk": image.pk, "image": image.image.url} for image in images]},
+            status=202,
         )
-        serializer = self.get_serializer(products, many=True)
-        return Response(serializer.data)
 
 
 
 
 class OrderViewSet(ModelViewSet):
-    queryset = Order.objects.all()
+    # список id товаров в каждом заказе: без prefetch по запросу на заказ
+    queryset = Order.objects.prefetch_related("products")
     serializer_class = OrderSerializer
+    pagination_class = OptInKeysetPagination
     filter_backends = [
         DjangoFilterBackend,
         OrderingFilter,
     ]
-    filterset_fields = [
+    filterset_fields = {
+        "delivery_address": ["exact"],
+        "promocode": ["exact"],
+        "created_at": ["exact"],
+        "user": ["exact"],
+        "products": ["exact"],
+        "total_amount": ["exact", "gte", "lte"],
+        "products_count": ["exact", "gte", "lte"],
+    }
+    ordering_fields = [
         "delivery_address",
         "promocode",
         "created_at",
         "user",
-        "products",
+        "total_amount",
+        "products_count",
     ]
-    ordering_fields = [
-        "delivery_address",
-        "promocode",
+    keyset_ordering_fields = [
         "created_at",
+        "total_amount",
+    ]
+
+    @method_decorator(order_api_conditional)
+    def retrieve(self, *args, **kwargs):
+        return super().retrieve(*args, **kwargs)
+
+
+@extend_schema(description="Daily sales from pre-aggregated rollups (see refresh_sales_rollups)")
+class DailySalesRollupViewSet(ReadOnlyModelViewSet):
+    queryset = DailySalesRollup.objects.all()
+    serializer_class = DailySalesRollupSerializer
+    permission_classes = [IsAdminUser]
+    filter_backends = [
+        DjangoFilterBackend,
+        OrderingFilter,
+    ]
+    filterset_fields = {
+        "date": ["exact", "gte", "lte"],
+    }
+    ordering_fields = [
+        "date",
+        "orders_count",
+        "revenue",
+    ]
+
+
+@extend_schema(description="Sales per product from pre-aggregated rollups")
+class ProductSalesRollupViewSet(ReadOnlyModelViewSet):
+    queryset = ProductSalesRollup.objects.all()
+    serializer_class = ProductSalesRollupSerializer
+    permission_classes = [IsAdminUser]
+    filter_backends = [
+        DjangoFilterBackend,
+        OrderingFilter,
+    ]
+    filterset_fields = [
+        "product",
+    ]
+    ordering_fields = [
+        "orders_count",
+        "revenue",
+        "last_order_at",
+    ]
+
+
+@extend_schema(description="Sales per customer from pre-aggregated rollups")
+class UserSalesRollupViewSet(ReadOnlyModelViewSet):
+    queryset = UserSalesRollup.objects.all()
+    serializer_class = UserSalesRollupSerializer
+    permission_classes = [IsAdminUser]
+    filter_backends = [
+        DjangoFilterBackend,
+        OrderingFilter,
+    ]
+    filterset_fields = [
         "user",
     ]
+    ordering_fields = [
+        "orders_count",
+        "revenue",
+        "last_order_at",
+    ]
 
 
 class ShopIndexView(View):
@@ -169,19 +297,31 @@ class GroupsListView(View):
         return redirect(request.path)
 
 
-class ProductDetailsView(DetailView):
+# Горячие страницы чтения - async view (см. my_first_site.asgi): под ASGI ожидание
+# базы и кеша не занимает поток. Шаблоны проверяют права пользователя, а это
+# синхронные запросы к базе, поэтому рендеринг идет через sync_to_async.
+
+class ProductDetailsView(View):
     template_name = 'shopapp/product-details.html'
-    # model = Product
     queryset = Product.objects.prefetch_related("images")
-    context_object_name = "product"
 
+    @product_aconditional
+    async def get(self, request: HttpRequest, pk: int) -> HttpResponse:
+        try:
+            product = await self.queryset.aget(pk=pk)
+        except Product.DoesNotExist:
+            raise Http404("No product found matching the query")
+        return await sync_to_async(render)(request, self.template_name, {"product": product})
 
-class ProductListView(ListView):
+
+class ProductListView(View):
     template_name = 'shopapp/products-list.html'
-    # model = Product
-    context_object_name = "products"
     queryset = Product.objects.filter(archived=False)
 
+    async def get(self, request: HttpRequest) -> HttpResponse:
+        products = [product async for product in self.queryset.aiterator()]
+        return await sync_to_async(render)(request, self.template_name, {"products": products})
+
 
 class ProductCreateView(UserPassesTestMixin, CreateView):
     def test_func(self):
@@ -207,13 +347,9 @@ class ProductUpdateView(UserPassesTestMixin, UpdateView):
         return reverse('shopapp:product_details', kwargs={"pk": self.object.pk})
 
     def form_valid(self, form):
-        response = super(ProductUpdateView).form_valid(form)
-        for image in form.files.getlist("images"):
-            ProductImage.object.create(
-                product=self.object,
-                image=image,
-            )
-            return response
+        response = super().form_valid(form)
+        save_product_images(self.object, form.cleaned_data["images"])
+        return response
 
 
 class ProductDeleteView(DeleteView):
@@ -237,6 +373,7 @@ class OrdersListView(LoginRequiredMixin, ListView):
     )
 
 
+@method_decorator(order_conditional, name="get")
 class OrdersDetailView(PermissionRequiredMixin, DetailView):
     permission_required = "shopapp.view_order"
     queryset = (
@@ -265,64 +402,70 @@ class OrderDeleteView(DeleteView):
 
 
 class ProductDataExportView(View):
-    def get(self, request: HttpRequest) -> JsonResponse:
-        cache_key = "products_data_export"
-        products_data = cache.get(cache_key)
-        if products_data is None:
-            products = Product.objects.order_by("pk").all()
-            products_data = [
-                {
-                    "pk": product.pk,
-                    "name": product.name,
-                    "price": product.price,
-                    "archived": product.archived,
-                }
-                for product in products
-            ]
-            cache.set(cache_key, products_data, 300)
-        elem = products_data[0]
-        name = elem["name"]
-        print("name:", name)
+    @aswr_cache_page(60 * 5, 60 * 60, PRODUCTS_GENERATION)
+    async def get(self, request: HttpRequest) -> JsonResponse:
+        products_data = [
+            row async for row in
+            Product.objects
+            .order_by("pk")
+            .values("pk", "name", "price", "archived")
+            .aiterator()
+        ]
         return JsonResponse({"products": products_data})
 
 
+def parse_export_moment(value: str):
+    try:
+        moment = parse_datetime(value)
+        if moment is None:
+            day = parse_date(value)
+            moment = day and datetime.combine(day, datetime.min.time())
+    except ValueError:
+        return None
+    if moment and timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
 class OrderDataExportView(UserPassesTestMixin, View):
+    """
+    Выгрузка заказов потоком: JSON ``{"orders": [...]}`` или NDJSON (``?format=ndjson``).
+
+    Фильтры: ``created_after``, ``created_before`` (дата или дата-время ISO 8601), ``user`` (id).
+    """
     def test_func(self):
         return self.request.user.is_staff
 
-    def get(self, request: HttpRequest) -> JsonResponse:
-        orders = Order.objects.order_by("pk").all()
-        orders_data = [
-            {
-                "id": order.id,
-                "delivery_address": order.delivery_address,
-                "promocode": order.promocode,
-                "user": {
-                    "id": order.user.pk,
-                    "username": order.user.username,
-                    "is_staff": order.user.is_staff,
-                },
-                "products": [
-                    {
-                        "id": product.pk,
-                        "name": product.name,
-                        "price": product.price,
-                        "archived": product.archived,
-                    }
-                    for product in order.products.all()
-                ],
-            }
-            for order in orders
-        ]
-        return JsonResponse({"orders": orders_data})
-
-class LatestProductsFeed(Feed):
+    def get(self, request: HttpRequest) -> StreamingHttpResponse:
+        orders = Order.objects.all()
+        filters = {
+            "created_after": "created_at__gte",
+            "created_before": "created_at__lt",
+        }
+        for param, lookup in filters.items():
+            value = request.GET.get(param)
+            if not value:
+                continue
+            moment = parse_export_moment(value)
+            if moment is None:
+                return JsonResponse({"error": f"Invalid {param}: {value!r}"}, status=400)
+            orders = orders.filter(**{lookup: moment})
+        user_id = request.GET.get("user")
+        if user_id:
+            if not user_id.isdigit():
+                return JsonResponse({"error": f"Invalid user: {user_id!r}"}, status=400)
+            orders = orders.filter(user_id=user_id)
+        return orders_streaming_response(orders, ndjson=request.GET.get("format") == "ndjson")
+
+class LatestProductsFeed(CachedFeedMixin, Feed):
     title = "New products"
     description = "Info on addition new products"
     link = reverse_lazy("shopapp:products_list")
+    # updated_at сдвигается и при добавлении, и при правке товара (цена есть в ленте)
+    latest_field = "updated_at"
 
     def items(self):
-        return (Product.objects.order_by("-created_at")[:5])
+        return (Product.objects.filter(archived=False).order_by("-created_at", "-pk")[:5])
 
     def item_title(self, item: Product):
         return item.name
@@ -342,14 +485,36 @@ class UserOrdersListView(LoginRequiredMixin, ListView):
         return context
 
 class UserOrdersDataExportView(View):
-    def get(self, request: HttpRequest, **kwargs) -> JsonResponse:
-        self.owner = get_object_or_404(User, pk=self.kwargs['user_id'])
-        cache_key = str(self.owner)
-        serializer = cache.get(cache_key)
-        if serializer is None:
-            orders = Order.objects.select_related('user').prefetch_related('products').order_by("pk").filter(user=self.owner)
-            serializer = OrderSerializer(orders, many=True)
-            cache.set(cache_key, serializer, 300)
-        return JsonResponse({"orders": serializer.data})
-
+    """
+    Заказы пользователя в JSON.
 
+    В кеше лежат готовые байты ответа под ключом с версией формата и поколением
+    заказов пользователя; поколение сдвигается при любом изменении его заказов.
+    """
+    cache_key = "shopapp:user-orders-export:v1:{user_id}:{generation}"
+    cache_timeout = 60 * 60
+
+    async def get(self, request: HttpRequest, user_id: int) -> HttpResponse:
+        if not await User.objects.filter(pk=user_id).aexists():
+            raise Http404("No user found matching the query")
+        cache_key = self.cache_key.format(
+            user_id=user_id,
+            generation=await aget_generation(user_orders_generation(user_id)),
+        )
+        cached = await cache.aget(cache_key)
+        if cached is None:
+            # aiterator() в Django 4.2 не выполняет prefetch_related, а async for по queryset выполняет
+            orders = [
+                order async for order in
+                Order.objects.prefetch_related('products').order_by("pk").filter(user_id=user_id)
+            ]
+            serializer = OrderSerializer(orders, many=True)
+            body = JSONRenderer().render({"orders": serializer.data})
+            cached = body, quote_etag(hashlib.md5(body).hexdigest())
+            await cache.aset(cache_key, cached, self.cache_timeout)
+        body, etag = cached
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = HttpResponse(body, content_type="application/json")
+        response["ETag"] = etag
+        return response